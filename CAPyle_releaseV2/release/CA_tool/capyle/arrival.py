@@ -0,0 +1,202 @@
+import heapq
+import math
+import numpy as np
+from .terrain_cell import TerrainType
+from .fire_spread import (NEIGHBOUR_OFFSETS, FIRE_DIRECTIONS, slope_kernels,
+                          moisture_effect)
+
+# Wind speed quantiles the expected spread probabilities are averaged over
+WIND_QUANTILES = 16
+
+# The directions of NEIGHBOUR_OFFSETS in order around a cell (NW N NE E SE S
+# SW W), so the directions either side of each can be found
+_RING = (0, 1, 2, 4, 7, 6, 5, 3)
+
+
+def neighbour_types(types):
+    """(8, rows, cols) terrain code of each cell's neighbour in each
+    direction of NEIGHBOUR_OFFSETS, 0 (no terrain) off the grid"""
+    rows, cols = types.shape
+    padded = np.pad(types, 1)
+    return np.stack([padded[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols]
+                     for dx, dy in NEIGHBOUR_OFFSETS])
+
+
+def wind_speed_quantiles(wind_distribution, n=WIND_QUANTILES):
+    """n wind speeds at evenly spaced quantiles of the wind's Weibull
+    distribution, standing in for its samples so expectations over the wind
+    are deterministic"""
+    u = (np.arange(n) + 0.5) / n
+    return (wind_distribution.weibull_c *
+            (-np.log(1 - u)) ** (1 / wind_distribution.weibull_k))
+
+
+def expected_spread_probabilities(grid, wind_distribution, slope=None):
+    """Expected probability, over the wind, that a burning neighbour ignites
+    each cell in a step: fire_spread.spread_probabilities as if every
+    neighbour were burning, with the wind speed averaged out
+
+    Args:
+        grid (TerrainGrid): the terrain
+        wind_distribution (Wind): the wind
+        slope (numpy.ndarray): the grid's slope_kernels, worked out if not
+            given
+
+    Returns:
+        numpy.ndarray: (8, rows, cols) probability for the neighbour in each
+        direction of NEIGHBOUR_OFFSETS, 0 for cells that cannot ignite (too
+        wet, already burning or burnt) and neighbours off the grid
+    """
+    if slope is None:
+        slope = slope_kernels(grid.elevation)
+    ignition = grid.get_ignition_prob(neighbour_types(grid.type))
+    angles = wind_distribution.direction_angles(FIRE_DIRECTIONS)
+    # the wind's contribution in each direction at each speed quantile
+    contributions = wind_distribution.angle_contributions(
+        angles[:, np.newaxis], wind_speed_quantiles(wind_distribution))
+    prob = np.zeros(ignition.shape)
+    for quantile in contributions.T:
+        prob += 1 - (1 - ignition) ** quantile[:, np.newaxis, np.newaxis]
+    prob *= moisture_effect(grid.moisture) * slope / contributions.shape[1]
+    ignitable = (grid.moisture < grid.burn_threshold) & ~grid.burning & \
+        ~grid.burnt
+    return np.clip(np.where(ignitable, prob, 0.0), 0.0, 1.0)
+
+
+def front_spread_probabilities(prob):
+    """Probability that a fire front reaching each cell from each direction
+    ignites it in a step
+
+    A cell ahead of a front borders three of its burning cells, in the
+    direction the fire comes from and the directions either side of it,
+    each of which can ignite it every step.
+
+    Args:
+        prob (numpy.ndarray): (8, rows, cols) per neighbour probabilities
+            from expected_spread_probabilities
+    """
+    # chances of not igniting multiply, so rates (-log of them) add up
+    with np.errstate(divide='ignore'):
+        rates = -np.log1p(-prob)
+    front = np.empty_like(prob)
+    for i, direction in enumerate(_RING):
+        either_side = rates[_RING[i - 1]] + rates[_RING[(i + 1) % 8]]
+        front[direction] = np.where(
+            prob[direction] > 0,
+            -np.expm1(-(rates[direction] + either_side)), 0.0)
+    return front
+
+
+def wet_steps(grid, max_moisture=1):
+    """The steps a cell water is dropped on stays too wet to ignite, as its
+    moisture decays (see TerrainGrid.strip_moisture)"""
+    decay = 0.25 * grid.moisture_decay
+    if decay <= 0:
+        return math.inf
+    return math.ceil((max_moisture - grid.burn_threshold) / decay)
+
+
+def arrival_times(grid, wind_distribution, water_dropping_plan=None,
+                  slope=None, targets=None, horizon=None):
+    """Expected time step fire reaches each cell, a fast deterministic
+    stand in for running the stochastic fire model
+
+    The times are CA time steps (generations, as Grid.run counts them), not
+    milliseconds or any other clock time: the model only gives a spread
+    probability per step, so the expected delay it gives is a number of
+    steps.
+
+    Fire crossing from a cell to its neighbour with per step spread
+    probability p (for a front, see front_spread_probabilities) is expected
+    to take 1/p steps (the mean of a geometric distribution), so the arrival
+    times are the shortest paths from the burning cells over those delays
+    (Dijkstra's algorithm). A cell the plan
+    drops water on is too wet to ignite for wet_steps after the drop, and
+    fire reaching it then waits for it to dry.
+
+    It is an estimate: the paths fire races along other than the quickest,
+    cells burning out and sources going out are not modelled. On the
+    default scenarios it is within about a third of the simulated time to
+    the town.
+
+    Args:
+        grid (TerrainGrid): the initial terrain, with the burning cells the
+            fire starts from
+        wind_distribution (Wind): the wind
+        water_dropping_plan (dict): water drops, see fire_spread.drop_mask
+        slope (numpy.ndarray): the grid's slope_kernels, worked out if not
+            given
+        targets (numpy.ndarray): boolean array of cells to stop at once the
+            fire reaches one of them (eg. the town)
+        horizon (float): stop at this time step
+
+    Returns:
+        numpy.ndarray: (rows, cols) expected time step each cell catches
+        fire, 0 where it is burning, inf where fire does not reach it (or
+        not before stopping)
+    """
+    rows, cols = grid.shape
+    prob = front_spread_probabilities(
+        expected_spread_probabilities(grid, wind_distribution, slope))
+    with np.errstate(divide='ignore'):
+        delays = [(-dy * cols - dx, d.ravel().tolist())
+                  for (dx, dy), d in zip(NEIGHBOUR_OFFSETS, 1 / prob)]
+    # when each cell is too wet to ignite, after water is dropped on it
+    wet = {}
+    _plan = water_dropping_plan if isinstance(water_dropping_plan, dict) \
+        else {}
+    steps = wet_steps(grid)
+    for t, coords in _plan.items():
+        for x, y in coords or ():
+            if 0 <= x < rows and 0 <= y < cols:
+                wet.setdefault(x * cols + y, []).append(
+                    (int(t), int(t) + steps))
+
+    times = [math.inf] * (rows * cols)
+    done = bytearray(rows * cols)
+    heap = []
+    for cell in np.flatnonzero(grid.burning).tolist():
+        times[cell] = 0.0
+        heap.append((0.0, cell))
+    heapq.heapify(heap)
+    targets = (set() if targets is None
+               else set(np.flatnonzero(targets).tolist()))
+    horizon = math.inf if horizon is None else horizon
+    while heap:
+        time, cell = heapq.heappop(heap)
+        if done[cell]:
+            continue
+        if time > horizon:
+            break
+        done[cell] = 1
+        if cell in targets:
+            break
+        row, col = divmod(cell, cols)
+        for (dx, dy), (step, delay) in zip(NEIGHBOUR_OFFSETS, delays):
+            # the cell with this one as its neighbour in this direction
+            if not (0 <= row - dy < rows and 0 <= col - dx < cols):
+                continue
+            target = cell + step
+            arrival = time + delay[target]
+            if arrival < times[target] and not done[target]:
+                for start, end in sorted(wet.get(target, ())):
+                    if start <= arrival < end:
+                        arrival = end
+                if arrival < times[target]:
+                    times[target] = arrival
+                    heapq.heappush(heap, (arrival, target))
+    times = np.array(times).reshape(rows, cols)
+    times[~np.frombuffer(done, dtype=bool).reshape(rows, cols)] = math.inf
+    return times
+
+
+def town_arrival(grid, wind_distribution, water_dropping_plan=None,
+                 slope=None):
+    """The expected time step fire first reaches a town cell, from
+    arrival_times, inf if it never does"""
+    town = grid.type == TerrainType.TOWN.value
+    if not town.any():
+        return math.inf
+    times = arrival_times(grid, wind_distribution, water_dropping_plan,
+                          slope, targets=town)
+    return float(times[town].min())
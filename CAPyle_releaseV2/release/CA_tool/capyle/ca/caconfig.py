@@ -20,6 +20,9 @@ class CAConfig(object):
         self.initial_grid = None
         # default wrapping behaviour is True
         self.wrap = True
+        # seed for the random streams of a run (see capyle.seeding), None
+        # for a fresh one each run. The seed a run used is kept in run_seed
+        self.seed = None
         self.default_paths()
 
     def fill_in_defaults(self):
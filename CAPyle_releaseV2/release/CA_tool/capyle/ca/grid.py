@@ -1,7 +1,15 @@
+import logging
+import os
+import sys
 import numpy as np
 from CA_tool.capyle.ca import Neighbourhood
-from CA_tool.capyle.utils import scale_array, verify_gens
-import tkinter as tk
+from CA_tool.capyle.utils import scale_array, verify_gens, timeline_dtype
+from CA_tool.capyle.timeline import TimelineWriter
+try:
+    import tkinter as tk
+except ImportError:
+    # CAs can still be run headless without Tk, see Grid.run
+    tk = None
 
 
 class Grid(object):
@@ -18,9 +26,17 @@ class Grid(object):
         """Enforce a step funciton in subclasses"""
         pass
 
-    def set_grid(self, g, dtype):
+    def set_grid(self, g, dtype=None):
         """Set self.grid to supplied grid, scaling the supplied grid
         if nessacary"""
+        if getattr(g, "columnar", False):
+            # column-store grid (eg. TerrainGrid), copy it field by field
+            if not self.grid.shape == g.shape:
+                g = g.resized(*self.grid.shape)
+            self.grid[:, :] = g
+            self.refresh_wrap()
+            self._set_state_grid()
+            return
         g = np.array(g, dtype=dtype)
 
         if g.shape[0] > 1:
@@ -34,6 +50,13 @@ class Grid(object):
                 g = scale_array(g, g.shape[0], self.grid.shape[1])
             self.grid[0, :] = g[0]
         self.refresh_wrap()
+        self._set_state_grid()
+
+    def _set_state_grid(self):
+        """Map the whole grid to states again, for grids that keep a
+        persistent state grid"""
+        if getattr(self, "state_grid", None) is not None:
+            self.update_state_grid()
 
     def set_neighbourhood(self, ca_config):
         """Sets self.neighbourhood with a Neighbourhood object
@@ -48,28 +71,94 @@ class Grid(object):
                                                dims=ca_config.dimensions)
 
     def get_state_grid(self):
-        to_index = getattr(self.ca_config, "state_index_function", lambda x: x)
+        if getattr(self, "state_grid", None) is not None:
+            return self.state_grid.copy()
+        if getattr(self.grid, "columnar", False):
+            return self.grid.state_indices()
+        to_index = getattr(self.ca_config, "state_index_function", None)
+        if to_index is None:
+            grid = np.asarray(self.grid)
+            if grid.dtype != object:
+                # the states are the grid's own values
+                return grid.copy()
+            return np.vectorize(lambda x: x)(grid)
         return np.vectorize(to_index)(self.grid)
 
-    def run(self):
+    def run(self, progress=None, timeline_path=None):
         """Set up running the CA for given generations,
         saving each timestep to an array 'timeline'
 
+        Args:
+            progress: how to show progress, one of 'tk' (the progress
+                window), 'console', 'logging', 'none' (or False), or a
+                function called as progress(generation, num_generations).
+                Defaults to ca_config.progress if set, otherwise to the
+                progress window when a display is available and 'none'
+                when not.
+            timeline_path (str): stream the timeline to this file as it is
+                run (see timeline.TimelineWriter) rather than holding it in
+                memory
+
         Note:
             The actual running of the CA is done by the self.runca
             which is passed to the progress bar so that it can be
             updated
 
         Returns:
-            numpy.ndarray: contains the grid state for each timestep
+            numpy.ndarray: the (frames, rows, cols) grid state for each
+            timestep up to the one the CA stopped at, stored in the
+            smallest dtype that holds the CA's states (see
+            utils.timeline_dtype). Memory-mapped from timeline_path if
+            given.
         """
         num_generations = verify_gens(self.ca_config.num_generations)
-        timeline = np.empty(num_generations + 1, dtype=np.ndarray)
-        # Progress window
-        # pass in the run function and timeline to the progress bar
-        # progress bar executes these
-        gui = _ProgressWindow(num_generations, self._runca, timeline)
-        return timeline, gui.time_step
+        timeline = self._new_timeline(num_generations + 1, timeline_path)
+        if progress is None:
+            progress = getattr(self.ca_config, "progress", None)
+        if progress is None:
+            progress = "tk" if display_available() else "none"
+
+        try:
+            if isinstance(progress, str) and progress == "tk":
+                # Progress window
+                # pass in the run function and timeline to the progress bar
+                # progress bar executes these
+                gui = _ProgressWindow(num_generations, self._runca, timeline)
+            elif progress is False or isinstance(progress, str):
+                if progress not in PROGRESS_REPORTERS:
+                    raise ValueError("Invalid progress {}".format(progress))
+                gui = _HeadlessProgress(num_generations, self._runca,
+                                        timeline, PROGRESS_REPORTERS[progress])
+            else:
+                gui = _HeadlessProgress(num_generations, self._runca,
+                                        timeline, progress)
+        finally:
+            # a streamed timeline is closed even if the run fails, keeping
+            # the frames written before it did
+            if timeline_path is not None:
+                frames = timeline.close()
+        if timeline_path is not None:
+            return frames, gui.time_step
+        return timeline[:gui.time_step], gui.time_step
+
+    def _new_timeline(self, num_frames, path=None):
+        """Preallocate the block of frames for run, holding the initial state,
+        in memory or in a TimelineWriter streaming to path
+
+        Frames are stored as the smallest dtype for the CA's states, unless
+        the states are not numbers or the grid states are not all among them,
+        when the grid states' own dtype is kept.
+        """
+        first = np.asarray(self.get_state_grid())
+        dtype = timeline_dtype(self.ca_config.states)
+        if dtype == object or not np.array_equal(first.astype(dtype), first):
+            dtype = first.dtype
+        if path is not None:
+            timeline = TimelineWriter(path, num_frames, first.shape, dtype)
+        else:
+            timeline = np.empty((num_frames,) + first.shape, dtype=dtype)
+        timeline[0] = first
+        return timeline
 
     def _runca(self, num_generations, progressbar, timeline):
         """Running the CA for given generations,
@@ -78,13 +167,15 @@ class Grid(object):
         Note:
             This function is passed to the progress bar for it to execute
         """
-        # save initial state
-        timeline[0] = self.get_state_grid()
+        # the initial state is saved by _new_timeline
         for i in range(num_generations):
             # calculate the next timestep and save it
             progressbar.time_step += 1
             stopping_condition = self.step()
-            timeline[i+1] = self.get_state_grid()
+            if getattr(self, "state_grid", None) is not None:
+                timeline[i+1] = self.state_grid
+            else:
+                timeline[i+1] = self.get_state_grid()
             # update the progress bar every 10 generations
             if (i+1) % 10 == 9:
                 progressbar.set(i+1)
@@ -94,6 +185,64 @@ class Grid(object):
                 return
 
 
+def display_available():
+    """Whether the Tk progress window can be shown: Tk is installed and,
+    other than on Windows and macOS, there is a display to show it on"""
+    if tk is None:
+        return False
+    if sys.platform.startswith(("win", "darwin")):
+        return True
+    return bool(os.environ.get("DISPLAY") or
+                os.environ.get("WAYLAND_DISPLAY"))
+
+
+def console_progress(generation, num_generations):
+    """Progress reporter that prints the generation reached"""
+    print("Generation {}/{}".format(generation, num_generations))
+
+
+def logging_progress(generation, num_generations):
+    """Progress reporter that logs the generation reached"""
+    logging.getLogger(__name__).info("Generation %d/%d", generation,
+                                     num_generations)
+
+
+# Headless progress reporters by name, see Grid.run
+PROGRESS_REPORTERS = {
+    "console": console_progress,
+    "logging": logging_progress,
+    "none": None,
+    False: None,
+}
+
+
+class _HeadlessProgress(object):
+    """Stands in for _ProgressWindow when running without a window, passing
+    progress to a reporter function instead"""
+
+    def __init__(self, maxval, run, timeline, reporter=None):
+        """Run the CA with the function 'run', which updates the variable
+        timeline and reports progress through set
+
+        Args:
+            maxval (int): The number of generation to be run by the CA
+            run (function): The run function that actuall executes the CA
+            timeline (numpy.ndarray): the array object to save the grid state
+                for each timestep
+            reporter (function): called as reporter(generation, maxval) as
+                the CA runs, or None to report nothing
+        """
+        self.maxval = maxval
+        self.reporter = reporter
+        self.time_step = 1
+        run(maxval, self, timeline)
+
+    def set(self, val):
+        """Report the given generation number"""
+        if self.reporter is not None:
+            self.reporter(val, self.maxval)
+
+
 class _ProgressWindow(object):
     WINDOW_TITLE = 'Running...'
     MAX_WIDTH = 200
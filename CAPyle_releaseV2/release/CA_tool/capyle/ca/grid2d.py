@@ -1,7 +1,12 @@
+import numbers
 import numpy as np
 from CA_tool.capyle.ca import Grid, Neighbourhood
 from CA_tool.capyle.utils import clip_numeric
 
+# State given to cells with no state (empty cells and the dead border of a
+# non-wrapping grid) in Grid2D.state_grid, it is never one of the CA's states
+DEAD_STATE = 255
+
 
 class Grid2D(Grid):
 
@@ -22,9 +27,13 @@ class Grid2D(Grid):
         wrapsize = 1
         # wrap size doubled for the row/colum on each side of the grid
         # ie. a wrap size of 1 requires 2 extra rows and 2 extra columns
-        self.wrapping_grid = np.empty((numrows + wrapsize*2,
-                                       numcols + wrapsize*2),
-                                       dtype=ca_config.dtype)
+        wrapshape = (numrows + wrapsize*2, numcols + wrapsize*2)
+        dtype = getattr(ca_config, "dtype", None)
+        if getattr(dtype, "columnar", False):
+            # column-store grids (eg. TerrainGrid) allocate their own arrays
+            self.wrapping_grid = dtype.empty(wrapshape)
+        else:
+            self.wrapping_grid = np.empty(wrapshape, dtype=dtype)
         # initial state fill
         self.wrapping_grid.fill(ca_config.states[0])
         self.grid = self.wrapping_grid[wrapsize:-wrapsize,
@@ -36,7 +45,7 @@ class Grid2D(Grid):
 
         # if at t = 0 grid has been supplied, set the states
         if ca_config.initial_grid is not None:
-            self.set_grid(ca_config.initial_grid, ca_config.dtype)
+            self.set_grid(ca_config.initial_grid, dtype)
 
         # set neighbourhood
         self.set_neighbourhood(ca_config)
@@ -50,6 +59,9 @@ class Grid2D(Grid):
         else:
             self.transition_func = transition_func
 
+        self._set_buffers(wrapsize)
+        self._init_state_grid(wrapsize)
+
         self.time_step = 1
 
     def _gen_wrap_indicies(self, wrapsize):
@@ -116,32 +128,163 @@ class Grid2D(Grid):
                 self.wrapping_grid[w[0]:w[1], w[2]:w[3]] = wrap
         else:
             sys.exit("Invalid wrap {} of type {}".format(wrap, type(wrap)))
+        # keep the border of the state grid in step
+        if getattr(self, "wrapping_state_grid", None) is not None:
+            for w in self.wrapindicies:
+                self.wrapping_state_grid[w[0]:w[1], w[2]:w[3]] = \
+                    self._index_states(self.wrapping_grid[w[0]:w[1], w[2]:w[3]])
+
+    def _gen_neighbour_states(self, wrapping_grid):
+        """Create the views of the neighbour states of a wrapping grid, once
+        per grid
+
+        The views look into wrapping_grid, which is updated in place, so they
+        always show the current states. Directions outside the neighbourhood
+        share a single grid of empty (None) cells.
+
+        Returns:
+            (tuple, tuple): the neighbour states with and without the
+            neighbourhood applied
+        """
+        views = self._neighbour_views(wrapping_grid)
+
+        if self._masked_states is None:
+            if getattr(wrapping_grid, "columnar", False):
+                self._masked_states = type(wrapping_grid).empty(self.grid.shape)
+            else:
+                self._masked_states = np.full(self.grid.shape, None,
+                                              dtype=object)
+        neighbour_states = tuple(
+            view if inside else self._masked_states
+            for view, inside in zip(views, self.neighbour_mask))
+        return neighbour_states, views
+
+    def _set_buffers(self, wrapsize):
+        """Set up the grid buffers
+
+        Transition functions marked with writes_output = True are passed a
+        second, preallocated grid to write the next state into (out=...)
+        and the two are swapped after each step, so stepping allocates no
+        new grids. Other transition functions return a new grid that is
+        copied into the current one.
+        """
+        # neighbourhood array without its centre, in neighbour order
+        nhood_arr = np.asarray(self.neighbourhood.neighbourhood).flatten()
+        self.neighbour_mask = np.delete(nhood_arr != 0, 4)
+        self._masked_states = None
+
+        def buffer(wrapping_grid):
+            grid = wrapping_grid[wrapsize:-wrapsize, wrapsize:-wrapsize]
+            return ((wrapping_grid, grid) +
+                    self._gen_neighbour_states(wrapping_grid))
+
+        self._front = buffer(self.wrapping_grid)
+        self._back = None
+        self.double_buffered = self._declared("writes_output")
+        if self.double_buffered:
+            self._back = buffer(self.wrapping_grid.copy())
+        self._use_front()
+
+    def _use_front(self):
+        (self.wrapping_grid, self.grid, self._neighbour_states,
+         self._all_neighbour_states) = self._front
+
+    def _declared(self, name):
+        """Whether the transition function (or the function a
+        functools.partial wraps) is marked with name = True"""
+        func = self.transition_func
+        while func is not None:
+            if getattr(func, name, False):
+                return True
+            func = getattr(func, "func", None)
+        return False
+
+    @staticmethod
+    def _neighbour_views(grid):
+        """The NW N NE, W E, SW S SE neighbour views of a wrapping grid"""
+        return (grid[0:-2, 0:-2], grid[0:-2, 1:-1], grid[0:-2, 2:],
+                grid[1:-1, 0:-2],                   grid[1:-1, 2:],
+                grid[2:, 0:-2],   grid[2:, 1:-1],   grid[2:, 2:])
+
+    def _init_state_grid(self, wrapsize):
+        """Create the persistent integer state grid
+
+        CAs whose cells are not already their states (column-store grids, or
+        a config with a state_index_function) keep the state of every cell in
+        the uint8 array state_grid, a view of wrapping_state_grid. Neighbour
+        counting and get_state_grid read it rather than mapping every cell
+        again. Left as None when the CA's states do not fit in a uint8.
+        """
+        self.wrapping_state_grid = self.state_grid = None
+        mapped = (getattr(self.grid, "columnar", False) or
+                  getattr(self.ca_config, "state_index_function", None)
+                  is not None)
+        fits = all(isinstance(s, numbers.Integral) and 0 <= s < DEAD_STATE
+                   for s in self.ca_config.states)
+        if not (mapped and fits):
+            return
+        self.wrapping_state_grid = self._index_states(self.wrapping_grid)
+        self.state_grid = self.wrapping_state_grid[wrapsize:-wrapsize,
+                                                   wrapsize:-wrapsize]
+        self._neighbour_state_views = self._neighbour_views(
+            self.wrapping_state_grid)
+
+    def _index_states(self, cells):
+        """Map an array of cells to uint8 states, DEAD_STATE where a cell has
+        no state"""
+        if getattr(cells, "columnar", False):
+            index = cells.state_indices()
+        else:
+            index = np.vectorize(self.ca_config.state_index_function,
+                                 otypes=[int])(cells)
+        return np.where(index < 0, DEAD_STATE, index).astype(np.uint8)
+
+    def update_state_grid(self, changed=None):
+        """Bring state_grid up to date with grid
+
+        Args:
+            changed (numpy.ndarray): boolean array of the cells that may have
+                changed state, all cells are mapped again if not given (as
+                for object grids, see step)
+        """
+        if self.state_grid is None:
+            return
+        if changed is None:
+            self.state_grid[:, :] = self._index_states(self.grid)
+        elif changed.any():
+            self.state_grid[changed] = self._index_states(self.grid[changed])
 
     def get_neighbour_states(self, applyneighbourhood=True):
-        """Return the 8 arrays of each neighbours current state"""
-        grid = self.wrapping_grid
+        """Return the 8 arrays of each neighbours current state
+
+        The arrays are views into the grid that are made once and reused
+        every step, in the order NW N NE, W E, SW S SE. Directions outside
+        the neighbourhood (see neighbour_mask) are grids of empty cells.
+        """
         if applyneighbourhood:
-            nhood_arr = self.neighbourhood.neighbourhood
-        else:
-            nhood_arr = np.ones((3, 3))
+            return self._neighbour_states
+        return self._all_neighbour_states
 
-        def mask(slice_, mask_value):
-            # If mask_value == 0, fill with None; otherwise keep slice
-            if mask_value == 0:
-                return np.full(slice_.shape, None, dtype=object)
-            else:
-                return slice_
-        # Return the NW N NE, W self E, SW S SE neighbourgrids
-        nw = mask(grid[0:-2, 0:-2], nhood_arr[0, 0])
-        n  = mask(grid[0:-2, 1:-1], nhood_arr[0, 1])
-        ne = mask(grid[0:-2, 2:],   nhood_arr[0, 2])
-        w  = mask(grid[1:-1, 0:-2], nhood_arr[1, 0])
-        e  = mask(grid[1:-1, 2:],   nhood_arr[1, 2])
-        sw = mask(grid[2:, 0:-2],   nhood_arr[2, 0])
-        s  = mask(grid[2:, 1:-1],   nhood_arr[2, 1])
-        se = mask(grid[2:, 2:],     nhood_arr[2, 2])
-        
-        return np.array([nw, n, ne, w, e, sw, s, se], dtype=object)
+    def numeric_neighbour_states(self, neighbour_states):
+        """Map the 8 neighbour arrays to the integer state of each cell"""
+        if getattr(self.grid, "columnar", False):
+            return [n.state_indices() for n in neighbour_states]
+        to_index = getattr(self.ca_config, "state_index_function", None)
+        if to_index is None:
+            # the cells are their own states
+            return list(neighbour_states)
+        return np.array([np.vectorize(to_index)(n) for n in neighbour_states],
+                        dtype=object)
+
+    def _count_neighbour_states(self, neighbour_states):
+        """count_neighbours over the directions inside the neighbourhood,
+        reading states from state_grid where it is kept"""
+        if self.state_grid is not None:
+            numeric = self._neighbour_state_views
+        else:
+            numeric = self.numeric_neighbour_states(neighbour_states)
+        return self.count_neighbours(
+            [n for n, inside in zip(numeric, self.neighbour_mask) if inside])
 
     def count_neighbours(self, neighbour_states):
         """
@@ -168,30 +311,145 @@ class Grid2D(Grid):
         # collect the 8 arrays of neighbour states
         ns = self.get_neighbour_states()
 
-        to_index = getattr(self.ca_config, "state_index_function", lambda x: x)
-        ns_numeric = np.array([np.vectorize(to_index)(n) for n in ns], dtype=object)
-        
         # calculate the number of neighbours each cell has of each state
-        # return n arrays where n is the number of states
-        nc = self.count_neighbours(ns_numeric)
+        # return n arrays where n is the number of states. This is only done
+        # once the transition function reads the counts, or up front if it
+        # is marked with needs_neighbour_counts = True
+        nc = NeighbourCounts(lambda: self._count_neighbour_states(ns))
+        if self._declared("needs_neighbour_counts"):
+            nc = nc.counts
 
         # apply the user's transition function
         # passing in the states and counts to allow complex rules
         # if the user supplied any addition arguments, pass them here
-        if self.additional_args is None:
-            new_grid, stopping_condition = self.transition_func(self.grid, ns, nc, self.time_step)
+        args = (self.grid, ns, nc, self.time_step)
+        if self.additional_args is not None:
+            args += tuple(self.additional_args)
+        if self.double_buffered:
+            out = self._back[1]
+            new_grid, stopping_condition = self.transition_func(*args, out=out)
+            if new_grid is not out:
+                out[:, :] = new_grid
+        else:
+            new_grid, stopping_condition = self.transition_func(*args)
+
+        # only cells that changed need their state mapping again, column-store
+        # grids can tell which those are. Object grids are mapped in full
+        # (np.vectorize over every cell) each step, as a rule may change
+        # their cells in place where no comparison of the grids would see it
+        changed = None
+        if getattr(self.grid, "columnar", False) and new_grid is not self.grid:
+            changed = self.grid.state_changes(new_grid)
+
+        if self.double_buffered:
+            # the output becomes the current grid
+            self._front, self._back = self._back, self._front
+            self._use_front()
         else:
-            new_grid, stopping_condition = self.transition_func(self.grid, ns, nc, self.time_step,
-                                             *self.additional_args)
-            
-        self.grid[:, :] = new_grid
+            self.grid[:, :] = new_grid
         # refresh wrapping border
         self.refresh_wrap()
-        
+        self.update_state_grid(changed)
+
         if stopping_condition:
             return True
         self.time_step += 1
 
+    def advance(self, num_steps):
+        """Step the CA up to num_steps times without keeping a timeline (see
+        run), stopping once the stopping condition is met
+
+        Returns:
+            bool: whether the stopping condition was met, in which case
+            time_step is the step that met it
+        """
+        for _ in range(num_steps):
+            if self.step():
+                return True
+        return False
+
+    def snapshot(self):
+        """A copy of the state of the CA now, to go back to with restore
+
+        Note:
+            Only the grid is saved. State the transition function keeps
+            (eg. the random streams it draws from) has to be saved with it
+            to repeat the rest of a run exactly.
+        """
+        return GridSnapshot(
+            self.wrapping_grid.copy(),
+            (None if self.wrapping_state_grid is None
+             else self.wrapping_state_grid.copy()),
+            self.time_step)
+
+    def restore(self, snapshot):
+        """Put the CA back in the state it was in when snapshot was taken
+
+        The transition function is left as it is, so a run can be forked:
+        taken back to a snapshot and carried on with another transition
+        function (eg. another water dropping plan).
+        """
+        self.wrapping_grid[:, :] = snapshot.wrapping_grid
+        if self.wrapping_state_grid is not None:
+            self.wrapping_state_grid[:, :] = snapshot.wrapping_state_grid
+        self.time_step = snapshot.time_step
+
+
+class GridSnapshot(object):
+    """The state of a Grid2D at one time step, see Grid2D.snapshot"""
+
+    def __init__(self, wrapping_grid, wrapping_state_grid, time_step):
+        self.wrapping_grid = wrapping_grid
+        self.wrapping_state_grid = wrapping_state_grid
+        self.time_step = time_step
+
+
+class NeighbourCounts(object):
+    """The neighbour counts passed to a transition function, computed on
+    first use
+
+    Behaves like the array returned by Grid2D.count_neighbours (indexing,
+    iteration, unpacking, numpy conversion), so transition functions that
+    never read their counts do not pay for them.
+
+    Note:
+        The counts are worked out from the grid as it is when they are first
+        read, so read them before changing the grid in place and do not keep
+        them past the step.
+    """
+
+    def __init__(self, count):
+        """
+        Args:
+            count (function): called with no arguments to compute the counts
+        """
+        self._count = count
+        self._counts = None
+
+    @property
+    def computed(self):
+        """bool: whether the counts have been computed yet"""
+        return self._counts is not None
+
+    @property
+    def counts(self):
+        """numpy.ndarray: the counts, computing them if needed"""
+        if self._counts is None:
+            self._counts = self._count()
+        return self._counts
+
+    def __getitem__(self, key):
+        return self.counts[key]
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.counts, dtype=dtype)
+
 
 def randomise2d(grid, background_state, proportions):
     """ Takes a grid, the background state, and
@@ -4,7 +4,8 @@ import tkinter.font as tkFont
 import numpy as np
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from CA_tool.capyle.guicomponents.gui_utils import (set_icon, get_filename_dialog)
-from CA_tool.capyle.utils import (get_logo, prerun_ca, run_ca, extract_states)
+from CA_tool.capyle.utils import (get_logo, prerun_ca, run_ca, extract_states,
+                                  load_timeline)
 
 from CA_tool.capyle.ca import CAConfig
 from CA_tool.capyle.guicomponents import (_ConfigFrame, _CAGraph, _ScreenshotUI,
@@ -192,8 +193,10 @@ class Display(object):
         self.ca_config, valid = self.config_ui.get_config(self.ca_config,
                                                           validate=True)
         if valid:
-            # runs ca with config, returns config and timeline
-            self.ca_config, timeline = run_ca(self.ca_config)
+            # runs ca with config, returns config and timeline, showing the
+            # frames of a streamed timeline as the run writes them
+            self.ca_config, timeline = run_ca(self.ca_config,
+                                              on_frames=self.follow_run)
             if self.ca_config is None or timeline is None:
                 return
             # if no states saved, takes best guess
@@ -205,14 +208,30 @@ class Display(object):
             # Adds the state colours UI and sets the colour map accordingly
             self.config_ui.update(self.ca_config, self.ca_graph)
 
+    def follow_run(self, timeline):
+        """Show the frames a run has written to its streamed timeline so
+        far, keeping the GUI responsive while the run goes on
+
+        Args:
+            timeline (MappedTimeline): the timeline being written
+        """
+        if getattr(self.ca_graph, "timeline", None) is not timeline:
+            self.load_timeline(timeline)
+        else:
+            self.update_controls(len(timeline) - 1)
+        self.root.update()
+
     def load_timeline(self, timeline):
         """Load a timeline into the GUI and display on the graph
 
         Also enables playback and screenshot UI controls.
 
         Args:
-            timeline (np.ndarray): The grid state for each timestep
+            timeline (np.ndarray): The grid state for each timestep, or the
+                path of a timeline saved with utils.save_timeline
         """
+        if isinstance(timeline, str):
+            timeline = load_timeline(timeline)
         # Create graph from timeline
         self.ca_graph = _CAGraph(timeline, self.ca_config.states,
                                  sequence=True)
@@ -0,0 +1,179 @@
+import numpy as np
+from .terrain_cell import TerrainType
+from .terrain_grid import TerrainGrid, FIELD_NAMES, nonzero
+from .fire_spread import (FIRE_DIRECTIONS, slope_kernels, fire_front,
+                          drop_mask, _probabilities)
+from .seeding import seed_sequence, new_seed, child_seed, run_streams
+
+_TOWN = TerrainType.TOWN.value
+_SOURCE = TerrainType.SOURCE.value
+
+
+class FireEnsemble(object):
+    """Many stochastic replicas of a fire on the same terrain, advanced
+    together
+
+    The replicas are held in one TerrainGrid with a leading replica axis,
+    (replicas, rows, cols), and each step is the frontier_transition_func
+    rule applied to all of them at once: the fire fronts of every replica
+    are found together and every (cell, neighbour) pair gets its own draw
+    and wind sample. Stepping 64 replicas costs a few times one step rather
+    than 64, although each step still makes whole-array passes over every
+    replica.
+
+    Each replica draws from its own streams (see seeding.run_streams),
+    seeded by replica_seed, in the order a single run draws them. So the
+    replicas are independent, and any one of them can be rerun on its own
+    with Grid2D, given its seed, to get exactly the same fire.
+
+    Like a real_valued_fire run, each replica stops when the fire reaches a
+    town; its results are recorded at that step (it goes on burning in the
+    array, but that no longer counts).
+    """
+
+    def __init__(self, initial, replicas, wind_distribution,
+                 water_dropping_plan=None, slope=None, seed=None):
+        """Start every replica from the same initial grid
+
+        Args:
+            initial (TerrainGrid): the (rows, cols) initial terrain
+            replicas (int): the number of replicas to run
+            wind_distribution (Wind): the wind, shared by the replicas; a
+                wind schedule (see Wind.set_schedule) is shared too
+            water_dropping_plan (dict): water drops, the same for every
+                replica, see fire_spread.drop_mask
+            slope (numpy.ndarray): the terrain's slope_kernels, worked out
+                from initial if not given
+            seed: the seed of the ensemble (an int or a SeedSequence),
+                fresh entropy if not given; kept as self.seed
+        """
+        self.replicas = replicas
+        self.grid = TerrainGrid(
+            None, initial.moisture_decay, initial.burn_threshold,
+            fields={name: np.repeat(getattr(initial, name)[np.newaxis],
+                                    replicas, axis=0)
+                    for name in FIELD_NAMES})
+        self.wind = wind_distribution
+        self.water_dropping_plan = water_dropping_plan
+        self.slope = (slope_kernels(initial.elevation) if slope is None
+                      else slope)
+        self.seed = seed_sequence(new_seed() if seed is None else seed)
+        self.streams = [run_streams(self.replica_seed(replica))
+                        for replica in range(replicas)]
+        # Grid2D's time step numbering, so results match config values
+        self.time_step = 1
+        # time step each replica first lit a town, -1 if it has not. Like
+        # config.town_ignition_step this is the step the transition function
+        # was given, one less than the time step Grid.run reports
+        self.town_ignition_step = np.full(replicas, -1)
+        # cells burning or burnt, recorded when each replica stops
+        self.burnt_area = np.zeros(replicas, dtype=int)
+
+    def replica_seed(self, replica):
+        """The seed of the given replica's streams"""
+        return child_seed(self.seed, replica)
+
+    def _draw(self, stream, owners, draw):
+        """Draw a value for each item owned by a replica, from that replica's
+        own stream, in the order the items are given
+
+        Args:
+            stream (str): the name of the stream to draw from
+            owners (numpy.ndarray): the replica each item belongs to
+            draw (function): called as draw(n, rng) for n values from rng
+        """
+        counts = np.bincount(owners, minlength=self.replicas)
+        values = np.empty(owners.size)
+        values[np.argsort(owners, kind='stable')] = np.concatenate(
+            [draw(n, streams[stream])
+             for streams, n in zip(self.streams, counts)])
+        return values
+
+    @property
+    def stopped(self):
+        """numpy.ndarray: whether each replica has met its stopping
+        condition"""
+        return self.town_ignition_step >= 0
+
+    def reached(self):
+        """The number of cells burning or burnt in each replica now"""
+        return (self.grid.burning | self.grid.burnt).sum(axis=(1, 2))
+
+    def step(self):
+        """Advance every replica by one time step
+
+        Returns:
+            numpy.ndarray: whether each replica lit a town this step
+        """
+        grid = self.grid
+        cells, sources, directions = fire_front(grid)
+        spatial = cells[1:]
+
+        wind_speeds = self.wind.scheduled_speeds(self.time_step)
+        if wind_speeds is None:
+            wind_speeds = self._draw("wind", cells[0],
+                                     self.wind.sample_wind_speeds)
+        elif np.ndim(wind_speeds):
+            wind_speeds = wind_speeds[spatial]
+        angles = self.wind.direction_angles(FIRE_DIRECTIONS)[directions]
+        probs = _probabilities(grid[cells], grid.type[sources],
+                               self.slope[(directions,) + spatial], angles,
+                               self.wind, wind_speeds)
+        hit = self._draw("spread", cells[0], _uniform) < probs
+        # each ignited cell once, however many neighbours lit it
+        ignited = np.unravel_index(
+            np.unique(np.ravel_multi_index(
+                tuple(index[hit] for index in cells), grid.shape)),
+            grid.shape)
+
+        # the rest of fire_spread._advance, in place: only the cells burning
+        # at the start of the step burn
+        burning = grid.burning.copy()
+        drops = drop_mask(self.water_dropping_plan, self.time_step,
+                          grid.shape[1:])
+        grid.waterdropped[:] = False
+        if drops.any():
+            grid.drop_water(np.broadcast_to(drops, grid.shape))
+        # few cells ignite, so ignite just those rather than the whole array
+        lit = grid[ignited]
+        lit.ignite(np.ones(lit.shape, dtype=bool))
+        grid[ignited] = lit
+        town_ignited = np.bincount(ignited[0][lit.type == _TOWN],
+                                   minlength=self.replicas) > 0
+        # sources go out at random, the rest burn down their fuel
+        sources = nonzero(burning & (grid.type == _SOURCE))
+        out = self._draw("spread", sources[0], _uniform) <= 0.2
+        grid.burning[tuple(index[out] for index in sources)] = False
+        grid.burn(burning & (grid.type != _SOURCE))
+        grid.strip_moisture()
+
+        stopping = town_ignited & ~self.stopped
+        self.town_ignition_step[stopping] = self.time_step
+        self.burnt_area[stopping] = self.reached()[stopping]
+        self.time_step += 1
+        return town_ignited
+
+    def run(self, num_steps):
+        """Step the replicas until they have all stopped or burnt out, or
+        for num_steps steps
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): the time step each replica
+            stopped at on lighting a town, numbered as Grid.run reports it
+            (town_ignition_step + 1, so it matches get_results for the same
+            run), -1 if it never did; and the cells each replica had burning
+            or burnt when it stopped (or at the end)
+        """
+        for _ in range(num_steps):
+            self.step()
+            burnt_out = ~self.grid.burning.any(axis=(1, 2))
+            if np.all(self.stopped | burnt_out):
+                break
+        running = ~self.stopped
+        self.burnt_area[running] = self.reached()[running]
+        steps = np.where(self.stopped, self.town_ignition_step + 1, -1)
+        return steps, self.burnt_area.copy()
+
+
+def _uniform(n, rng):
+    return rng.random(n)
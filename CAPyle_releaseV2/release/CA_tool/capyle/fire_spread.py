@@ -0,0 +1,295 @@
+import math
+import numpy as np
+from .terrain_cell import TerrainType
+from .terrain_grid import slope_effect, nonzero
+from .utils import copy_into
+from .seeding import fresh_stream
+
+# (dx, dy) offset of each neighbour, in the NW N NE W E SW S SE order that
+# Grid2D.get_neighbour_states returns the neighbour grids in
+NEIGHBOUR_OFFSETS = [
+    (-1, -1), (0, -1), (1, -1),
+    (-1, 0),           (1, 0),
+    (-1, 1),  (0, 1),  (1, 1)
+]
+
+# Direction (degrees, 0 = north) fire travels in when it spreads from each
+# neighbour, computed once rather than with atan2 per neighbour per cell
+FIRE_DIRECTIONS = np.array([
+    (math.degrees(math.atan2(dy, dx)) - 270 + 360) % 360
+    for dx, dy in NEIGHBOUR_OFFSETS
+])
+
+
+def moisture_effect(moisture):
+    """Scale factor on ignition for a cell's moisture, clipped to 0-1
+
+    Works on a single moisture value or an array of them.
+    """
+    effect = 1 - 2.59*moisture + 5.11*moisture**2 - 3.52*moisture**3
+    return np.clip(effect, 0.0, 1.0)
+
+
+def slope_kernels(elevation):
+    """Slope effect on ignition of every cell from each of its neighbours
+
+    Elevation never changes during a run, so this can be worked out once
+    per terrain and passed to the fire transition functions (and shared by
+    every run on the same terrain), keeping exp out of the spread step.
+
+    Args:
+        elevation (numpy.ndarray): the (rows, cols) terrain elevation
+
+    Returns:
+        numpy.ndarray: (8, rows, cols) float32 slope effect on each cell
+        from its neighbour in each direction of NEIGHBOUR_OFFSETS, 0 for
+        neighbours off the (non-wrapping) grid
+    """
+    rows, cols = elevation.shape
+    padded = np.pad(np.asarray(elevation, dtype=float), 1,
+                    constant_values=np.nan)
+    kernels = np.empty((len(NEIGHBOUR_OFFSETS), rows, cols), dtype=np.float32)
+    with np.errstate(invalid='ignore'):
+        for idx, (dx, dy) in enumerate(NEIGHBOUR_OFFSETS):
+            source = padded[1 + dy:1 + dy + rows, 1 + dx:1 + dx + cols]
+            kernels[idx] = slope_effect(elevation, source)
+    return np.nan_to_num(kernels, copy=False)
+
+
+def spread_probability(cell, neighbour, fire_direction, wind_distribution):
+    """Probability that a burning neighbour ignites cell this step
+
+    Args:
+        cell (TerrainCell): the unburnt cell
+        neighbour (TerrainCell): the burning neighbour
+        fire_direction (float): direction the fire travels in, see
+            FIRE_DIRECTIONS
+        wind_distribution (Wind): the wind, sampled once per call
+    """
+    ignition_prob = cell.get_ignition_prob(neighbour.type)
+    wind_prob = wind_distribution.fire_spread_contribution(fire_direction)
+    slope_effect = cell.get_slope_effect(neighbour.elevation)
+
+    prob = ((1 - (1 - ignition_prob) ** wind_prob) *
+            moisture_effect(cell.moisture) * slope_effect)
+    return max(0.0, min(prob, 1.0))
+
+
+def spread_probabilities(grid, neighbour_states, wind_distribution,
+                         wind_speeds=None, slope=None):
+    """Array version of spread_probability for every cell and neighbour
+
+    Args:
+        grid (TerrainGrid): the current grid
+        neighbour_states (list): the 8 TerrainGrid neighbour views from
+            Grid2D.get_neighbour_states
+        wind_distribution (Wind): the wind
+        wind_speeds (numpy.ndarray): wind speeds to use, broadcastable
+            against (8, rows, cols), sampled from wind_distribution for each
+            neighbour of each cell if not given
+        slope (numpy.ndarray): the grid's slope_kernels, worked out from the
+            neighbour elevations if not given
+
+    Returns:
+        numpy.ndarray: (8, rows, cols) probability that each neighbour ignites
+        each cell, 0 where the neighbour is not burning or the cell is
+        already burning or burnt
+    """
+    sources = np.stack([ns.type for ns in neighbour_states])
+    if slope is None:
+        slope = grid.get_slope_effect(
+            np.stack([ns.elevation for ns in neighbour_states]))
+    active = np.stack([ns.burning for ns in neighbour_states])
+    active &= ~grid.burning & ~grid.burnt
+
+    if wind_speeds is None:
+        wind_speeds = wind_distribution.sample_wind_speeds(active.shape)
+    angles = wind_distribution.direction_angles(FIRE_DIRECTIONS)
+    prob = _probabilities(grid, sources, slope, angles.reshape(-1, 1, 1),
+                          wind_distribution, wind_speeds)
+    return np.where(active, prob, 0.0)
+
+
+def _probabilities(cells, source_types, slope, angles, wind_distribution,
+                   wind_speeds):
+    """spread_probability for TerrainGrid cells and broadcastable arrays of
+    their burning neighbours' types, slope effects and fire angles to the
+    wind (see Wind.direction_angles)"""
+    wind_prob = wind_distribution.angle_contributions(angles, wind_speeds)
+    prob = ((1 - (1 - cells.get_ignition_prob(source_types)) ** wind_prob) *
+            moisture_effect(cells.moisture) * slope)
+    return np.clip(prob, 0.0, 1.0)
+
+
+def fire_front(grid):
+    """Every (cell, burning neighbour) pair fire can spread across
+
+    Only cells that are neither burning nor burnt and that border a burning
+    cell can ignite, so these are the only pairs a step has to draw for.
+    They come from the burning cells on the edge of the fire, so their
+    number scales with the fire perimeter rather than its area, but finding
+    that edge still takes a few passes over the whole grid. Neighbours
+    outside the grid are dead (the grid does not wrap).
+
+    Args:
+        grid (TerrainGrid): the current grid, the last two axes are the rows
+            and columns, any before them (eg. the replicas of a FireEnsemble)
+            are carried through
+
+    Returns:
+        (tuple, tuple, numpy.ndarray): the indices of the cells and of their
+        burning neighbours, one array per axis of the grid, and the index
+        into NEIGHBOUR_OFFSETS of the direction of each neighbour
+    """
+    rows, cols = grid.shape[-2:]
+    fire = nonzero(grid.burning & _borders(~grid.burning & ~grid.burnt))
+    fire_rows, fire_cols = fire[-2:]
+    offsets = np.array(NEIGHBOUR_OFFSETS)
+    # the cell that has the burning cell as its neighbour in each direction
+    cell_rows = fire_rows - offsets[:, 1:]
+    cell_cols = fire_cols - offsets[:, :1]
+    directions = np.broadcast_to(np.arange(len(offsets))[:, np.newaxis],
+                                 cell_rows.shape)
+
+    inside = ((cell_rows >= 0) & (cell_rows < rows) &
+              (cell_cols >= 0) & (cell_cols < cols))
+    directions = directions[inside]
+    sources = tuple(np.broadcast_to(index, inside.shape)[inside]
+                    for index in fire)
+    cells = sources[:-2] + (cell_rows[inside], cell_cols[inside])
+
+    unburnt = ~grid.burning[cells] & ~grid.burnt[cells]
+    cells = tuple(index[unburnt] for index in cells)
+    sources = tuple(index[unburnt] for index in sources)
+    return cells, sources, directions[unburnt]
+
+
+def _borders(mask):
+    """Boolean array of the cells with a neighbour set in mask, over the last
+    two axes"""
+    rows, cols = mask.shape[-2:]
+    bordering = np.zeros_like(mask)
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        src_rows = slice(max(dy, 0), rows + min(dy, 0))
+        src_cols = slice(max(dx, 0), cols + min(dx, 0))
+        dst_rows = slice(max(-dy, 0), rows + min(-dy, 0))
+        dst_cols = slice(max(-dx, 0), cols + min(-dx, 0))
+        bordering[..., dst_rows, dst_cols] |= mask[..., src_rows, src_cols]
+    return bordering
+
+
+def drop_mask(water_dropping_plan, time_step, shape):
+    """Boolean array of the cells the plan drops water on at time_step"""
+    mask = np.zeros(shape, dtype=bool)
+    _plan = water_dropping_plan if isinstance(water_dropping_plan, dict) else {}
+    coords = np.array(_plan.get(str(time_step), []), dtype=int).reshape(-1, 2)
+    inside = ((coords >= 0) & (coords < shape)).all(axis=1)
+    mask[coords[inside, 0], coords[inside, 1]] = True
+    return mask
+
+
+def fire_transition_func(
+    grid,
+    neighbour_states,
+    neighbour_counts,
+    time_step,
+    wind_distribution,
+    water_dropping_plan=None,
+    config=None,
+    slope=None,
+    out=None,
+    rng=None
+):
+    """Array version of the real_valued_fire transition function
+
+    Applies the same rule to a TerrainGrid with whole-array operations:
+    water drops, ignition from burning neighbours, burning and moisture loss.
+    slope takes the grid's slope_kernels, to save working them out each step,
+    and the next state is written into out when it is given. The spread and
+    source draws come from rng, anything with a random(size) method, eg.
+    the "spread" stream of seeding.run_streams (default a fresh one).
+    """
+    rng = fresh_stream("spread") if rng is None else rng
+    probs = spread_probabilities(grid, neighbour_states, wind_distribution,
+                                 wind_distribution.scheduled_speeds(time_step),
+                                 slope)
+    ignited = (rng.random(probs.shape) < probs).any(axis=0)
+    return _advance(grid, ignited, time_step, water_dropping_plan, config, out,
+                    rng)
+
+
+def frontier_transition_func(
+    grid,
+    neighbour_states,
+    neighbour_counts,
+    time_step,
+    wind_distribution,
+    water_dropping_plan=None,
+    config=None,
+    slope=None,
+    out=None,
+    rng=None
+):
+    """fire_transition_func evaluating ignition on the fire front only
+
+    Spread probabilities, wind samples and draws are only worked out for the
+    pairs from fire_front, rather than for all 8 neighbours of every cell.
+    Finding the front and the rest of the step (copying the grid, igniting,
+    burning, drying and the caller's change detection) are still whole-grid
+    array passes, so a step's cost grows with the grid's area, though
+    far less steeply than fire_transition_func's. Each pair gets its
+    own draw and (unless the wind has a schedule) wind sample, as in
+    fire_transition_func, so the two give the same spread.
+    neighbour_states is not used; the grid must not wrap.
+    """
+    rng = fresh_stream("spread") if rng is None else rng
+    cells, sources, directions = fire_front(grid)
+    source_cells = grid[sources]
+
+    wind_speeds = wind_distribution.scheduled_speeds(time_step)
+    if wind_speeds is None:
+        wind_speeds = wind_distribution.sample_wind_speeds(directions.size)
+    elif np.ndim(wind_speeds):
+        wind_speeds = wind_speeds[cells]
+    angles = wind_distribution.direction_angles(FIRE_DIRECTIONS)[directions]
+    if slope is None:
+        slope = grid[cells].get_slope_effect(source_cells.elevation)
+    else:
+        slope = slope[(directions,) + cells]
+
+    probs = _probabilities(grid[cells], source_cells.type, slope, angles,
+                           wind_distribution, wind_speeds)
+    hit = rng.random(probs.shape) < probs
+
+    ignited = np.zeros(grid.shape, dtype=bool)
+    ignited[cells[0][hit], cells[1][hit]] = True
+    return _advance(grid, ignited, time_step, water_dropping_plan, config, out,
+                    rng)
+
+
+# Grid2D hands both rules a preallocated grid to write into
+fire_transition_func.writes_output = True
+frontier_transition_func.writes_output = True
+
+
+def _advance(grid, ignited, time_step, water_dropping_plan, config, out=None,
+             rng=None):
+    """The rest of a fire step once the ignited cells are known: water drops,
+    ignition, burning and moisture loss, returning (new_grid, town_ignited)"""
+    new_grid = copy_into(grid, out)
+
+    drops = drop_mask(water_dropping_plan, time_step, grid.shape)
+    new_grid.waterdropped[:] = False
+    if drops.any():
+        new_grid.drop_water(drops)
+
+    new_grid.ignite(ignited)
+
+    town_ignited = bool((ignited & (grid.type == TerrainType.TOWN.value)).any())
+    if town_ignited and config is not None and getattr(config, "town_ignition_step", None) is None:
+        config.town_ignition_step = time_step
+
+    new_grid.burn(grid.burning, rng)
+    new_grid.strip_moisture()
+
+    return new_grid, town_ignited
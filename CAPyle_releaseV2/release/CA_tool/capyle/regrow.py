@@ -1,7 +1,9 @@
 from . import terrain_cell as tc
+from .terrain_grid import slope_effect
+from .utils import copy_into
+from .seeding import fresh_stream
 from enum import Enum
 import numbers
-import random
 import math
 import numpy as np
 
@@ -16,28 +18,56 @@ REGROWTH_RATE = {
     tc.TerrainType.TOWN: 0.0
 }
 
+RESPROUT_CHANCE_MULTIPLIER = 0.5
+
+# (dx, dy) offset of each neighbour, in the NW N NE W E SW S SE order that
+# Grid2D.get_neighbour_states returns the neighbour grids in
+NEIGHBOUR_OFFSETS = [
+    (-1, -1), ( 0, -1), ( 1, -1),
+    (-1,  0),           ( 1,  0),
+    (-1,  1), ( 0,  1), ( 1,  1)
+]
+
+# prevailing wind is south (time scale is large enough to assert south wind
+# dominance), seeds from neighbours between 90 and 180 degrees spread further
+SEED_WIND_EFFECT = np.array([
+    1.3 if 90 < (math.degrees(math.atan2(-dy, dx)) + 360) % 360 <= 180 else 1
+    for dx, dy in NEIGHBOUR_OFFSETS
+])
+
+# REGROWTH_RATE indexed by terrain code, read by the cell and array rules
+REGROWTH_RATE_BY_CODE = tc.compile_table(REGROWTH_RATE)
+
+# the codes of the natural vegetation that burns, regrows and spreads seed
+_VEGETATION = np.zeros(len(tc.TerrainType) + 1, dtype=bool)
+_VEGETATION[[tc.TerrainType.CHAPARRAL.value,
+             tc.TerrainType.DENSE_FOREST.value,
+             tc.TerrainType.CANYON_SCRUBLAND.value]] = True
+
+# slices of the interior of a grid and of each of its neighbour grids, in
+# NEIGHBOUR_OFFSETS order (dx is the column offset, dy the row offset)
+_INNER = (slice(1, -1), slice(1, -1))
+_NEIGHBOUR_SLICES = [
+    (slice(1 + dy, (-1 + dy) or None), slice(1 + dx, (-1 + dx) or None))
+    for dx, dy in NEIGHBOUR_OFFSETS
+]
+
 def regrow_transition_func(
     grid,
     neighbour_states,
     neighbour_counts,
-    time_step
+    time_step,
+    out=None,
+    rng=None
 ):
-
-    new_grid = np.empty_like(grid)
+    # rng is the source of the draws, anything with a random() method
+    # (default a fresh "regrow" stream, see seeding.fresh_stream)
+    rng = fresh_stream("regrow") if rng is None else rng
+    new_grid = copy_into(grid, out)
     rows, cols = grid.shape
-
-    RESPROUT_CHANCE_MULTIPLIER = 0.5
-
-    neighbour_offsets = [
-        (-1, -1),   # NW
-        ( 0, -1),   # N
-        ( 1, -1),   # NE
-        (-1,  0),   # W
-        ( 1,  0),   # E
-        (-1,  1),   # SW
-        ( 0,  1),   # S
-        ( 1,  1)    # SE
-    ]
+    # cells of a column-store grid are changed in place through views,
+    # rather than copied and put back
+    columnar = getattr(new_grid, "columnar", False)
 
     for x in range(rows):
         for y in range(cols):
@@ -56,19 +86,20 @@ def regrow_transition_func(
                 continue
 
             # Copy current cell for modification
-            new_cell = old_cell.copy()
+            new_cell = new_grid[x, y] if columnar else old_cell.copy()
 
             # If cell is burnt attempt regrowth
             if old_cell.burnt:
 
                 # Early resprout chance based on seed bank under soil
                 if time_step < 3:
-                    if random.random() < (
-                        REGROWTH_RATE.get(old_cell.type, 0.0)
+                    if rng.random() < (
+                        REGROWTH_RATE_BY_CODE[old_cell.type.value]
                         * RESPROUT_CHANCE_MULTIPLIER
                     ):
                         new_cell.burnt = False
-                        new_grid[x, y] = new_cell
+                        if not columnar:
+                            new_grid[x, y] = new_cell
                         continue
 
                 # Seed spread from neighbours
@@ -98,14 +129,10 @@ def regrow_transition_func(
                         ):
                             continue
 
-                        spread_prob = REGROWTH_RATE.get(neighbour_type, 0.0)
+                        spread_prob = REGROWTH_RATE_BY_CODE[neighbour_type.value]
 
                         # Direction effects (wind)
-                        dx, dy = neighbour_offsets[idx]
-                        angle = (math.degrees(math.atan2(-dy, dx)) + 360) % 360
-
-                        # prevailing wind is south (time scale is large enough to assert south wind dominance)
-                        wind_effect = 1.3 if 90 < angle <= 180 else 1
+                        wind_effect = SEED_WIND_EFFECT[idx]
 
                         slope_effect = old_cell.get_slope_effect(neighbour.elevation)
 
@@ -113,12 +140,136 @@ def regrow_transition_func(
                         prob = max(0.0, min(prob, 1.0))
 
                         # Apply seed spread
-                        if random.random() < prob:
+                        if rng.random() < prob:
                             new_cell.type = neighbour_type
                             new_cell.burnt = False
                             break
 
             # add updated cell to grid
-            new_grid[x, y] = new_cell
+            if not columnar:
+                new_grid[x, y] = new_cell
+
+    return new_grid, False
+
+regrow_transition_func.writes_output = True
+
+
+def seed_spread_weights(elevation):
+    """Static per-direction multipliers on seed spread
+
+    Elevation never changes, so the wind and slope effects on seed arriving
+    from each neighbour can be computed once per terrain.
+
+    Args:
+        elevation (numpy.ndarray): the (rows, cols) elevation of the terrain
+
+    Returns:
+        numpy.ndarray: (8, rows-2, cols-2) wind effect times slope effect for
+        each interior cell and neighbour direction
+    """
+    inner = elevation[_INNER]
+    return np.stack([
+        SEED_WIND_EFFECT[idx] * slope_effect(inner, elevation[ns])
+        for idx, ns in enumerate(_NEIGHBOUR_SLICES)
+    ])
 
+
+def regrow_step(types, burnt, time_step, spread_weights, rng=None):
+    """Array version of regrow_transition_func, updating types and burnt
+    in place
+
+    Args:
+        types (numpy.ndarray): integer terrain codes (TerrainType values)
+        burnt (numpy.ndarray): boolean burnt mask
+        time_step (int): the current generation
+        spread_weights (numpy.ndarray): from seed_spread_weights
+        rng: source of uniform draws, anything with a random(size) method
+            (default a fresh "regrow" stream, see seeding.fresh_stream)
+    """
+    rng = fresh_stream("regrow") if rng is None else rng
+    regrowable = burnt & _VEGETATION[types]
+    if not regrowable.any():
+        return
+
+    # Early resprout chance based on seed bank under soil
+    resprout = np.zeros_like(regrowable)
+    if time_step < 3:
+        chance = REGROWTH_RATE_BY_CODE[types] * RESPROUT_CHANCE_MULTIPLIER
+        resprout = regrowable & (rng.random(types.shape) < chance)
+
+    # Seed spread from unburnt vegetation neighbours, interior cells only.
+    # Only cells next to unburnt vegetation can be seeded, so the draws are
+    # made on that front rather than the whole grid
+    seeds = ~burnt & _VEGETATION[types]
+    near_seed = np.zeros_like(seeds[_INNER])
+    for ns in _NEIGHBOUR_SLICES:
+        near_seed |= seeds[ns]
+    front = np.flatnonzero((regrowable & ~resprout)[_INNER] & near_seed)
+    if front.size:
+        # position of each front cell in the full grid, and of its neighbours
+        rows = front // (types.shape[1] - 2) + 1
+        cols = front % (types.shape[1] - 2) + 1
+        offsets = np.array(NEIGHBOUR_OFFSETS)[:, :, np.newaxis]
+        neighbours = (rows + offsets[:, 1], cols + offsets[:, 0])
+        sources = types[neighbours]
+        spreading = seeds[neighbours]
+
+        weights = spread_weights.reshape(len(NEIGHBOUR_OFFSETS), -1)[:, front]
+        prob = np.clip(REGROWTH_RATE_BY_CODE[sources] * weights, 0.0, 1.0)
+        # the first neighbour (in NEIGHBOUR_OFFSETS order) to succeed seeds
+        # the cell
+        seeded = spreading & (rng.random(sources.shape) < prob)
+        regrown = seeded.any(axis=0)
+        first = seeded.argmax(axis=0)[regrown]
+        regrown_cells = (rows[regrown], cols[regrown])
+        types[regrown_cells] = sources[first, regrown]
+        burnt[regrown_cells] = False
+
+    burnt[resprout] = False
+
+
+def vectorised_regrow_transition_func(
+    grid,
+    neighbour_states,
+    neighbour_counts,
+    time_step,
+    spread_weights=None,
+    out=None,
+    rng=None
+):
+    """Array version of regrow_transition_func for a TerrainGrid
+
+    spread_weights takes the grid's seed_spread_weights, to save working
+    them out each step, and the next state is written into out when it is
+    given. Draws come from rng, as for regrow_step.
+    """
+    if spread_weights is None:
+        spread_weights = seed_spread_weights(grid.elevation)
+    new_grid = copy_into(grid, out)
+    regrow_step(new_grid.type, new_grid.burnt, time_step, spread_weights,
+                rng)
     return new_grid, False
+
+vectorised_regrow_transition_func.writes_output = True
+
+
+def run_regrowth(types, burnt, elevation, num_generations, rng=None):
+    """Run num_generations of regrowth on plain arrays, without a Grid2D
+
+    Args:
+        types (numpy.ndarray): integer terrain codes (TerrainType values)
+        burnt (numpy.ndarray): boolean burnt mask
+        elevation (numpy.ndarray): the terrain elevation
+        num_generations (int): number of generations to run
+        rng: source of uniform draws (default a fresh "regrow" stream)
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray): the final types and burnt mask
+    """
+    types = np.array(types)
+    burnt = np.array(burnt, dtype=bool)
+    weights = seed_spread_weights(elevation)
+    rng = fresh_stream("regrow") if rng is None else rng
+    for time_step in range(1, num_generations + 1):
+        regrow_step(types, burnt, time_step, weights, rng)
+    return types, burnt
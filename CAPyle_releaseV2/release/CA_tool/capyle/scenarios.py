@@ -0,0 +1,580 @@
+import copy
+import hashlib
+import os
+import queue
+import numpy as np
+from functools import partial
+from multiprocessing import Pool, cpu_count
+# The same modules as the real valued fire CA the scenarios are run by
+from CAPyle_releaseV2.release.ca_descriptions.real_valued_fire import (
+    setup, get_transition_func, get_wind)
+from CAPyle_releaseV2.release.CA_tool.capyle.ca.grid2d import Grid2D
+from CAPyle_releaseV2.release.CA_tool.capyle.arrival import (arrival_times,
+                                                             town_arrival)
+from CAPyle_releaseV2.release.CA_tool.capyle.wind import Wind
+from CAPyle_releaseV2.release.CA_tool.capyle.fire_spread import slope_kernels
+from CAPyle_releaseV2.release.CA_tool.capyle.seeding import new_seed
+from CAPyle_releaseV2.release.CA_tool.capyle.shared import SharedArrays
+from CAPyle_releaseV2.release.CA_tool.capyle.terrain_grid import (
+    TerrainGrid, FIELD_NAMES)
+
+# The saved config the scenarios are set up from
+DEFAULT_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "temp", "config.pkl")
+
+# Scenarios built in this process, keyed by (config_path, start, fidelity),
+# see scenario_template
+_templates = {}
+
+# In a ScenarioPool worker, the shared memory blocks of the published
+# scenarios and the pool's results buffer
+_worker_blocks = []
+_worker_results = None
+
+
+def scenario_template(start="POWER_PLANT", config_path=DEFAULT_CONFIG,
+                      fidelity=1):
+    """The config of a scenario (its terrain and settings) and the terrain's
+    slope kernels, built by setup the first time this process asks for them
+    and kept for the rest of its runs. Runs copy the config, so it is never
+    changed. A fidelity above 1 gives the scenario on its terrain coarsened
+    that many times (see TerrainGrid.coarsened), to run cheap approximate
+    simulations on"""
+    key = (config_path, start, fidelity)
+    if key not in _templates:
+        if fidelity == 1:
+            config = setup([config_path], 0, None, start)
+        else:
+            full, _ = scenario_template(start, config_path)
+            config = copy.copy(full)
+            config.initial_grid = full.initial_grid.coarsened(fidelity)
+            config.grid_dims = config.initial_grid.shape
+        _templates[key] = (config,
+                           slope_kernels(config.initial_grid.elevation))
+    return _templates[key]
+
+
+def coarse_plan(plan, fidelity):
+    """A water dropping plan mapped onto the scenario coarsened fidelity
+    times: each drop falls on the coarse cell holding its cell, at the
+    coarse time step holding its time step (a coarse step stands for
+    fidelity steps, as fire crosses a coarse cell in about that many).
+    Steps are numbered from 1, so coarse step 1 holds steps 1 to fidelity,
+    and a drop is never moved earlier"""
+    if not plan or fidelity == 1:
+        return plan
+    coarse = {}
+    for t, coords in plan.items():
+        cells = coarse.setdefault(str(-(-int(t) // fidelity)), [])
+        for x, y in coords or ():
+            cell = [x // fidelity, y // fidelity]
+            if cell not in cells:
+                cells.append(cell)
+    return coarse
+
+
+def scenario_digest(start="POWER_PLANT", config_path=DEFAULT_CONFIG):
+    """A hash of a scenario's initial terrain, to tell apart results stored
+    for different terrains (eg. after an intervention is turned on)"""
+    config, _ = scenario_template(start, config_path)
+    digest = hashlib.sha256()
+    for name, field in config.initial_grid.fields.items():
+        digest.update(name.encode())
+        digest.update(np.ascontiguousarray(field).tobytes())
+    return digest.hexdigest()
+
+
+def _run_seed(template, seed):
+    # the seed of a run: the one given, else the config's, else a fresh one,
+    # as setup picks it
+    if seed is None:
+        seed = getattr(template, "seed", None)
+    return new_seed() if seed is None else seed
+
+
+def simulate_scenario(wind_speed=13.892, direction=0, k=37.284, c=14.778,
+                      water_dropping_plan=None, num_iterations=100,
+                      start="POWER_PLANT", config_path=DEFAULT_CONFIG,
+                      seed=None, fidelity=1):
+    """Run a simulation from the process's scenario_template
+
+    Nothing is loaded or built: the template's terrain is copied into the
+    new grid. No timeline is kept: the grid is stepped with Grid2D.advance
+    rather than run, so no frame buffer is allocated or copied into. A
+    fidelity above 1 runs the scenario coarsened
+    that many times, with the plan and num_iterations mapped onto it (see
+    coarse_plan).
+
+    Returns:
+        (Grid2D, int): the grid as it stopped (the coarse one at a fidelity
+        above 1) and the time step it stopped at, numbered as Grid.run
+        numbers it and in full resolution steps
+    """
+    template, slope = scenario_template(start, config_path, fidelity)
+    config = copy.copy(template)
+    config.num_generations = -(-num_iterations // fidelity)
+    config.run_seed = _run_seed(template, seed)
+    wind = get_wind(config, wind_speed, direction, k, c)
+    grid = Grid2D(config, partial(
+        get_transition_func(config, slope), wind_distribution=wind,
+        water_dropping_plan=coarse_plan(water_dropping_plan, fidelity)))
+
+    stopped = grid.advance(config.num_generations)
+    # time steps are numbered as Grid.run numbers them
+    time_step = grid.time_step + 1 if stopped else grid.time_step
+
+    return grid, time_step * fidelity
+
+
+def run_scenario(*args, **kwargs):
+    """get_results for running many simulations: the time step a
+    simulate_scenario run stopped at"""
+    return simulate_scenario(*args, **kwargs)[1]
+
+
+def predicted_arrival(wind_speed=13.892, direction=0, k=37.284, c=14.778,
+                      water_dropping_plan=None, start="POWER_PLANT",
+                      config_path=DEFAULT_CONFIG):
+    """The expected time step fire reaches each cell of a scenario, from the
+    deterministic estimate arrival.arrival_times rather than a simulation"""
+    template, slope = scenario_template(start, config_path)
+    wind = Wind(wind_speed, direction, k, c)
+    return arrival_times(template.initial_grid, wind, water_dropping_plan,
+                         slope)
+
+
+def predicted_town_arrival(water_dropping_plan=None, wind_speed=13.892,
+                           direction=0, k=37.284, c=14.778,
+                           start="POWER_PLANT", config_path=DEFAULT_CONFIG):
+    """The expected time step fire reaches the town with the given plan,
+    from arrival.town_arrival: a cheap stand in for run_scenario to screen
+    plans with (eg. mapped over a ScenarioPool)"""
+    template, slope = scenario_template(start, config_path)
+    wind = Wind(wind_speed, direction, k, c)
+    return town_arrival(template.initial_grid, wind, water_dropping_plan,
+                        slope)
+
+
+def _drop_events(plan):
+    # the cells a plan drops water on, by time step, for the steps it drops
+    # on (a time step with no cells is the same as no drop)
+    return {
+        int(t): frozenset(tuple(coord) for coord in coords)
+        for t, coords in (plan or {}).items() if coords
+    }
+
+
+def _fork_plans(plans, finished, wind_speed=13.892, direction=0, k=37.284,
+                c=14.778, num_iterations=100, start="POWER_PLANT",
+                config_path=DEFAULT_CONFIG, seed=None, fidelity=1):
+    # Run each of plans from the same seed, calling finished(index, grid,
+    # time_step) as each run ends (at the given fidelity, as
+    # simulate_scenario). Runs of plans that drop the same water up to some
+    # time step are the same up to it, so that part is simulated once: the
+    # run goes on with the plans together until they first differ, is
+    # snapshot, and is forked for each group of plans that drop the same
+    # water at that step (see Grid2D.snapshot). Each plan gets the time step
+    # run_scenario would give it with this seed.
+    template, slope = scenario_template(start, config_path, fidelity)
+    config = copy.copy(template)
+    num_iterations = -(-num_iterations // fidelity)
+    config.num_generations = num_iterations
+    config.run_seed = _run_seed(template, seed)
+    wind = get_wind(config, wind_speed, direction, k, c)
+    func = get_transition_func(config, slope)
+    # the random streams the run draws from, saved with each snapshot
+    streams = (func.keywords["rng"].bit_generator, wind.rng.bit_generator)
+    grid = Grid2D(config, partial(func, wind_distribution=wind))
+    plans = [coarse_plan(plan, fidelity) for plan in plans]
+    events = [_drop_events(plan) for plan in plans]
+    last_step = num_iterations
+
+    def run_group(group):
+        # run the plans in group, which drop the same water before the
+        # grid's time step, from the grid as it is now
+        grid.transition_func = partial(func, wind_distribution=wind,
+                                       water_dropping_plan=plans[group[0]])
+        steps = sorted(set().union(*(events[i] for i in group)))
+        diverge = next(
+            (t for t in steps if t >= grid.time_step and
+             len(set(events[i].get(t) for i in group)) > 1),
+            None)
+        if diverge is None or diverge > last_step:
+            # the same to the end
+            stopped = grid.advance(last_step - grid.time_step + 1)
+        else:
+            stopped = grid.advance(diverge - grid.time_step)
+        if stopped or diverge is None or diverge > last_step:
+            # time steps are numbered as Grid.run numbers them
+            time_step = grid.time_step + 1 if stopped else grid.time_step
+            for i in group:
+                finished(i, grid, time_step * fidelity)
+            return
+        branches = {}
+        for i in group:
+            branches.setdefault(events[i].get(diverge), []).append(i)
+        branches = list(branches.values())
+        snapshot = grid.snapshot()
+        states = [stream.state for stream in streams]
+        for n, branch in enumerate(branches):
+            if n:
+                grid.restore(snapshot)
+                for stream, state in zip(streams, states):
+                    stream.state = state
+            run_group(branch)
+
+    if plans:
+        run_group(list(range(len(plans))))
+
+
+def run_plans(plans, **kwargs):
+    """run_scenario for each of plans, from the same seed (a fresh one if
+    not given), simulating the steps before the plans first differ only
+    once rather than for every plan. Takes the other arguments of
+    run_scenario. Returns the time step each run stopped at"""
+    time_steps = [None] * len(plans)
+
+    def finished(index, grid, time_step):
+        time_steps[index] = time_step
+
+    _fork_plans(plans, finished, **kwargs)
+    return time_steps
+
+
+def _shared_template(config, moisture_decay, burn_threshold, shared):
+    # a scenario_template whose terrain and slope kernels are read from
+    # shared memory
+    config = copy.copy(config)
+    config.initial_grid = TerrainGrid(
+        None, moisture_decay, burn_threshold,
+        fields={name: shared[name] for name in FIELD_NAMES})
+    return config, shared["slope"]
+
+
+def _warm_worker(published):
+    # use the scenarios the pool published rather than building them
+    for key, (config, moisture_decay, burn_threshold,
+              handle) in published.items():
+        shared = SharedArrays.attach(handle, readonly=True)
+        _worker_blocks.append(shared)
+        _templates[key] = _shared_template(config, moisture_decay,
+                                           burn_threshold, shared)
+
+
+def _attach_results(handle):
+    # the pool's results buffer, attached the first time it is used
+    global _worker_results
+    if _worker_results is None or _worker_results.handle != handle:
+        # the pool has moved on to a bigger buffer
+        if _worker_results is not None:
+            _worker_results.close()
+        _worker_results = SharedArrays.attach(handle)
+    return _worker_results
+
+
+def _burnt_cells(grid, shape, fidelity=1):
+    # whether each cell of the full grid was burning or burnt when a run
+    # stopped
+    burnt = grid.grid.burning | grid.grid.burnt
+    if fidelity != 1:
+        # each coarse cell stands for a block of the full grid
+        burnt = burnt.repeat(fidelity, axis=0).repeat(fidelity, axis=1)
+        burnt = burnt[:shape[0], :shape[1]]
+    return burnt
+
+
+def _write_result(results, index, grid, time_step, shape, fidelity=1):
+    results["time_step"][index] = time_step
+    results["burnt"][index] = np.packbits(_burnt_cells(grid, shape,
+                                                       fidelity))
+
+
+def _run_into(task, handle, shape):
+    # run task (index, run_scenario keyword arguments), writing its results
+    # into row index of the pool's results buffer
+    index, kwargs = task
+    results = _attach_results(handle)
+    grid, time_step = simulate_scenario(**kwargs)
+    _write_result(results, index, grid, time_step, shape,
+                  kwargs.get("fidelity", 1))
+    return index
+
+
+def _fork_into(task, handle, shape):
+    # run a group of plans with _fork_plans, writing the result of each
+    # plan into its row of the pool's results buffer
+    indices, plans, kwargs = task
+    results = _attach_results(handle)
+    fidelity = kwargs.get("fidelity", 1)
+    _fork_plans(plans, lambda i, grid, time_step: _write_result(
+        results, indices[i], grid, time_step, shape, fidelity), **kwargs)
+    return indices
+
+
+def _results_specs(size, shape):
+    # a results buffer with a row for each of size runs
+    return {
+        "time_step": (size, np.int32),
+        # whether each cell was burning or burnt when the run stopped,
+        # packed 8 cells to a byte
+        "burnt": ((size, -(-shape[0] * shape[1] // 8)), np.uint8),
+    }
+
+
+class ScenarioPool(object):
+    """A long-lived pool of processes for running many fire simulations
+
+    The scenarios (see scenario_template) are built once, here, and their
+    terrain arrays and slope kernels published in shared memory (see
+    SharedArrays), which every worker attaches to read only when it starts.
+    However many workers there are, the static terrain is held in memory
+    once, and a task costs a copy of it into the new grid rather than
+    starting a process, importing the CA and running setup. Coarsened
+    scenarios are built from them by each worker the first time it runs
+    one (see scenario_template's fidelity). Keep the pool for as long as
+    there are runs to do (eg. every generation of the EA, or a wind
+    direction sweep).
+
+    run_many sends each worker only the task's arguments (eg. a water
+    dropping plan); the workers write the results straight into a shared
+    results buffer rather than sending them back. map and imap_unordered
+    are those of the underlying multiprocessing Pool, to map other
+    functions (eg. run_scenario) over the warm workers.
+    """
+
+    def __init__(self, processes=None, starts=("POWER_PLANT",),
+                 config_path=DEFAULT_CONFIG):
+        self.blocks = []
+        self.keys = [(config_path, start, 1) for start in starts]
+        published = {}
+        for key in self.keys:
+            config, slope = scenario_template(config_path=config_path,
+                                              start=key[1])
+            terrain = config.initial_grid
+            shared = SharedArrays.publish(dict(terrain.fields, slope=slope))
+            self.blocks.append(shared)
+            # the workers are sent the config without its terrain
+            sent = copy.copy(config)
+            sent.initial_grid = None
+            published[key] = (sent, terrain.moisture_decay,
+                              terrain.burn_threshold, shared.handle)
+            # this process reads the shared copy too, so the terrain is held
+            # once
+            _templates[key] = _shared_template(sent, terrain.moisture_decay,
+                                               terrain.burn_threshold, shared)
+        self.shape = terrain.shape
+        self.results = None
+        self.processes = processes or cpu_count()
+        self.pool = Pool(self.processes, initializer=_warm_worker,
+                         initargs=(published,))
+
+    def _results_buffer(self, size):
+        # a results buffer with a row for each of size runs, kept for later
+        # batches that fit in it
+        if self.results is None or len(self.results["time_step"]) < size:
+            if self.results is not None:
+                self.results.close()
+            self.results = SharedArrays.allocate(
+                _results_specs(size, self.shape))
+        return self.results
+
+    def run_many(self, tasks, on_result=None):
+        """Run a simulate_scenario for each of tasks on the pool
+
+        Args:
+            tasks (list): the keyword arguments of each run, eg.
+                {"water_dropping_plan": plan, "seed": seed}
+            on_result (function): called as on_result(index, time_step) as
+                each run finishes, in the order they finish
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): the time step each run stopped
+            at (what run_scenario returns) and, for each cell, the number of
+            runs it was burning or burnt in when they stopped
+        """
+        tasks = list(tasks)
+        results = self._results_buffer(len(tasks))
+        for index in self.pool.imap_unordered(
+                partial(_run_into, handle=results.handle, shape=self.shape),
+                enumerate(tasks)):
+            if on_result is not None:
+                on_result(index, int(results["time_step"][index]))
+        return self._collect(len(tasks))
+
+    def run_plans(self, plans, **kwargs):
+        """run_plans on the pool: the plans are run from the same seed,
+        sharing the simulation of the steps before they differ
+
+        The plans are sorted by the water they drop, so plans that share
+        the most steps go to the same worker, and split into a group for
+        each worker. Takes the other arguments of run_scenario.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): as run_many
+        """
+        # the workers must share a seed
+        template, _ = scenario_template(
+            kwargs.get("start", "POWER_PLANT"),
+            kwargs.get("config_path", DEFAULT_CONFIG))
+        kwargs["seed"] = _run_seed(template, kwargs.get("seed"))
+        order = sorted(range(len(plans)), key=lambda i: sorted(
+            (t, sorted(cells)) for t, cells in _drop_events(plans[i]).items()))
+        results = self._results_buffer(len(plans))
+        groups = [list(group) for group in
+                  np.array_split(order, self.processes) if len(group)]
+        tasks = [([int(i) for i in group], [plans[i] for i in group], kwargs)
+                 for group in groups]
+        for _ in self.pool.imap_unordered(
+                partial(_fork_into, handle=results.handle, shape=self.shape),
+                tasks):
+            pass
+        return self._collect(len(plans))
+
+    def as_completed(self, tasks, in_flight=None):
+        """Run a simulate_scenario for each of tasks on the pool, keeping
+        in_flight runs going (one per worker by default) rather than waiting
+        for a batch to finish, and yield (task, time_step) as each run ends,
+        in the order they end
+
+        The next task is only taken from tasks when a worker frees up, so
+        tasks can be a generator whose tasks depend on the results yielded
+        so far (eg. children bred from a population the results are
+        folded into). The runs write into a results buffer of their own,
+        with a row for each run in flight. A run that fails raises its
+        error here once the runs still going have ended.
+
+        Args:
+            tasks (iterable): the keyword arguments of each run, as run_many
+            in_flight (int): the most runs to have going at once
+        """
+        in_flight = in_flight or self.processes
+        tasks = iter(tasks)
+        results = SharedArrays.allocate(_results_specs(in_flight,
+                                                       self.shape))
+        # rows of the buffer free to run into, and the task run into each
+        # of the others
+        done = queue.Queue()
+        free = list(range(in_flight))
+        running = {}
+        try:
+            while True:
+                while free:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    row = free.pop()
+                    running[row] = task
+                    self.pool.apply_async(
+                        _run_into, ((row, task), results.handle, self.shape),
+                        callback=lambda index: done.put((index, None)),
+                        error_callback=lambda error, row=row: done.put(
+                            (row, error)))
+                if not running:
+                    return
+                row, error = done.get()
+                task = running.pop(row)
+                free.append(row)
+                if error is not None:
+                    raise error
+                yield task, int(results["time_step"][row])
+        finally:
+            # the workers still write into the buffer until their runs end
+            while running:
+                running.pop(done.get()[0])
+            results.close()
+
+    def _collect(self, size):
+        # the time steps and burn counts of the first size runs
+        results = self.results
+        time_steps = results["time_step"][:size].copy()
+        cells = self.shape[0] * self.shape[1]
+        burnt = np.unpackbits(results["burnt"][:size], axis=1, count=cells)
+        return time_steps, burnt.sum(axis=0).reshape(self.shape)
+
+    def map(self, func, iterable, chunksize=None):
+        return self.pool.map(func, iterable, chunksize)
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return self.pool.imap_unordered(func, iterable, chunksize)
+
+    def close(self):
+        """Stop the workers and release the shared memory"""
+        self.pool.terminate()
+        self.pool.join()
+        # this process's templates read the blocks, they are built again if
+        # needed
+        for key in self.keys:
+            _templates.pop(key, None)
+        for block in self.blocks + ([self.results]
+                                    if self.results is not None else []):
+            block.close()
+        self.blocks = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SerialScenarios(object):
+    """The interface of a ScenarioPool, running everything in this process
+    one run after another: for code written against a pool that is itself
+    running in a worker process (eg. an island of
+    water_dropping_ea.island_ea), where a pool of its own would only compete
+    with the other workers for the CPUs"""
+
+    processes = 1
+
+    def __init__(self, start="POWER_PLANT", config_path=DEFAULT_CONFIG):
+        config, _ = scenario_template(start, config_path)
+        self.shape = config.initial_grid.shape
+
+    def run_many(self, tasks, on_result=None):
+        """ScenarioPool.run_many, in this process"""
+        time_steps = []
+        burnt = np.zeros(self.shape, dtype=np.int64)
+        for index, kwargs in enumerate(tasks):
+            grid, time_step = simulate_scenario(**kwargs)
+            time_steps.append(time_step)
+            burnt += _burnt_cells(grid, self.shape, kwargs.get("fidelity", 1))
+            if on_result is not None:
+                on_result(index, time_step)
+        return np.array(time_steps, dtype=np.int32), burnt
+
+    def run_plans(self, plans, **kwargs):
+        """ScenarioPool.run_plans, in this process"""
+        time_steps = np.zeros(len(plans), dtype=np.int32)
+        burnt = np.zeros(self.shape, dtype=np.int64)
+
+        def finished(index, grid, time_step):
+            time_steps[index] = time_step
+            burnt[...] += _burnt_cells(grid, self.shape,
+                                       kwargs.get("fidelity", 1))
+
+        _fork_plans(plans, finished, **kwargs)
+        return time_steps, burnt
+
+    def map(self, func, iterable, chunksize=None):
+        return list(map(func, iterable))
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        return map(func, iterable)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def warm_pool(processes=None, starts=("POWER_PLANT",),
+              config_path=DEFAULT_CONFIG):
+    """A ScenarioPool of the given scenarios. Others are built by the
+    workers on first use"""
+    return ScenarioPool(processes, starts, config_path)
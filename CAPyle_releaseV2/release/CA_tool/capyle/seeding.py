@@ -0,0 +1,65 @@
+import numpy as np
+
+# The stochastic parts of a fire run, each drawing from its own stream so
+# that changing how one of them draws leaves the others alone
+STREAMS = ("wind", "spread", "regrow")
+
+
+def seed_sequence(seed=None):
+    """The numpy SeedSequence for seed
+
+    Args:
+        seed: an int, a SeedSequence (returned as it is), or None for fresh
+            entropy from the operating system
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def new_seed():
+    """Fresh entropy for a run, an int that can be kept (eg. as
+    CAConfig.run_seed) and passed back to repeat the run exactly"""
+    return np.random.SeedSequence().entropy
+
+
+def child_seed(seed, index):
+    """The index-th SeedSequence spawned from seed
+
+    The same child SeedSequence.spawn gives, but worked out directly, so the
+    seed of any one replica or worker can be found again without spawning
+    the ones before it. Children are independent of each other and of seed.
+    """
+    parent = seed_sequence(seed)
+    return np.random.SeedSequence(parent.entropy,
+                                  spawn_key=parent.spawn_key + (index,),
+                                  pool_size=parent.pool_size)
+
+
+def spawn_seeds(seed, n):
+    """The first n child seeds of seed, one for each replica or worker"""
+    return [child_seed(seed, index) for index in range(n)]
+
+
+def seed_key(seed):
+    """A JSON-able description of seed, the same for any two seeds that give
+    the same streams (eg. 5 and SeedSequence(5)), to key stored results
+    by"""
+    sequence = seed_sequence(seed)
+    return [sequence.entropy, list(sequence.spawn_key), sequence.pool_size]
+
+
+def run_streams(seed):
+    """A numpy Generator for each of STREAMS, for one run
+
+    Returns:
+        dict: Generators keyed by stream name, the same for the same seed
+    """
+    return {name: np.random.default_rng(child_seed(seed, index))
+            for index, name in enumerate(STREAMS)}
+
+
+def fresh_stream(name):
+    """The name stream (one of STREAMS) of a run with a new_seed, for draws
+    made without a stream passed in"""
+    return np.random.default_rng(child_seed(new_seed(), STREAMS.index(name)))
@@ -0,0 +1,108 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# Arrays in a block start on cache line boundaries
+_ALIGN = 64
+
+
+class SharedArrays(object):
+    """Named numpy arrays held in one block of shared memory
+
+    A process publishes arrays once (see publish and allocate) and passes
+    the small, picklable handle to other processes, which attach to the
+    same memory rather than being sent copies. However many processes read
+    the arrays, they are held in memory once, and arrays written by one
+    process (eg. a results buffer) are seen by the others without being
+    sent back.
+
+    Arrays are indexed by name, eg. shared["elevation"]. The process that
+    created the block should unlink it when every process is done with it;
+    using it as a context manager does so on leaving.
+    """
+
+    def __init__(self, memory, layout, owner=False, readonly=False):
+        """Wrap an open block, see publish, allocate and attach
+
+        Args:
+            memory (SharedMemory): the block
+            layout (tuple): (name, shape, dtype, offset) for each array
+            owner (bool): whether this process created the block
+            readonly (bool): whether the arrays are read only here
+        """
+        self.memory = memory
+        self.layout = layout
+        self.owner = owner
+        self.arrays = {}
+        for name, shape, dtype, offset in layout:
+            array = np.ndarray(shape, dtype=np.dtype(dtype),
+                               buffer=memory.buf, offset=offset)
+            array.flags.writeable = not readonly
+            self.arrays[name] = array
+
+    @classmethod
+    def allocate(cls, specs):
+        """Create a block of zeroed arrays
+
+        Args:
+            specs (dict): (shape, dtype) of each array, keyed by name
+        """
+        layout = []
+        size = 0
+        for name, (shape, dtype) in specs.items():
+            shape = tuple(int(n) for n in np.atleast_1d(shape))
+            dtype = np.dtype(dtype)
+            layout.append((name, shape, dtype.str, size))
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            size += -(-nbytes // _ALIGN) * _ALIGN
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        shared = cls(memory, tuple(layout), owner=True)
+        for array in shared.arrays.values():
+            array.fill(0)
+        return shared
+
+    @classmethod
+    def publish(cls, arrays):
+        """Create a block holding a copy of each of the given arrays
+
+        Args:
+            arrays (dict): numpy arrays keyed by name
+        """
+        arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        shared = cls.allocate({name: (array.shape, array.dtype)
+                               for name, array in arrays.items()})
+        for name, array in arrays.items():
+            shared[name][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle, readonly=False):
+        """Open a block created by another process from its handle"""
+        name, layout = handle
+        return cls(shared_memory.SharedMemory(name=name), layout,
+                   readonly=readonly)
+
+    @property
+    def handle(self):
+        """The block's name and layout, to pass to attach"""
+        return (self.memory.name, self.layout)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def close(self):
+        """Let go of the block in this process, unlinking it if it created
+        it. No views of the arrays may be held elsewhere in the process"""
+        self.arrays = {}
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+            self.owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,227 +1,292 @@
-
-from enum import Enum
-import numbers
-import random
-import math
-
-class TerrainType(Enum):
-    CHAPARRAL = 1
-    DENSE_FOREST = 2
-    CANYON_SCRUBLAND = 3
-    LAKE = 4
-    SOURCE = 5
-    TOWN = 6
-
-IGNITION_PROB_TABLE = {
-    TerrainType.CHAPARRAL: {
-        TerrainType.CHAPARRAL: 0.50,
-        TerrainType.CANYON_SCRUBLAND: 0.75,
-        TerrainType.DENSE_FOREST: 0.30,
-        TerrainType.TOWN: 0.40,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 0.35
-    },
-    TerrainType.CANYON_SCRUBLAND: {
-        TerrainType.CHAPARRAL: 0.65,
-        TerrainType.CANYON_SCRUBLAND: 1,
-        TerrainType.DENSE_FOREST: 0.25,
-        TerrainType.TOWN: 0.45,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 0.35
-    },
-    TerrainType.DENSE_FOREST: {
-        TerrainType.CHAPARRAL: 0.45,
-        TerrainType.CANYON_SCRUBLAND: 0.55,
-        TerrainType.DENSE_FOREST: 0.20,
-        TerrainType.TOWN: 0.30,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 0.35
-    },
-    TerrainType.SOURCE: {
-        TerrainType.CHAPARRAL: 0.90,
-        TerrainType.CANYON_SCRUBLAND: 0.95,
-        TerrainType.DENSE_FOREST: 0.80,
-        TerrainType.TOWN: 0.95,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 1.0
-    },
-    TerrainType.TOWN: {
-        TerrainType.CHAPARRAL: 0.40,
-        TerrainType.CANYON_SCRUBLAND: 0.45,
-        TerrainType.DENSE_FOREST: 0.35,
-        TerrainType.TOWN: 0.30,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 0.35
-    },
-    TerrainType.LAKE: {
-        TerrainType.CHAPARRAL: 0.0,
-        TerrainType.CANYON_SCRUBLAND: 0.0,
-        TerrainType.DENSE_FOREST: 0.0,
-        TerrainType.TOWN: 0.0,
-        TerrainType.LAKE: 0.0,
-        TerrainType.SOURCE: 0.0
-    },
-}
-
-# Randomised burn and regen rates based on assignment brief
-REGEN_RATE_TABLE = {
-    TerrainType.CHAPARRAL:random.random() * (1/2880 - 1/5760) + 1/5760,
-    TerrainType.CANYON_SCRUBLAND:random.random() * (1/720 - 1/1440) + 1/1440,
-    TerrainType.DENSE_FOREST:random.random() * (1/8640 - 1/12960) + 1/12960
-}
-
-BURN_RATE_TABLE = {
-    TerrainType.CHAPARRAL:random.random() * (1/24 - 1/168) + 1/168,
-    TerrainType.CANYON_SCRUBLAND:random.random() * (1/6 - 1/12) + 1/12,
-    TerrainType.DENSE_FOREST:random.random() * (1/480 - 1/720) + 1/720
-}
-
-class TerrainCell():
-    def __init__(
-        self, 
-        type: TerrainType, 
-        elevation: float = 0.0,
-        moisture_decay: float = 0.05,
-        burn_threshold: float = 0.5,
-        regen_rate: float = None,
-        burn_rate: float = None,
-        burning: bool = False,
-        burnt: bool = False,
-        waterdropped: bool = False,
-    ):
-        self.type = type
-        self.moisture_decay_rate = moisture_decay
-        self.burn_threshold = burn_threshold
-
-        self.elevation = elevation
-        self.fuel = 1.0
-        self.moisture = 0.0
-
-        self.burning = burning
-        #set burn and regen rates if not passed in
-        self.regen_rate = REGEN_RATE_TABLE.get(self.type, None) if regen_rate is None else regen_rate
-        self.burn_rate = BURN_RATE_TABLE.get(self.type, None) if burn_rate is None else burn_rate
-        self.waterdropped = waterdropped
-
-        #burnt state tracking
-        self.burnt = burnt
-        self.burnt_timer = 0
-        self.burn_duration = 0
-
-    def get_ignition_prob(self, ignition_source: TerrainType) -> float:
-        return IGNITION_PROB_TABLE[ignition_source][self.type]
-
-    def ignite(self):
-        if self.burnt:
-            return
-        
-        match (self.type):
-            case TerrainType.TOWN:
-                self.burning = True
-                self.burn_duration = 0
-            case TerrainType.LAKE:
-                return
-            case TerrainType.SOURCE:
-                self.burning = True
-                self.burn_duration = 0
-            case _:
-                if self.moisture < self.burn_threshold:
-                    if self.fuel >= self.burn_rate:
-                        self.burning = True
-                        self.fuel -= self.burn_rate
-                        self.burn_duration = 0
-                    else:
-                        self.fuel = 0.0
-
-    def burn(self):
-        if self.type == TerrainType.TOWN:
-            return
-        elif self.type == TerrainType.SOURCE:
-            if random.random() > 0.2:
-                return
-            else:
-                self.burning = False
-        else:
-            if self.fuel >= self.burn_rate:
-                self.fuel -= self.burn_rate
-                self.burn_duration += 1
-            else:
-                # burning finished, enter burnt state
-                self.burning = False
-                self.fuel = 0.0
-                self.burnt = True
-                self.burnt_timer = 0
-                self.burn_duration = 0
-    
-    def drop_water(self, max_moisture: float = 1):
-        self.waterdropped = True
-        if self.burnt:
-            return # water drop has no effect on burnt cells
-        match (self.type):
-            case TerrainType.TOWN:
-                return
-            case TerrainType.LAKE:
-                return
-            case TerrainType.SOURCE:
-                self.burning = True
-            case _:
-                if self.burning:
-                    self.burning = False
-                    self.moisture = min(self.moisture + 0.5 * max_moisture, max_moisture)
-                else:
-                    self.moisture = max_moisture
-            
-    def _strip_moisture(self):
-        multiplier = 0.25 if not self.burning else 1
-        self.moisture = max(0, self.moisture - multiplier * self.moisture_decay_rate)
-
-    # slope is just simplified to difference in height between cells.
-    def get_slope_effect(self, ignition_source_elevation: int) -> float:
-        slope = self.elevation - ignition_source_elevation
-        # any difference greater than 50 is instantly impossible
-        if(abs(slope) > 50): return 0
-        # majority slopes will be 0
-        if(abs(slope) == 0): return 1
-        # normalize to -0.5, 0.5 range
-        slope_norm = slope / 100.0
-        # print(slope_norm)
-        # apply function
-        effect_slope = 0.5 + (0.75 / (0.5 + math.exp(-12 * slope_norm)))
-        return effect_slope
-
-
-    def copy(self):
-        new_cell = TerrainCell(
-            type=self.type,
-            elevation=self.elevation,
-            moisture_decay=self.moisture_decay_rate,
-            burn_threshold=self.burn_threshold,
-            regen_rate=self.regen_rate,
-            burn_rate=self.burn_rate,
-            burning=self.burning,
-            burnt=self.burnt,
-            waterdropped=self.waterdropped
-        )
-        
-        new_cell.fuel = self.fuel
-        new_cell.moisture = self.moisture
-        new_cell.burnt_timer = self.burnt_timer
-        new_cell.burn_duration = self.burn_duration
-
-        return new_cell
-
-def cell_to_state_index(cell: TerrainCell) -> int:
-    # Used to map cells to integer states so they can be visualised
-    if cell is None or isinstance(cell, numbers.Integral):
-        return -1 
-
-    base = (cell.type.value - 1) * 4
-
-    if cell.waterdropped:
-        return base + 2
-    elif cell.burning:
-        return base + 1
-    elif cell.burnt:
-        return base + 3
-    else:
+
+from enum import Enum
+import numbers
+import math
+import numpy as np
+
+class TerrainType(Enum):
+    CHAPARRAL = 1
+    DENSE_FOREST = 2
+    CANYON_SCRUBLAND = 3
+    LAKE = 4
+    SOURCE = 5
+    TOWN = 6
+
+IGNITION_PROB_TABLE = {
+    TerrainType.CHAPARRAL: {
+        TerrainType.CHAPARRAL: 0.50,
+        TerrainType.CANYON_SCRUBLAND: 0.75,
+        TerrainType.DENSE_FOREST: 0.30,
+        TerrainType.TOWN: 0.40,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 0.35
+    },
+    TerrainType.CANYON_SCRUBLAND: {
+        TerrainType.CHAPARRAL: 0.65,
+        TerrainType.CANYON_SCRUBLAND: 1,
+        TerrainType.DENSE_FOREST: 0.25,
+        TerrainType.TOWN: 0.45,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 0.35
+    },
+    TerrainType.DENSE_FOREST: {
+        TerrainType.CHAPARRAL: 0.45,
+        TerrainType.CANYON_SCRUBLAND: 0.55,
+        TerrainType.DENSE_FOREST: 0.20,
+        TerrainType.TOWN: 0.30,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 0.35
+    },
+    TerrainType.SOURCE: {
+        TerrainType.CHAPARRAL: 0.90,
+        TerrainType.CANYON_SCRUBLAND: 0.95,
+        TerrainType.DENSE_FOREST: 0.80,
+        TerrainType.TOWN: 0.95,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 1.0
+    },
+    TerrainType.TOWN: {
+        TerrainType.CHAPARRAL: 0.40,
+        TerrainType.CANYON_SCRUBLAND: 0.45,
+        TerrainType.DENSE_FOREST: 0.35,
+        TerrainType.TOWN: 0.30,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 0.35
+    },
+    TerrainType.LAKE: {
+        TerrainType.CHAPARRAL: 0.0,
+        TerrainType.CANYON_SCRUBLAND: 0.0,
+        TerrainType.DENSE_FOREST: 0.0,
+        TerrainType.TOWN: 0.0,
+        TerrainType.LAKE: 0.0,
+        TerrainType.SOURCE: 0.0
+    },
+}
+
+# Ranges of the burn and regen rates based on assignment brief
+REGEN_RATE_RANGES = {
+    TerrainType.CHAPARRAL: (1/5760, 1/2880),
+    TerrainType.CANYON_SCRUBLAND: (1/1440, 1/720),
+    TerrainType.DENSE_FOREST: (1/12960, 1/8640)
+}
+
+BURN_RATE_RANGES = {
+    TerrainType.CHAPARRAL: (1/168, 1/24),
+    TerrainType.CANYON_SCRUBLAND: (1/12, 1/6),
+    TerrainType.DENSE_FOREST: (1/720, 1/480)
+}
+
+# The rates are drawn at random within their ranges, but from a fixed seed,
+# so every process (eg. each pool worker) simulates the same fuel physics.
+# See draw_rate_tables to draw another set
+RATE_TABLE_SEED = 3524
+
+def _draw_rates(ranges, rng):
+    return {terrain: low + rng.random() * (high - low)
+            for terrain, (low, high) in ranges.items()}
+
+_rate_rng = np.random.default_rng(RATE_TABLE_SEED)
+REGEN_RATE_TABLE = _draw_rates(REGEN_RATE_RANGES, _rate_rng)
+BURN_RATE_TABLE = _draw_rates(BURN_RATE_RANGES, _rate_rng)
+
+def compile_table(table, default=0.0):
+    """Compile a table keyed by TerrainType into a numpy array indexed by
+    terrain code (TerrainType value)
+
+    A {type: value} table becomes a 1D array and a {source: {target: value}}
+    table a 2D [source, target] array, so a whole grid of codes can be looked
+    up in one fancy-indexing gather. Code 0 (no terrain) and types the table
+    leaves out are given default.
+    """
+    size = len(TerrainType) + 1
+    if all(isinstance(value, dict) for value in table.values()):
+        compiled = np.full((size, size), default, dtype=float)
+        for source, targets in table.items():
+            for target, value in targets.items():
+                compiled[source.value, target.value] = value
+    else:
+        compiled = np.full(size, default, dtype=float)
+        for terrain, value in table.items():
+            compiled[terrain.value] = value
+    return compiled
+
+# The tables above indexed by terrain code. Cells and grids both read these,
+# so a parameter sweep only has to change the arrays. Undefined rates are NaN
+IGNITION_PROB_BY_CODE = compile_table(IGNITION_PROB_TABLE)
+REGEN_RATE_BY_CODE = compile_table(REGEN_RATE_TABLE, np.nan)
+BURN_RATE_BY_CODE = compile_table(BURN_RATE_TABLE, np.nan)
+
+def draw_rate_tables(seed):
+    """Redraw the burn and regen rates from their ranges
+
+    The tables and their compiled arrays are updated in place, so cells
+    built afterwards use the new rates, and a TerrainGrid (which reads the
+    rates by type) uses them at once. TerrainCells built before keep theirs,
+    so redraw before the terrain is set up (eg. before setup).
+
+    Args:
+        seed: anything numpy.random.default_rng takes, eg. an int
+    """
+    rng = np.random.default_rng(seed)
+    for table, compiled, ranges in (
+            (REGEN_RATE_TABLE, REGEN_RATE_BY_CODE, REGEN_RATE_RANGES),
+            (BURN_RATE_TABLE, BURN_RATE_BY_CODE, BURN_RATE_RANGES)):
+        table.update(_draw_rates(ranges, rng))
+        compiled[:] = compile_table(table, np.nan)
+
+def _table_rate(rates, terrain):
+    # a rate from one of the compiled tables, None where it is undefined
+    rate = rates[terrain.value] if terrain is not None else np.nan
+    return None if np.isnan(rate) else float(rate)
+
+class TerrainCell():
+    def __init__(
+        self, 
+        type: TerrainType, 
+        elevation: float = 0.0,
+        moisture_decay: float = 0.05,
+        burn_threshold: float = 0.5,
+        regen_rate: float = None,
+        burn_rate: float = None,
+        burning: bool = False,
+        burnt: bool = False,
+        waterdropped: bool = False,
+    ):
+        self.type = type
+        self.moisture_decay_rate = moisture_decay
+        self.burn_threshold = burn_threshold
+
+        self.elevation = elevation
+        self.fuel = 1.0
+        self.moisture = 0.0
+
+        self.burning = burning
+        #set burn and regen rates if not passed in
+        self.regen_rate = _table_rate(REGEN_RATE_BY_CODE, self.type) if regen_rate is None else regen_rate
+        self.burn_rate = _table_rate(BURN_RATE_BY_CODE, self.type) if burn_rate is None else burn_rate
+        self.waterdropped = waterdropped
+
+        #burnt state tracking
+        self.burnt = burnt
+        self.burnt_timer = 0
+        self.burn_duration = 0
+
+    def get_ignition_prob(self, ignition_source: TerrainType) -> float:
+        return float(IGNITION_PROB_BY_CODE[ignition_source.value, self.type.value])
+
+    def ignite(self):
+        if self.burnt:
+            return
+        
+        match (self.type):
+            case TerrainType.TOWN:
+                self.burning = True
+                self.burn_duration = 0
+            case TerrainType.LAKE:
+                return
+            case TerrainType.SOURCE:
+                self.burning = True
+                self.burn_duration = 0
+            case _:
+                if self.moisture < self.burn_threshold:
+                    if self.fuel >= self.burn_rate:
+                        self.burning = True
+                        self.fuel -= self.burn_rate
+                        self.burn_duration = 0
+                    else:
+                        self.fuel = 0.0
+
+    def burn(self, rng):
+        # rng is the source of the draw that puts sources out, anything with
+        # a random() method, eg. the "spread" stream of seeding.run_streams
+        if self.type == TerrainType.TOWN:
+            return
+        elif self.type == TerrainType.SOURCE:
+            if rng.random() > 0.2:
+                return
+            else:
+                self.burning = False
+        else:
+            if self.fuel >= self.burn_rate:
+                self.fuel -= self.burn_rate
+                self.burn_duration += 1
+            else:
+                # burning finished, enter burnt state
+                self.burning = False
+                self.fuel = 0.0
+                self.burnt = True
+                self.burnt_timer = 0
+                self.burn_duration = 0
+    
+    def drop_water(self, max_moisture: float = 1):
+        self.waterdropped = True
+        if self.burnt:
+            return # water drop has no effect on burnt cells
+        match (self.type):
+            case TerrainType.TOWN:
+                return
+            case TerrainType.LAKE:
+                return
+            case TerrainType.SOURCE:
+                self.burning = True
+            case _:
+                if self.burning:
+                    self.burning = False
+                    self.moisture = min(self.moisture + 0.5 * max_moisture, max_moisture)
+                else:
+                    self.moisture = max_moisture
+            
+    def _strip_moisture(self):
+        multiplier = 0.25 if not self.burning else 1
+        self.moisture = max(0, self.moisture - multiplier * self.moisture_decay_rate)
+
+    # slope is just simplified to difference in height between cells.
+    def get_slope_effect(self, ignition_source_elevation: int) -> float:
+        slope = self.elevation - ignition_source_elevation
+        # any difference greater than 50 is instantly impossible
+        if(abs(slope) > 50): return 0
+        # majority slopes will be 0
+        if(abs(slope) == 0): return 1
+        # normalize to -0.5, 0.5 range
+        slope_norm = slope / 100.0
+        # print(slope_norm)
+        # apply function
+        effect_slope = 0.5 + (0.75 / (0.5 + math.exp(-12 * slope_norm)))
+        return effect_slope
+
+
+    def copy(self):
+        new_cell = TerrainCell(
+            type=self.type,
+            elevation=self.elevation,
+            moisture_decay=self.moisture_decay_rate,
+            burn_threshold=self.burn_threshold,
+            regen_rate=self.regen_rate,
+            burn_rate=self.burn_rate,
+            burning=self.burning,
+            burnt=self.burnt,
+            waterdropped=self.waterdropped
+        )
+        
+        new_cell.fuel = self.fuel
+        new_cell.moisture = self.moisture
+        new_cell.burnt_timer = self.burnt_timer
+        new_cell.burn_duration = self.burn_duration
+
+        return new_cell
+
+def cell_to_state_index(cell: TerrainCell) -> int:
+    # Used to map cells to integer states so they can be visualised
+    if cell is None or isinstance(cell, numbers.Integral):
+        return -1 
+
+    base = (cell.type.value - 1) * 4
+
+    if cell.waterdropped:
+        return base + 2
+    elif cell.burning:
+        return base + 1
+    elif cell.burnt:
+        return base + 3
+    else:
         return base + 0
\ No newline at end of file
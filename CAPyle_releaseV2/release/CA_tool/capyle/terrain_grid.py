@@ -0,0 +1,416 @@
+import math
+import numbers
+import numpy as np
+from .seeding import fresh_stream
+from .terrain_cell import (TerrainCell, TerrainType, IGNITION_PROB_BY_CODE,
+                           BURN_RATE_BY_CODE, REGEN_RATE_BY_CODE)
+
+# Per-cell fields of a TerrainGrid and the dtype each one is stored as.
+# Terrain types are stored by their TerrainType value; 0 marks an empty cell
+# (eg. the dead border CAPyle writes around a non-wrapping grid). The burn
+# and regen rates depend only on the type, so they are read from the
+# compiled tables rather than stored (see TerrainGrid.burn_rate).
+FIELDS = (
+    ("type", np.uint8),
+    ("elevation", np.float32),
+    ("fuel", np.float32),
+    ("moisture", np.float32),
+    ("burning", np.bool_),
+    ("burnt", np.bool_),
+    ("waterdropped", np.bool_),
+    ("burnt_timer", np.int16),
+    ("burn_duration", np.int16),
+)
+
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+
+_TOWN = TerrainType.TOWN.value
+_LAKE = TerrainType.LAKE.value
+_SOURCE = TerrainType.SOURCE.value
+
+# TerrainType of each code, None for an empty cell
+_TYPES_BY_CODE = [None] + [TerrainType(code)
+                           for code in range(1, len(TerrainType) + 1)]
+
+
+class TerrainGrid(object):
+    """Columnar (structure-of-arrays) store for a grid of terrain cells
+
+    Every TerrainCell attribute is held in its own numpy array, so a whole
+    grid costs a few bytes per cell and rules can be written as whole-array
+    operations. Indexing with a pair of integers returns a TerrainCell view
+    that reads and writes the underlying arrays, so cell-at-a-time code keeps
+    working; indexing with slices returns a TerrainGrid view of the region.
+
+    Note:
+        The moisture decay rate and burn threshold are the same for every
+        cell in the model, so they are held once per grid rather than per
+        cell, and the burn and regen rates are those of each cell's type.
+        Rates given to a TerrainCell are not kept when it is set in a grid.
+    """
+    # Grid2D checks this flag to allocate the grid with TerrainGrid.empty
+    # rather than as a numpy object array
+    columnar = True
+
+    def __init__(self, shape, moisture_decay=0.05, burn_threshold=0.5,
+                 fields=None):
+        """Create a grid of the given shape with every cell empty
+
+        Args:
+            shape (tuple): the grid dimensions
+            moisture_decay (float): moisture lost per step by each cell
+            burn_threshold (float): moisture above which cells cannot ignite
+            fields (dict): existing arrays to wrap instead of allocating new
+                ones, keyed by field name
+        """
+        self.moisture_decay = moisture_decay
+        self.burn_threshold = burn_threshold
+        if fields is None:
+            fields = {name: np.zeros(shape, dtype=dtype)
+                      for name, dtype in FIELDS}
+        for name in FIELD_NAMES:
+            setattr(self, name, fields[name])
+
+    @classmethod
+    def empty(cls, shape):
+        """Create a grid of the given shape with every cell empty"""
+        return cls(shape)
+
+    @classmethod
+    def from_cells(cls, cells):
+        """Build a TerrainGrid from a numpy object array of TerrainCells"""
+        cells = np.asarray(cells, dtype=object)
+        grid = cls(cells.shape)
+        for index in np.ndindex(cells.shape):
+            grid[index] = cells[index]
+        return grid
+
+    @property
+    def fields(self):
+        """dict: the field arrays keyed by name"""
+        return {name: getattr(self, name) for name in FIELD_NAMES}
+
+    @property
+    def burn_rate(self):
+        """numpy.ndarray: each cell's burn rate, from BURN_RATE_BY_CODE (NaN
+        where it is undefined)"""
+        return BURN_RATE_BY_CODE[self.type]
+
+    @property
+    def regen_rate(self):
+        """numpy.ndarray: each cell's regen rate, from REGEN_RATE_BY_CODE"""
+        return REGEN_RATE_BY_CODE[self.type]
+
+    @property
+    def shape(self):
+        return self.type.shape
+
+    @property
+    def ndim(self):
+        return self.type.ndim
+
+    @property
+    def size(self):
+        return self.type.size
+
+    @property
+    def nbytes(self):
+        """int: bytes used by the field arrays"""
+        return sum(getattr(self, name).nbytes for name in FIELD_NAMES)
+
+    def __str__(self):
+        return np.array_str(self.type)
+
+    def _wrap(self, fields):
+        return TerrainGrid(None, self.moisture_decay, self.burn_threshold,
+                           fields=fields)
+
+    def _is_cell_index(self, key):
+        if type(key) is not tuple or len(key) != self.ndim:
+            return False
+        # cell-at-a-time rules index with plain ints, checked before the
+        # much slower numbers.Integral (which also takes numpy integers)
+        for k in key:
+            if type(k) is not int and not isinstance(k, numbers.Integral):
+                return False
+        return True
+
+    def __getitem__(self, key):
+        """Return a TerrainCell view of a single cell, or a TerrainGrid
+        view of a region"""
+        if self._is_cell_index(key):
+            return TerrainCellView(self, key)
+        return self._wrap({name: getattr(self, name)[key]
+                           for name in FIELD_NAMES})
+
+    def __setitem__(self, key, value):
+        """Assign a region of the grid
+
+        Args:
+            key: any numpy index
+            value: a TerrainGrid of matching shape, a TerrainCell which is
+                broadcast over the region, or a plain number/None which
+                empties the region
+        """
+        if isinstance(value, TerrainGrid):
+            for name in FIELD_NAMES:
+                getattr(self, name)[key] = getattr(value, name)
+        elif isinstance(value, TerrainCell):
+            for name in FIELD_NAMES:
+                getattr(self, name)[key] = _to_field(name,
+                                                     getattr(value, name))
+        else:
+            for name in FIELD_NAMES:
+                getattr(self, name)[key] = _to_field(name, None)
+
+    def fill(self, value):
+        """Set every cell to the given value (see __setitem__)"""
+        self[...] = value
+
+    def copy(self):
+        """Return a deep copy of the grid"""
+        return self._wrap({name: getattr(self, name).copy()
+                           for name in FIELD_NAMES})
+
+    def resized(self, newrows, newcols):
+        """Return a copy scaled to the given size, retaining as many cells as
+        possible (the TerrainGrid counterpart of utils.scale_array)"""
+        oldrows, oldcols = self.shape
+        new = TerrainGrid((newrows, newcols), self.moisture_decay,
+                          self.burn_threshold)
+        copyrows = min(oldrows, newrows)
+        copycols = min(oldcols, newcols)
+        new[:copyrows, :copycols] = self[:copyrows, :copycols]
+        return new
+
+    def coarsened(self, factor):
+        """Return a grid factor times smaller in each dimension, each cell
+        standing for a factor x factor block of this one (the last blocks
+        are padded by repeating the edge cells)
+
+        A block takes the terrain type most of its cells have, except that
+        any ignition source or town cell makes it one, so the fire still
+        starts and the town can still be reached. Its elevation is the mean
+        over the block; its other fields are those of the block's first cell
+        of the chosen type.
+        """
+        if factor == 1:
+            return self.copy()
+        rows, cols = self.shape
+        newrows, newcols = -(-rows // factor), -(-cols // factor)
+        pad = ((0, newrows * factor - rows), (0, newcols * factor - cols))
+
+        def blocks(field):
+            # (newrows, newcols, factor * factor) cells of each block
+            field = np.pad(field, pad, mode='edge')
+            return field.reshape(newrows, factor, newcols, factor).swapaxes(
+                1, 2).reshape(newrows, newcols, factor * factor)
+
+        types = blocks(self.type)
+        codes = np.unique(types)
+        counts = np.stack([(types == code).sum(axis=-1) for code in codes])
+        chosen = codes[np.argmax(counts, axis=0)]
+        for code in (_TOWN, _SOURCE):
+            chosen = np.where((types == code).any(axis=-1), code, chosen)
+        first = np.argmax(types == chosen[..., np.newaxis], axis=-1)
+        fields = {name: np.take_along_axis(
+                      blocks(getattr(self, name)), first[..., np.newaxis],
+                      axis=-1)[..., 0]
+                  for name in FIELD_NAMES}
+        fields["elevation"] = blocks(self.elevation).mean(
+            axis=-1, dtype=np.float64).astype(self.elevation.dtype)
+        return self._wrap(fields)
+
+    def get_ignition_prob(self, source_types):
+        """Array version of TerrainCell.get_ignition_prob
+
+        Args:
+            source_types (numpy.ndarray): terrain codes of the igniting cells,
+                broadcastable against the grid
+        """
+        return IGNITION_PROB_BY_CODE[source_types, self.type]
+
+    def get_slope_effect(self, source_elevation):
+        """Array version of TerrainCell.get_slope_effect"""
+        return slope_effect(self.elevation, source_elevation)
+
+    def ignite(self, mask):
+        """Array version of TerrainCell.ignite, applied where mask is set"""
+        mask = mask & ~self.burnt
+        always = mask & ((self.type == _TOWN) | (self.type == _SOURCE))
+        self.burning[always] = True
+        self.burn_duration[always] = 0
+
+        flammable = nonzero(mask & ~always & (self.type != _LAKE) &
+                            (self.type != 0) &
+                            (self.moisture < self.burn_threshold))
+        fuelled = self._spend_fuel(flammable)
+        lit = tuple(index[fuelled] for index in flammable)
+        self.burning[lit] = True
+        self.burn_duration[lit] = 0
+
+    def burn(self, mask, rng=None):
+        """Array version of TerrainCell.burn, applied where mask is set
+
+        Args:
+            mask (numpy.ndarray): boolean array of the cells to burn
+            rng: source of the uniform draws that put sources out, anything
+                with a random(size) method (default a fresh "spread" stream,
+                see seeding.fresh_stream)
+        """
+        sources = np.flatnonzero(mask & (self.type == _SOURCE))
+        if sources.size:
+            rng = fresh_stream("spread") if rng is None else rng
+            out = sources[rng.random(sources.size) <= 0.2]
+            self.burning.flat[out] = False
+
+        burning = nonzero(mask & (self.type != _TOWN) &
+                          (self.type != _SOURCE))
+        fuelled = self._spend_fuel(burning)
+        self.burn_duration[tuple(index[fuelled] for index in burning)] += 1
+
+        # burning finished, enter burnt state
+        finished = tuple(index[~fuelled] for index in burning)
+        self.burning[finished] = False
+        self.burnt[finished] = True
+        self.burnt_timer[finished] = 0
+        self.burn_duration[finished] = 0
+
+    def _spend_fuel(self, cells):
+        """Take a step's burn rate off the fuel of each of cells (a tuple of
+        index arrays), emptying those without enough, and return which of
+        them had enough"""
+        burn_rate = BURN_RATE_BY_CODE[self.type[cells]]
+        fuel = self.fuel[cells]
+        fuelled = fuel >= burn_rate
+        self.fuel[cells] = np.where(fuelled, fuel - burn_rate, 0.0)
+        return fuelled
+
+    def drop_water(self, mask, max_moisture=1):
+        """Array version of TerrainCell.drop_water, applied where mask is
+        set"""
+        self.waterdropped[mask] = True
+        # water drop has no effect on burnt cells, towns or lakes
+        mask = mask & ~self.burnt
+        self.burning[mask & (self.type == _SOURCE)] = True
+
+        wetted = (mask & (self.type != _TOWN) & (self.type != _LAKE) &
+                  (self.type != _SOURCE) & (self.type != 0))
+        doused = wetted & self.burning
+        self.burning[doused] = False
+        self.moisture[doused] = np.minimum(
+            self.moisture[doused] + 0.5 * max_moisture, max_moisture)
+        self.moisture[wetted & ~doused] = max_moisture
+
+    def strip_moisture(self):
+        """Array version of TerrainCell._strip_moisture
+
+        Only the cells with any moisture are touched, usually just those
+        water has been dropped on.
+        """
+        wet = nonzero(self.moisture)
+        multiplier = np.where(self.burning[wet], 1, 0.25)
+        self.moisture[wet] = np.maximum(
+            0, self.moisture[wet] - multiplier * self.moisture_decay)
+
+    def state_changes(self, other):
+        """Boolean array of the cells whose state index differs in other, a
+        grid of the same shape"""
+        return ((self.type != other.type) |
+                (self.waterdropped != other.waterdropped) |
+                (self.burning != other.burning) |
+                (self.burnt != other.burnt))
+
+    def state_indices(self):
+        """Map every cell to its integer display state
+
+        The array equivalent of terrain_cell.cell_to_state_index, empty cells
+        map to -1.
+        """
+        base = (self.type.astype(np.int16) - 1) * 4
+        offset = np.select([self.waterdropped, self.burning, self.burnt],
+                           [2, 1, 3], default=0).astype(np.int16)
+        index = base + offset
+        index[self.type == 0] = -1
+        return index
+
+
+def nonzero(arr):
+    """np.nonzero, found through np.flatnonzero which is several times
+    faster on large multidimensional arrays"""
+    return np.unravel_index(np.flatnonzero(arr), arr.shape)
+
+
+def slope_effect(elevation, source_elevation):
+    """Array version of TerrainCell.get_slope_effect for cells at elevation
+    being ignited (or seeded) from cells at source_elevation"""
+    slope = elevation - source_elevation
+    with np.errstate(over='ignore'):
+        effect = 0.5 + (0.75 / (0.5 + np.exp(-12 * (slope / 100.0))))
+    effect = np.where(slope == 0, 1.0, effect)
+    return np.where(np.abs(slope) > 50, 0.0, effect)
+
+
+def _to_field(name, value):
+    """Convert a TerrainCell attribute value to its stored representation"""
+    if name == "type":
+        return 0 if value is None else value.value
+    return 0 if value is None else value
+
+
+def _from_field(name, value):
+    """Convert a stored value back to its TerrainCell attribute value"""
+    if name == "type":
+        return _TYPES_BY_CODE[value]
+    return value.item()
+
+
+def _field_property(name):
+    def getter(self):
+        return _from_field(name, getattr(self._grid, name)[self._index])
+
+    def setter(self, value):
+        getattr(self._grid, name)[self._index] = _to_field(name, value)
+    return property(getter, setter)
+
+
+class TerrainCellView(TerrainCell):
+    """A TerrainCell whose attributes live in a TerrainGrid
+
+    Reads and writes go straight through to the grid's arrays, so all of the
+    TerrainCell methods (ignite, burn, drop_water...) update the grid in
+    place. copy() returns an ordinary, detached TerrainCell.
+    """
+
+    def __init__(self, grid, index):
+        self._grid = grid
+        self._index = index
+
+    @property
+    def moisture_decay_rate(self):
+        return self._grid.moisture_decay
+
+    @property
+    def burn_threshold(self):
+        return self._grid.burn_threshold
+
+    @property
+    def burn_rate(self):
+        return _table_rate(BURN_RATE_BY_CODE, self._grid.type[self._index])
+
+    @property
+    def regen_rate(self):
+        return _table_rate(REGEN_RATE_BY_CODE, self._grid.type[self._index])
+
+    def __repr__(self):
+        return "TerrainCellView({}, {})".format(self.type, self._index)
+
+
+def _table_rate(rates, code):
+    # a rate from one of the compiled tables, None where it is undefined
+    rate = rates[code]
+    return None if math.isnan(rate) else float(rate)
+
+
+for _name in FIELD_NAMES:
+    setattr(TerrainCellView, _name, _field_property(_name))
@@ -0,0 +1,110 @@
+import os
+import numpy as np
+
+
+def count_path(path):
+    """The file holding the number of frames written to a streamed timeline"""
+    return path + '.count'
+
+
+class TimelineWriter(object):
+    """Streams the frames of a run to a memory-mapped .npy file
+
+    Room for every frame is made on disk up front and each frame is written
+    straight into the mapped file as the CA produces it, so the run never
+    holds more than a few frames in memory. The number of frames written so
+    far is kept beside it (see count_path), so a MappedTimeline can follow
+    the run while it is still going.
+    """
+
+    def __init__(self, path, num_frames, shape, dtype):
+        """Create the file for a timeline
+
+        Args:
+            path (str): the file to write, used as given (no extension added)
+            num_frames (int): the most frames the run can produce
+            shape (tuple): the shape of a frame
+            dtype (numpy.dtype): the dtype to store frames as
+        """
+        self.path = path
+        self.count = 0
+        self.frames = np.lib.format.open_memmap(
+            path, mode='w+', dtype=dtype, shape=(num_frames,) + tuple(shape))
+        self._count_file = open(count_path(path), 'w')
+        self._write_count()
+
+    def __len__(self):
+        return self.count
+
+    def __setitem__(self, index, frame):
+        """Write frame index, which must not be past the last frame written"""
+        self.frames[index] = frame
+        if index >= self.count:
+            self.count = index + 1
+            self._write_count()
+
+    def __getitem__(self, key):
+        return self.frames[:self.count][key]
+
+    def _write_count(self):
+        self._count_file.seek(0)
+        self._count_file.write("{:<20d}".format(self.count))
+        self._count_file.flush()
+
+    def close(self):
+        """Flush the frames to disk
+
+        Returns:
+            numpy.memmap: the frames written
+        """
+        self.frames.flush()
+        self._count_file.close()
+        return self.frames[:self.count]
+
+
+class MappedTimeline(object):
+    """Read only view of a timeline streamed by TimelineWriter
+
+    Frames are paged in from the memory-mapped file as they are indexed, so
+    a timeline of any length can be played back. The length is reread from
+    the count file, so frames appear as a run that is still going writes
+    them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = np.load(path, mmap_mode='r')
+
+    def __len__(self):
+        try:
+            with open(count_path(self.path)) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            # no count, the file holds a complete timeline
+            return len(self.frames)
+
+    def __getitem__(self, key):
+        return self.frames[:len(self)][key]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frames[i]
+
+    @property
+    def shape(self):
+        return (len(self),) + self.frames.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.frames.dtype
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+
+def is_mapped_timeline(path):
+    """Whether path holds a timeline written by TimelineWriter"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(6) == np.lib.format.MAGIC_PREFIX
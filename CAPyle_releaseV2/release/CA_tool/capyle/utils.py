@@ -4,8 +4,14 @@ import subprocess
 import time
 import platform
 import os.path
-import tkinter as tk
 import numpy as np
+from CA_tool.capyle.timeline import (MappedTimeline, is_mapped_timeline,
+                                    count_path)
+try:
+    import tkinter as tk
+except ImportError:
+    # only the GUI helpers need Tk
+    tk = None
 
 
 def prerun_ca(ca_config):
@@ -40,13 +46,18 @@ def prerun_ca(ca_config):
         return ca_config
 
 
-def run_ca(ca_config):
+def run_ca(ca_config, on_frames=None, poll_interval=0.2):
     """Run the ca in a subprocess, saving the timestep to a timeline.
     This timeline is then saved to disk and loaded back in this process
 
     Args:
         ca_config (CAConfig): The config object to be saved
             and passed to the CA file.
+        on_frames (callable): for a run that streams its timeline to
+            ca_config.timeline_path (see Grid.run), called as
+            on_frames(timeline) with a MappedTimeline of the frames written
+            so far each time more are written, while the run is going
+        poll_interval (float): seconds between checks for new frames
 
     Returns:
         CAConfig: The updated config after values have been updated
@@ -55,9 +66,23 @@ def run_ca(ca_config):
     """
     ca_config.save()
     args = [sys.executable, ca_config.filepath, ca_config.path]
+    # a timeline left by an earlier run is not followed
+    stale = _stat(count_path(ca_config.timeline_path))
     ca = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    out_bytes, errors_bytes = ca.communicate()
+    timeline, frames = None, 0
+    while True:
+        try:
+            out_bytes, errors_bytes = ca.communicate(
+                timeout=None if on_frames is None else poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if timeline is None:
+            timeline = _streamed_timeline(ca_config.timeline_path, stale)
+        if timeline is not None and len(timeline) > frames:
+            frames = len(timeline)
+            on_frames(timeline)
     errors_str = errors_bytes.decode("utf-8")
     out_str = out_bytes.decode("utf-8")
 
@@ -74,10 +99,31 @@ def run_ca(ca_config):
         if not out_str == '':
             print(out_str)
         ca_config = load(ca_config.path)
-        timeline = load(ca_config.timeline_path)
+        timeline = load_timeline(ca_config.timeline_path)
         return ca_config, timeline
 
 
+def _stat(path):
+    # (inode, modification time) of path, None if it does not exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _streamed_timeline(path, stale):
+    """A MappedTimeline of the timeline a run is streaming to path, or None
+    if the run has not started writing it (its count file is missing or
+    still the stale one)"""
+    if _stat(count_path(path)) in (None, stale):
+        return None
+    try:
+        return MappedTimeline(path)
+    except (OSError, ValueError):
+        return None
+
+
 def verify_gens(num_gens):
     """Asssert that the number of generations is above 0"""
     if num_gens < 1:
@@ -129,6 +175,68 @@ def save(obj, path):
         pickle.dump(obj, output, -1)
 
 
+def timeline_dtype(states):
+    """The smallest dtype that holds every one of the given states, for
+    storing timeline frames compactly
+
+    Example:
+        range(24) -> uint8
+        [-1, 0, 1] -> int8
+        [0.0, 0.5, 1.0] -> float64
+    """
+    states = np.asarray(states)
+    if states.size and np.issubdtype(states.dtype, np.integer):
+        low, high = int(states.min()), int(states.max())
+        if low < 0:
+            # the signed type that also holds -high - 1 holds high
+            high = -high - 1
+        return np.result_type(np.min_scalar_type(low),
+                              np.min_scalar_type(high))
+    if np.issubdtype(states.dtype, np.number):
+        return states.dtype
+    return np.dtype(object)
+
+
+def save_timeline(timeline, path, compress=False):
+    """Save a timeline to disk
+
+    Args:
+        timeline (numpy.ndarray): the (frames, rows, cols) grid states
+        path (str): the file to write, used as given (no extension added)
+        compress (bool): store the frames zlib compressed in npz format. Each
+            integer frame is stored as its difference from the one before,
+            which is almost all zeros, so a run compresses far better than
+            frame by frame. Otherwise the timeline is pickled as by save.
+    """
+    if not compress:
+        save(timeline, path)
+        return
+    timeline = np.asarray(timeline)
+    delta = np.issubdtype(timeline.dtype, np.integer)
+    frames = timeline.copy() if delta else timeline
+    if delta:
+        # wraps around for unsigned types, undone exactly by load_timeline
+        frames[1:] -= timeline[:-1]
+    with open(path, 'wb') as output:
+        np.savez_compressed(output, frames=frames, delta=delta)
+
+
+def load_timeline(path):
+    """Load a timeline saved by save_timeline, compressed or not, or streamed
+    to disk by Grid.run, which is memory-mapped rather than read in"""
+    if is_mapped_timeline(path):
+        return MappedTimeline(path)
+    with open(path, 'rb') as input:
+        compressed = input.read(2) == b'PK'
+    if not compressed:
+        return load(path)
+    with np.load(path) as data:
+        frames = data['frames']
+        if data['delta']:
+            np.cumsum(frames, axis=0, dtype=frames.dtype, out=frames)
+    return frames
+
+
 def get_metadata(filepath):
     """Parse given description file and infer the dimensionality and title"""
     title, dimensions = None, None
@@ -237,6 +345,25 @@ def scale_array(old, newrows, newcols):
     return new
 
 
+def copy_into(grid, out=None):
+    """Start the next state of a grid, for transition functions
+
+    Args:
+        grid (numpy.ndarray): The current grid (or TerrainGrid)
+        out (numpy.ndarray): A preallocated grid of the same shape to write
+            the next state into, as Grid2D passes to double buffered
+            transition functions
+
+    Returns:
+        numpy.ndarray: out holding a copy of grid, or a new copy of grid if
+            out is None
+    """
+    if out is None:
+        return grid.copy()
+    out[:, :] = grid
+    return out
+
+
 def int_to_binary(n):
     """Convert an integer to an 8 bit binary array
 
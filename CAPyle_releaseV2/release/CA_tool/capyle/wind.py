@@ -1,60 +1,160 @@
-
-import math
-import random
-
-class Wind():
-    def __init__(self, mean_speed: float, direction: int, weibull_k: float, weibull_c: float):
-        self.mean_speed = mean_speed
-        self.direction = direction
-        self.weibull_k = weibull_k
-        self.weibull_c = weibull_c
-
-    def sample_wind_speed(self):
-        u = random.random()
-        return self.weibull_c * (-math.log(1 - u)) ** (1 / self.weibull_k)
-    
-    def _direction_difference(self, wind_dir, fire_dir):
-        diff = abs(wind_dir - fire_dir) % 360
-        if diff > 180:
-            diff = 360 - diff
-
-        return diff
-    
-    def fire_spread_contribution(self, fire_direction: int) -> float:
-        w = self.sample_wind_speed()
-        diff_deg = self._direction_difference(self.direction, fire_direction)
-        theta = math.radians(diff_deg)
-
-        f = min(w / 30.0, 1.0)
-
-        # Gaussian
-        sigma = 1.0 * (1 - f) + 0.3
-        y = 0.1 + 0.9 * math.exp(-(theta / sigma)**2)
-
-        # Scale
-        y *= 0.5 + 0.5 * f
-
-        return y
-
-if __name__ == "__main__":
-    speeds = [13.5, 13.9, 15.5, 15.5, 14.6, 14, 13.1, 12.5, 13.5, 13.5, 13.7, 13.4, 13.9]
-    k, c = 37.284, 14.778
-
-    print(f"Weibull K: {k:.3f}")
-    print(f"Weibull C: {c:.3f}")
-
-    mean_speed = sum(speeds)/len(speeds)
-    print(f"Mean Speed: {mean_speed:.3f}")
-
-    wind = Wind(mean_speed, direction=0, weibull_k=k, weibull_c=c)
-
-    fire_dirs = [0, 45, 90, 135, 180, 225, 270, 315]
-
-    for fd in fire_dirs:
-        probs = [wind.fire_spread_contribution(fd) for _ in range(10)]
-        avg_prob = sum(probs) / len(probs)
-        print(f"  Fire direction {fd:3d}° → mean contribution: {avg_prob:.3f}")
-
-    print("\nExample random wind speeds:")
-    for _ in range(5):
+
+import math
+import numpy as np
+from .seeding import fresh_stream
+
+class Wind():
+    def __init__(self, mean_speed: float, direction: int, weibull_k: float, weibull_c: float, rng=None):
+        self.mean_speed = mean_speed
+        self.direction = direction
+        self.weibull_k = weibull_k
+        self.weibull_c = weibull_c
+        # source of the uniform draws, a numpy Generator (eg. the "wind"
+        # stream of seeding.run_streams) or anything with a random(size)
+        # method, by default a fresh "wind" stream
+        self.rng = fresh_stream("wind") if rng is None else rng
+        # wind speeds drawn up front by set_schedule, see scheduled_speeds
+        self.schedule = None
+        self.tile_size = None
+        self.shape = None
+        self._angles = (None, None, None)
+
+    def sample_wind_speed(self):
+        u = self.rng.random()
+        return self.weibull_c * (-math.log(1 - u)) ** (1 / self.weibull_k)
+    
+    def _direction_difference(self, wind_dir, fire_dir):
+        diff = abs(wind_dir - fire_dir) % 360
+        if diff > 180:
+            diff = 360 - diff
+
+        return diff
+    
+    def fire_spread_contribution(self, fire_direction: int) -> float:
+        w = self.sample_wind_speed()
+        diff_deg = self._direction_difference(self.direction, fire_direction)
+        theta = math.radians(diff_deg)
+
+        f = min(w / 30.0, 1.0)
+
+        # Gaussian
+        sigma = 1.0 * (1 - f) + 0.3
+        y = 0.1 + 0.9 * math.exp(-(theta / sigma)**2)
+
+        # Scale
+        y *= 0.5 + 0.5 * f
+
+        return y
+
+    def sample_wind_speeds(self, size, rng=None):
+        """Array version of sample_wind_speed, draws size Weibull samples
+        from rng (default self.rng)"""
+        u = (self.rng if rng is None else rng).random(size)
+        return self.weibull_c * (-np.log(1 - u)) ** (1 / self.weibull_k)
+
+    def direction_angles(self, fire_directions):
+        """Angle in radians between the wind and each fire direction
+
+        The angles for the last directions asked for are kept, so the
+        directions of the 8 neighbours are only worked out once per wind.
+        """
+        directions, wind_direction, angles = self._angles
+        if (wind_direction != self.direction or directions is None or
+                not np.array_equal(directions, fire_directions)):
+            diff_deg = np.abs(self.direction - np.asarray(fire_directions)) % 360
+            diff_deg = np.where(diff_deg > 180, 360 - diff_deg, diff_deg)
+            angles = np.radians(diff_deg)
+            self._angles = (np.array(fire_directions), self.direction, angles)
+        return angles
+
+    def angle_contributions(self, angles, wind_speeds):
+        """fire_spread_contribution for arrays of angles from
+        direction_angles and of wind speeds, broadcast against each other"""
+        f = np.minimum(wind_speeds / 30.0, 1.0)
+
+        # Gaussian
+        sigma = 1.0 * (1 - f) + 0.3
+        y = 0.1 + 0.9 * np.exp(-(angles / sigma)**2)
+
+        # Scale
+        y *= 0.5 + 0.5 * f
+
+        return y
+
+    def fire_spread_contributions(self, fire_directions, wind_speeds):
+        """Array version of fire_spread_contribution
+
+        Args:
+            fire_directions: fire travel directions in degrees, broadcastable
+                against wind_speeds
+            wind_speeds (numpy.ndarray): a wind speed sample for each
+                contribution, eg. from sample_wind_speeds
+        """
+        diff_deg = np.abs(self.direction - np.asarray(fire_directions)) % 360
+        diff_deg = np.where(diff_deg > 180, 360 - diff_deg, diff_deg)
+        return self.angle_contributions(np.radians(diff_deg), wind_speeds)
+
+    def set_schedule(self, num_steps, shape=None, tile_size=None):
+        """Draw the wind speeds for a run up front
+
+        Rather than a new speed for every neighbour of every cell, the wind
+        then blows at one speed per step, or at one speed per step for each
+        tile of tile_size x tile_size cells.
+
+        Args:
+            num_steps (int): number of steps to draw speeds for, later steps
+                reuse the schedule from the start
+            shape (tuple): the grid shape, needed for per tile speeds
+            tile_size (int): side of the tiles in cells, one speed per step
+                if not given
+        """
+        if tile_size is None:
+            self.schedule = self.sample_wind_speeds(num_steps)
+        else:
+            tiles = (-(-shape[0] // tile_size), -(-shape[1] // tile_size))
+            self.schedule = self.sample_wind_speeds((num_steps,) + tiles)
+        self.tile_size = tile_size
+        self.shape = shape
+
+    def clear_schedule(self):
+        """Go back to drawing a speed for every contribution"""
+        self.schedule = self.tile_size = None
+
+    def scheduled_speeds(self, time_step):
+        """The wind speed for time_step (from 1) from the schedule
+
+        Returns:
+            a single speed, a (rows, cols) array of speeds for a per tile
+            schedule, or None if there is no schedule
+        """
+        if self.schedule is None:
+            return None
+        speeds = self.schedule[(time_step - 1) % len(self.schedule)]
+        if self.tile_size is None:
+            return speeds
+        rows, cols = self.shape
+        speeds = speeds.repeat(self.tile_size, 0).repeat(self.tile_size, 1)
+        return speeds[:rows, :cols]
+
+if __name__ == "__main__":
+    speeds = [13.5, 13.9, 15.5, 15.5, 14.6, 14, 13.1, 12.5, 13.5, 13.5, 13.7, 13.4, 13.9]
+    k, c = 37.284, 14.778
+
+    print(f"Weibull K: {k:.3f}")
+    print(f"Weibull C: {c:.3f}")
+
+    mean_speed = sum(speeds)/len(speeds)
+    print(f"Mean Speed: {mean_speed:.3f}")
+
+    wind = Wind(mean_speed, direction=0, weibull_k=k, weibull_c=c)
+
+    fire_dirs = [0, 45, 90, 135, 180, 225, 270, 315]
+
+    for fd in fire_dirs:
+        probs = [wind.fire_spread_contribution(fd) for _ in range(10)]
+        avg_prob = sum(probs) / len(probs)
+        print(f"  Fire direction {fd:3d}° → mean contribution: {avg_prob:.3f}")
+
+    print("\nExample random wind speeds:")
+    for _ in range(5):
         print(f"  {wind.sample_wind_speed():.2f} m/s")
\ No newline at end of file
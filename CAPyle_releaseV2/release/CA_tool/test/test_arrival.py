@@ -0,0 +1,76 @@
+import sys, inspect, unittest
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.terrain_cell import TerrainCell, TerrainType
+from capyle.terrain_grid import TerrainGrid
+from capyle.wind import Wind
+from capyle.arrival import (arrival_times, town_arrival, wet_steps,
+                            expected_spread_probabilities,
+                            front_spread_probabilities)
+
+
+def plain(shape=(15, 15)):
+    """Chaparral burning in the middle, with a lake and a town"""
+    grid = TerrainGrid(shape)
+    grid[:, :] = TerrainCell(TerrainType.CHAPARRAL)
+    grid[2:4, 2:4] = TerrainCell(TerrainType.LAKE)
+    grid[-1, -1] = TerrainCell(TerrainType.TOWN)
+    grid[7, 7] = TerrainCell(TerrainType.SOURCE, burning=True)
+    return grid
+
+
+class TestArrivalTimes(unittest.TestCase):
+    def setUp(self):
+        self.grid = plain()
+        self.wind = Wind(13.9, 0, 37.284, 14.778)
+
+    def test_spread_probabilities(self):
+        prob = expected_spread_probabilities(self.grid, self.wind)
+        self.assertEqual(prob.shape, (8, 15, 15))
+        # nothing spreads into the lake, the burning cell or off the grid
+        self.assertFalse(prob[:, 2:4, 2:4].any())
+        self.assertFalse(prob[:, 7, 7].any())
+        self.assertFalse(prob[:3, 0].any())
+        front = front_spread_probabilities(prob)
+        self.assertTrue(np.all(front >= prob))
+        self.assertTrue(np.all((front > 0) == (prob > 0)))
+
+    def test_arrival(self):
+        times = arrival_times(self.grid, self.wind)
+        self.assertEqual(times[7, 7], 0)
+        self.assertTrue(np.all(np.isinf(times[2:4, 2:4])))
+        # fire takes longer to reach cells further away
+        self.assertTrue(np.all(np.diff(times[7, 7:]) > 0))
+        self.assertTrue(np.all(np.diff(times[7, :8]) < 0))
+        self.assertEqual(np.isfinite(times).sum(), 15 * 15 - 4)
+
+    def test_town(self):
+        times = arrival_times(self.grid, self.wind)
+        self.assertEqual(town_arrival(self.grid, self.wind), times[-1, -1])
+        # stopping at the town leaves later cells unreached
+        town = self.grid.type == TerrainType.TOWN.value
+        stopped = arrival_times(self.grid, self.wind, targets=town)
+        self.assertEqual(stopped[-1, -1], times[-1, -1])
+        self.assertTrue(np.isinf(stopped[0, 0]))
+
+    def test_water_drops(self):
+        times = arrival_times(self.grid, self.wind)
+        # water on the cell east of the fire before it can get there
+        plan = {"0": [[7, 8]]}
+        wet = arrival_times(self.grid, self.wind, plan)
+        self.assertGreater(wet[7, 8], times[7, 8])
+        self.assertLessEqual(wet[7, 8], wet_steps(self.grid) +
+                             times[7, 8])
+        # too late to make a difference
+        late = arrival_times(self.grid, self.wind, {"200": [[7, 8]]})
+        self.assertTrue(np.array_equal(late, times))
+
+
+if __name__ == '__main__':
+    unittest.main()
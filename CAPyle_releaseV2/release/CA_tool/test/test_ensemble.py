@@ -0,0 +1,111 @@
+import sys, inspect, unittest
+import numpy as np
+from functools import partial
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.ca import Grid2D, CAConfig
+from capyle.terrain_cell import TerrainCell, TerrainType
+from capyle.terrain_grid import TerrainGrid, FIELD_NAMES
+from capyle.wind import Wind
+from capyle.fire_spread import frontier_transition_func
+from capyle.ensemble import FireEnsemble
+from capyle.seeding import run_streams
+
+
+def forest(shape=(12, 12)):
+    """Vegetation with some slopes and a town, burning in one corner"""
+    rng = np.random.RandomState(4)
+    grid = TerrainGrid(shape)
+    for x in range(shape[0]):
+        for y in range(shape[1]):
+            terrain = [TerrainType.CHAPARRAL, TerrainType.DENSE_FOREST,
+                       TerrainType.CANYON_SCRUBLAND][rng.randint(3)]
+            grid[x, y] = TerrainCell(terrain,
+                                     elevation=rng.choice([0, 10, -30]))
+    grid[-2:, -2:] = TerrainCell(TerrainType.TOWN)
+    grid[0, 0] = TerrainCell(TerrainType.SOURCE, burning=True)
+    return grid
+
+
+class TestFireEnsemble(unittest.TestCase):
+    def test_rerun_replica(self):
+        # any replica can be rerun on its own from its seed
+        ensemble = FireEnsemble(forest(), 4, Wind(13.9, 30, 37.284, 14.778),
+                                seed=7)
+        for _ in range(12):
+            ensemble.step()
+        for replica in (0, 3):
+            streams = run_streams(ensemble.replica_seed(replica))
+            wind = Wind(13.9, 30, 37.284, 14.778, rng=streams["wind"])
+            grid = forest()
+            for t in range(1, 13):
+                grid, _ = frontier_transition_func(grid, None, None, t, wind,
+                                                   rng=streams["spread"])
+            self.assertGreater((grid.burning | grid.burnt).sum(), 5)
+            for name in FIELD_NAMES:
+                self.assertTrue(np.allclose(
+                    getattr(ensemble.grid, name)[replica],
+                    getattr(grid, name), equal_nan=True), name)
+
+    def test_seeded(self):
+        runs = [FireEnsemble(forest(), 3, Wind(13.9, 30, 37.284, 14.778),
+                             seed=seed).run(40) for seed in (5, 5, 6)]
+        self.assertTrue(np.array_equal(runs[0], runs[1]))
+        self.assertFalse(np.array_equal(runs[0], runs[2]))
+
+    def test_replicas_independent(self):
+        ensemble = FireEnsemble(forest(), 8, Wind(13.9, 30, 37.284, 14.778),
+                                seed=0)
+        for _ in range(6):
+            ensemble.step()
+        burning = ensemble.grid.burning.reshape(8, -1)
+        self.assertGreater(len(np.unique(burning, axis=0)), 1)
+
+    def test_results(self):
+        ensemble = FireEnsemble(forest(), 5, Wind(13.9, 30, 37.284, 14.778),
+                                seed=1)
+        steps, areas = ensemble.run(300)
+        for replica, (step, area) in enumerate(zip(steps, areas)):
+            if step < 0:
+                # only a fire that burnt out never reaches the town
+                self.assertFalse(ensemble.grid.burning[replica].any())
+                self.assertEqual(area, ensemble.reached()[replica])
+            else:
+                self.assertGreater(area, 1)
+        self.assertTrue((steps > 0).any())
+        self.assertLessEqual(ensemble.time_step, 301)
+
+    def test_steps_match_grid_run(self):
+        # run numbers the steps as Grid.run does, so a replica's step is
+        # what get_results gives for the same run
+        ensemble = FireEnsemble(forest(), 4, Wind(13.9, 30, 37.284, 14.778),
+                                seed=2)
+        steps, _ = ensemble.run(100)
+        self.assertTrue((steps > 0).any())
+        for replica, step in enumerate(steps):
+            streams = run_streams(ensemble.replica_seed(replica))
+            wind = Wind(13.9, 30, 37.284, 14.778, rng=streams["wind"])
+            config = CAConfig('test/testdescriptions/2dbasic.py')
+            config.states = list(range(len(TerrainType) * 4))
+            config.nhood_arr = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+            config.grid_dims = (12, 12)
+            config.wrap = False
+            config.dtype = TerrainGrid
+            config.initial_grid = forest()
+            config.num_generations = 100
+            g = Grid2D(config, (partial(frontier_transition_func,
+                                        rng=streams["spread"]), wind))
+            _, time_step = g.run(False)
+            if step >= 0:
+                self.assertEqual(step, time_step)
+                self.assertEqual(step, ensemble.town_ignition_step[replica]
+                                 + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
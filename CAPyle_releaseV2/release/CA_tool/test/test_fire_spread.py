@@ -0,0 +1,259 @@
+import sys, inspect, unittest
+from functools import partial
+from unittest import mock
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.ca import Grid2D, CAConfig
+from capyle.terrain_cell import TerrainCell, TerrainType
+from capyle.terrain_grid import TerrainGrid
+from capyle.wind import Wind
+from capyle.fire_spread import (FIRE_DIRECTIONS, spread_probability,
+                                spread_probabilities, drop_mask,
+                                slope_kernels,
+                                fire_front, fire_transition_func,
+                                frontier_transition_func)
+
+
+class FixedWind(Wind):
+    """Wind that always blows at the same speed"""
+    SPEED = 14.0
+
+    def sample_wind_speed(self):
+        return self.SPEED
+
+    def sample_wind_speeds(self, size):
+        return np.full(size, self.SPEED)
+
+
+def make_config(initial):
+    config = CAConfig('test/testdescriptions/2dbasic.py')
+    config.states = list(range(len(TerrainType) * 4))
+    config.nhood_arr = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+    config.grid_dims = initial.shape
+    config.wrap = False
+    config.dtype = TerrainGrid
+    config.initial_grid = initial
+    return config
+
+
+def mixed_terrain(shape=(12, 12)):
+    """A small grid of every terrain type, with slopes, moisture and fire"""
+    rng = np.random.RandomState(3)
+    grid = TerrainGrid(shape)
+    vegetation = [TerrainType.CHAPARRAL, TerrainType.DENSE_FOREST,
+                  TerrainType.CANYON_SCRUBLAND]
+    for x in range(shape[0]):
+        for y in range(shape[1]):
+            terrain = list(TerrainType)[rng.randint(len(TerrainType))]
+            grid[x, y] = TerrainCell(terrain,
+                                     elevation=rng.choice([0, 0, 10, -30, 60]),
+                                     burning=rng.rand() < 0.3)
+            if terrain in vegetation:
+                grid.moisture[x, y] = rng.choice([0, 0.2, 0.6])
+    grid.burnt[rng.rand(*shape) < 0.1] = True
+    return grid
+
+#----------------------------------------------------------------------
+
+class TestSpreadProbabilities(unittest.TestCase):
+    def test_matches_scalar_rule(self):
+        config = make_config(mixed_terrain())
+        g = Grid2D(config, fire_transition_func)
+        wind = FixedWind(13.9, 30, 37.284, 14.778)
+        ns = g.get_neighbour_states()
+        probs = spread_probabilities(g.grid, ns, wind,
+                                     np.full((8,) + g.grid.shape, wind.SPEED))
+
+        rows, cols = g.grid.shape
+        expected = np.zeros((8, rows, cols))
+        for x in range(rows):
+            for y in range(cols):
+                cell = g.grid[x, y]
+                if cell.burning or cell.burnt:
+                    continue
+                for idx, ns_array in enumerate(ns):
+                    neighbour = ns_array[x, y]
+                    if neighbour.burning:
+                        expected[idx, x, y] = spread_probability(
+                            cell, neighbour, FIRE_DIRECTIONS[idx], wind)
+        self.assertTrue(expected.any())
+        self.assertTrue(np.allclose(probs, expected, rtol=1e-5, atol=1e-7))
+
+    def test_slope_kernels(self):
+        g = Grid2D(make_config(mixed_terrain()), fire_transition_func)
+        kernels = slope_kernels(g.grid.elevation)
+        self.assertEqual(kernels.dtype, np.float32)
+        for kernel, ns in zip(kernels, g.get_neighbour_states()):
+            inside = ns.type != 0
+            expected = g.grid.get_slope_effect(ns.elevation)
+            self.assertTrue(np.allclose(kernel[inside], expected[inside]))
+            self.assertTrue(np.all(kernel[~inside] == 0))
+
+        wind = FixedWind(13.9, 30, 37.284, 14.778)
+        speeds = np.full((8,) + g.grid.shape, wind.SPEED)
+        ns = g.get_neighbour_states()
+        self.assertTrue(np.allclose(
+            spread_probabilities(g.grid, ns, wind, speeds, kernels),
+            spread_probabilities(g.grid, ns, wind, speeds), rtol=1e-5))
+
+    def test_fire_directions(self):
+        # one compass direction per neighbour, N W E S on the right angles
+        self.assertEqual(sorted(FIRE_DIRECTIONS), list(range(0, 360, 45)))
+        self.assertTrue(np.allclose(FIRE_DIRECTIONS[[1, 3, 4, 6]],
+                                    [0, 270, 90, 180]))
+
+#----------------------------------------------------------------------
+
+class TestFireFront(unittest.TestCase):
+    def setUp(self):
+        config = make_config(mixed_terrain())
+        self.g = Grid2D(config, fire_transition_func)
+        self.wind = FixedWind(13.9, 30, 37.284, 14.778)
+        self.probs = spread_probabilities(
+            self.g.grid, self.g.get_neighbour_states(), self.wind,
+            np.full((8,) + self.g.grid.shape, self.wind.SPEED))
+
+    def test_pairs_match_dense_neighbours(self):
+        g = self.g.grid
+        cells, sources, directions = fire_front(g)
+        self.assertTrue(np.all(g.burning[sources]))
+        pairs = set(zip(directions, *cells))
+        self.assertEqual(len(pairs), directions.size)
+
+        active = np.stack([ns.burning for ns in self.g.get_neighbour_states()])
+        active &= ~g.burning & ~g.burnt
+        self.assertEqual(pairs, set(zip(*np.nonzero(active))))
+
+    def test_frontier_probabilities(self):
+        # with the wind fixed, a step with every draw at 0 ignites exactly
+        # the cells with a non zero spread probability
+        rng = mock.Mock()
+        rng.random.side_effect = np.zeros
+        new_grid, _ = frontier_transition_func(self.g.grid, None, None, 1,
+                                               self.wind, rng=rng)
+        ignited = new_grid.burning & ~self.g.grid.burning
+        expected = (self.probs > 0).any(axis=0)
+        expected &= self.g.grid.moisture < self.g.grid.burn_threshold
+        self.assertTrue(expected.any())
+        self.assertTrue(np.array_equal(ignited, expected))
+
+#----------------------------------------------------------------------
+
+class TestArrayCellMethods(unittest.TestCase):
+    def setUp(self):
+        self.grid = mixed_terrain()
+        self.mask = np.random.RandomState(5).rand(*self.grid.shape) < 0.5
+
+    def assert_matches_cells(self, array_method, cell_method):
+        expected = self.grid.copy()
+        for index in zip(*np.nonzero(self.mask)):
+            cell = expected[index].copy()
+            cell_method(cell)
+            expected[index] = cell
+        array_method(self.grid)
+        for name, arr in self.grid.fields.items():
+            self.assertTrue(np.allclose(arr, expected.fields[name],
+                                        equal_nan=True), name)
+
+    def test_ignite(self):
+        self.assert_matches_cells(lambda g: g.ignite(self.mask),
+                                  TerrainCell.ignite)
+
+    def test_drop_water(self):
+        self.assert_matches_cells(lambda g: g.drop_water(self.mask),
+                                  TerrainCell.drop_water)
+
+    def test_burn(self):
+        # leave sources out, they burn out at random, and lakes never burn
+        self.mask &= self.grid.type != TerrainType.SOURCE.value
+        self.mask &= self.grid.type != TerrainType.LAKE.value
+        rng = np.random.default_rng(0)
+        self.assert_matches_cells(lambda g: g.burn(self.mask, rng),
+                                  lambda cell: cell.burn(rng))
+
+    def test_strip_moisture(self):
+        self.mask[:] = True
+        self.assert_matches_cells(lambda g: g.strip_moisture(),
+                                  TerrainCell._strip_moisture)
+
+#----------------------------------------------------------------------
+
+class TestFireTransition(unittest.TestCase):
+    def test_drop_mask(self):
+        plan = {"4": [[1, 2], [3, 3], [-1, 2], [2, 9]]}
+        mask = drop_mask(plan, 4, (5, 5))
+        self.assertEqual(mask.sum(), 2)
+        self.assertTrue(mask[1, 2] and mask[3, 3])
+        self.assertFalse(drop_mask(plan, 5, (5, 5)).any())
+        self.assertFalse(drop_mask(None, 4, (5, 5)).any())
+
+    def test_sources_always_spread(self):
+        # source to source ignition is certain whatever the wind
+        initial = TerrainGrid((5, 5))
+        initial[:, :] = TerrainCell(TerrainType.SOURCE)
+        initial[2, 2] = TerrainCell(TerrainType.SOURCE, burning=True)
+        wind = Wind(13.9, 0, 37.284, 14.778)
+        g = Grid2D(make_config(initial),
+                   (fire_transition_func, wind))
+        g.step()
+        ring = g.grid.burning[1:4, 1:4].copy()
+        ring[1, 1] = True
+        self.assertTrue(ring.all())
+        self.assertFalse(g.grid.burning[0].any())
+
+    def test_frontier_sources_always_spread(self):
+        initial = TerrainGrid((5, 5))
+        initial[:, :] = TerrainCell(TerrainType.SOURCE)
+        initial[0, 0] = TerrainCell(TerrainType.SOURCE, burning=True)
+        wind = Wind(13.9, 0, 37.284, 14.778)
+        g = Grid2D(make_config(initial), (frontier_transition_func, wind))
+        g.step()
+        # the source itself may have gone out
+        lit = g.grid.burning.copy()
+        lit[0, 0] = True
+        self.assertTrue(lit[:2, :2].all())
+        self.assertEqual(lit.sum(), 4)
+
+    def test_scheduled_wind(self):
+        # all that matters to sources is that something is burning nearby
+        initial = TerrainGrid((6, 6))
+        initial[:, :] = TerrainCell(TerrainType.SOURCE)
+        initial[2, 2] = TerrainCell(TerrainType.SOURCE, burning=True)
+        for transition in (fire_transition_func, frontier_transition_func):
+            wind = Wind(13.9, 0, 37.284, 14.778)
+            wind.set_schedule(5, shape=(6, 6), tile_size=4)
+            g = Grid2D(make_config(initial), (transition, wind))
+            g.step()
+            g.step()
+            # the ring lit on the second step, too new to have gone out
+            ring = np.zeros((6, 6), dtype=bool)
+            ring[0:5, 0:5] = True
+            ring[1:4, 1:4] = False
+            self.assertTrue(g.grid.burning[ring].all())
+
+    def test_town_ignition_recorded(self):
+        initial = TerrainGrid((3, 3))
+        initial[:, :] = TerrainCell(TerrainType.TOWN)
+        initial[0, 0] = TerrainCell(TerrainType.SOURCE, burning=True)
+        config = make_config(initial)
+        config.town_ignition_step = None
+        wind = Wind(13.9, 0, 37.284, 14.778)
+        # the source can go out before it lights a town, fix the draws
+        g = Grid2D(config, (partial(fire_transition_func,
+                                    rng=np.random.default_rng(1)),
+                            wind, None, config))
+        stopped = None
+        while not stopped and g.time_step < 200:
+            stopped = g.step()
+        self.assertTrue(stopped)
+        self.assertEqual(config.town_ignition_step, g.time_step)
+
+
+if __name__ == '__main__':
+    unittest.main()
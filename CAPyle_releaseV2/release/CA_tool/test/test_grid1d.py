@@ -1,5 +1,6 @@
 import unittest, inspect, sys
 import numpy as np
+from unittest import mock
 this_file_loc = (inspect.stack()[0][1])
 main_dir_loc = this_file_loc[:this_file_loc.index('test')]
 sys.path.append(main_dir_loc)
@@ -141,5 +142,32 @@ class TestInitialGridSet(unittest.TestCase, metaclass=TestInitialGridSetMeta):
 
 #----------------------------------------------------------------------
 
+class TestStateGrid(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig("test/testdescriptions/1dbasic.py")
+        self.config.num_generations = 20
+        self.config.states = 0,1
+        self.config.dimensions = 1
+        self.config.nhood_arr = [1,1,1]
+
+    def transfunc(self, grid, neighbourcounts):
+        return grid[0]
+
+    def test_numeric_grid(self):
+        g = Grid1D(self.config, self.transfunc)
+        g.grid[0, ::2] = 1
+        # the values are the states, no per cell mapping is needed
+        with mock.patch("numpy.vectorize", side_effect=AssertionError):
+            states = g.get_state_grid()
+        self.assertTrue(np.array_equal(states, g.grid))
+        self.assertFalse(np.shares_memory(states, g.grid))
+
+    def test_state_index_function(self):
+        self.config.state_index_function = lambda x: 1 - x
+        g = Grid1D(self.config, self.transfunc)
+        self.assertTrue(np.array_equal(g.get_state_grid(), 1 - g.grid))
+
+#----------------------------------------------------------------------
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,4 +1,6 @@
 import sys, inspect, unittest
+from functools import partial
+from unittest import mock
 import numpy as np
 this_file_loc = (inspect.stack()[0][1])
 main_dir_loc = this_file_loc[:this_file_loc.index('test')]
@@ -8,6 +10,7 @@ sys.path.append(main_dir_loc + 'capyle/ca')
 sys.path.append(main_dir_loc + 'capyle/guicomponents')
 
 from capyle.ca import Grid2D, Neighbourhood, CAConfig
+from capyle.ca import grid as grid_module
 
 #----------------------------------------------------------------------
 
@@ -155,5 +158,272 @@ class TestInitialGridSetMeta(type):
 class TestInitialGridSet(unittest.TestCase, metaclass=TestInitialGridSetMeta):
     pass
 
+#----------------------------------------------------------------------
+
+class TestNeighbourStates(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = 0,1
+        # von Neumann neighbourhood
+        self.config.nhood_arr = [[0,1,0],[1,1,1],[0,1,0]]
+        self.config.grid_dims = (4,4)
+        self.config.wrap = True
+        self.config.initial_grid = np.arange(16).reshape(4,4) % 2
+
+    def transfunc(self, grid, neighbour_states, neighbour_counts, time_step):
+        return 1 - grid, False
+
+    def test_mask(self):
+        g = Grid2D(self.config, self.transfunc)
+        self.assertEqual(list(g.neighbour_mask),
+                         [False, True, False, True, True, False, True, False])
+        ns = g.get_neighbour_states()
+        for n, inside in zip(ns, g.neighbour_mask):
+            self.assertEqual(n.shape, (4,4))
+            if not inside:
+                self.assertTrue(np.all(n == None))
+
+    def test_views_reused(self):
+        g = Grid2D(self.config, self.transfunc)
+        ns = g.get_neighbour_states()
+        self.assertEqual(ns[1][0, 0], g.grid[-1, 0])
+        g.step()
+        self.assertIs(g.get_neighbour_states(), ns)
+        # the views see the new states, including the wrap
+        self.assertEqual(ns[1][0, 0], g.grid[-1, 0])
+        self.assertTrue(np.array_equal(ns[4][:, :-1], g.grid[:, 1:]))
+        self.assertTrue(np.all(g.get_neighbour_states(False)[0] != None))
+
+    def test_masked_directions_not_counted(self):
+        totals = []
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            dead, live = neighbour_counts
+            totals.append(dead + live)
+            return grid, False
+        Grid2D(self.config, transfunc).step()
+        self.assertTrue(np.all(totals[0] == 4))
+
+#----------------------------------------------------------------------
+
+class Cell(object):
+    def __init__(self, alive):
+        self.alive = alive
+
+def cell_state(cell):
+    return int(cell.alive) if isinstance(cell, Cell) else -1
+
+class TestStateGrid(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = 0,1
+        self.config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        self.config.grid_dims = (5,5)
+        self.config.state_index_function = cell_state
+        self.config.dtype = object
+        initial = np.empty((5,5), dtype=object)
+        for x in range(5):
+            for y in range(5):
+                initial[x, y] = Cell(x == 2)
+        self.config.initial_grid = initial
+
+    def transfunc(self, grid, neighbour_states, neighbour_counts, time_step):
+        # a cell comes alive next to three live cells
+        new_grid = grid.copy()
+        for x, y in zip(*np.nonzero(neighbour_counts[1] == 3)):
+            new_grid[x, y] = Cell(True)
+        return new_grid, False
+
+    def test_object_grid(self):
+        for wrap in (True, False):
+            self.config.wrap = wrap
+            g = Grid2D(self.config, self.transfunc)
+            g.step()
+            expected = np.vectorize(cell_state)(g.grid)
+            self.assertEqual(g.get_state_grid().dtype, np.uint8)
+            self.assertTrue(np.array_equal(g.get_state_grid(), expected))
+            # the rows above and below fill in, all but their ends
+            # unless the grid wraps
+            self.assertEqual(expected.sum(), 15 if wrap else 11)
+
+#----------------------------------------------------------------------
+
+class TestDoubleBuffer(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = 0,1
+        self.config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        self.config.grid_dims = (4,6)
+        self.config.wrap = True
+        self.config.initial_grid = np.zeros((4,6))
+        self.config.initial_grid[1, 1] = 1
+        self.outs = []
+
+    def transfunc(self, grid, neighbour_states, neighbour_counts, time_step,
+                  shift=1, out=None):
+        self.outs.append(out)
+        out[:, :] = np.roll(grid, shift, axis=1)
+        return out, False
+    transfunc.writes_output = True
+
+    def test_buffers_swap(self):
+        g = Grid2D(self.config, partial(self.transfunc, shift=1))
+        self.assertTrue(g.double_buffered)
+        buffers = [g.wrapping_grid]
+        for _ in range(3):
+            g.step()
+            buffers.append(g.wrapping_grid)
+        self.assertIsNot(buffers[0], buffers[1])
+        self.assertIs(buffers[0], buffers[2])
+        self.assertIs(buffers[1], buffers[3])
+        # each step wrote into the grid that was not current
+        self.assertIs(self.outs[0].base, buffers[1])
+        self.assertTrue(g.grid[1, 4])
+        self.assertEqual(g.grid.sum(), 1)
+        # the neighbour views and the wrap follow the current grid
+        ns = g.get_neighbour_states()
+        self.assertTrue(ns[4][1, 3])
+        self.assertTrue(np.array_equal(g.wrapping_grid[0, 1:-1], g.grid[-1]))
+
+    def test_undeclared(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid + 1, False
+        g = Grid2D(self.config, transfunc)
+        self.assertFalse(g.double_buffered)
+        wrapping_grid = g.wrapping_grid
+        g.step()
+        self.assertIs(g.wrapping_grid, wrapping_grid)
+        self.assertEqual(g.grid.sum(), 25)
+
+    def test_fork(self):
+        g = Grid2D(self.config, partial(self.transfunc, shift=1))
+        g.step()
+        snapshot = g.snapshot()
+        self.assertFalse(g.advance(3))
+        self.assertTrue(g.grid[1, 5])
+        # back to the snapshot, carrying on with another rule
+        g.restore(snapshot)
+        self.assertEqual(g.time_step, 2)
+        self.assertTrue(g.grid[1, 2])
+        g.transition_func = partial(self.transfunc, shift=-1)
+        g.advance(3)
+        self.assertEqual(g.time_step, 5)
+        self.assertTrue(g.grid[1, 5])
+        self.assertEqual(g.grid.sum(), 1)
+        self.assertTrue(np.array_equal(g.wrapping_grid[1:-1, 0], g.grid[:, -1]))
+        # the snapshot is a copy, unchanged by stepping
+        self.assertTrue(snapshot.wrapping_grid[2, 3])
+
+    def test_advance_stops(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid, time_step == 3
+        g = Grid2D(self.config, transfunc)
+        self.assertTrue(g.advance(10))
+        self.assertEqual(g.time_step, 3)
+
+#----------------------------------------------------------------------
+
+class TestLazyCounts(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = 0,1
+        self.config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        self.config.grid_dims = (5,5)
+        self.config.wrap = True
+        self.config.initial_grid = np.zeros((5,5))
+        self.config.initial_grid[2, 2] = 1
+        self.seen = []
+
+    def counting_grid(self, transfunc):
+        g = Grid2D(self.config, transfunc)
+        g.count_neighbours = lambda ns, f=g.count_neighbours: (
+            self.seen.append(True) or f(ns))
+        return g
+
+    def test_unread_counts_not_computed(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid, False
+        self.counting_grid(transfunc).step()
+        self.assertEqual(self.seen, [])
+
+    def test_read_counts(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            dead_neighbours, live_neighbours = neighbour_counts
+            return np.where(live_neighbours == 1, 1, grid), False
+        g = self.counting_grid(transfunc)
+        g.step()
+        self.assertEqual(self.seen, [True])
+        self.assertEqual(g.grid.sum(), 9)
+
+    def test_declared_counts(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            self.assertIsInstance(neighbour_counts, np.ndarray)
+            return grid, False
+        transfunc.needs_neighbour_counts = True
+        self.counting_grid(transfunc).step()
+        self.assertEqual(self.seen, [True])
+#----------------------------------------------------------------------
+
+class TestHeadlessRun(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = 0,1
+        self.config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        self.config.grid_dims = (5,5)
+        self.config.wrap = True
+        self.config.num_generations = 25
+        self.config.initial_grid = np.zeros((5,5))
+
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid + 1, False
+        self.g = Grid2D(self.config, transfunc)
+
+    def test_callback(self):
+        reported = []
+        timeline, time_step = self.g.run(
+            lambda gen, total: reported.append((gen, total)))
+        self.assertEqual(reported, [(9, 25), (19, 25)])
+        self.assertEqual(timeline.shape, (26, 5, 5))
+        self.assertEqual(time_step, 26)
+        self.assertTrue(np.all(timeline[-1] == 25))
+
+    def test_compact_timeline(self):
+        self.config.states = tuple(range(30))
+        timeline, _ = self.g.run(False)
+        self.assertEqual(timeline.dtype, np.uint8)
+        self.assertTrue(np.array_equal(timeline[:, 0, 0], np.arange(26)))
+        # states the description leaves out are kept
+        self.config.states = 0, 1
+        self.g.set_grid(np.full((5, 5), 0.5))
+        timeline, _ = self.g.run(False)
+        self.assertEqual(timeline[0, 0, 0], 0.5)
+
+    def test_stopped_timeline(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid + 1, time_step == 7
+        timeline, time_step = Grid2D(self.config, transfunc).run(False)
+        self.assertEqual(time_step, 8)
+        self.assertEqual(len(timeline), 8)
+        self.assertTrue(np.all(timeline[-1] == 7))
+
+    def test_named_reporters(self):
+        with mock.patch.object(grid_module, '_ProgressWindow') as window:
+            self.g.run('none')
+            self.g.run(False)
+            with mock.patch('builtins.print') as printed:
+                self.g.run('console')
+            self.assertEqual(printed.call_count, 2)
+        window.assert_not_called()
+        self.assertRaises(ValueError, self.g.run, 'gui')
+
+    def test_headless_without_display(self):
+        self.config.progress = None
+        with mock.patch.dict('os.environ', clear=True), \
+                mock.patch.object(grid_module.sys, 'platform', 'linux'), \
+                mock.patch.object(grid_module, '_ProgressWindow') as window:
+            timeline, _ = self.g.run()
+        window.assert_not_called()
+        self.assertEqual(len(timeline), 26)
+
+
 if __name__ == '__main__':
     unittest.main()
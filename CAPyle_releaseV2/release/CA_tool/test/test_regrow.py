@@ -0,0 +1,91 @@
+import sys, inspect, unittest
+from functools import partial
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.ca import Grid2D, CAConfig
+from capyle.terrain_cell import TerrainCell, TerrainType
+from capyle.terrain_grid import TerrainGrid
+from capyle.regrow import (regrow_transition_func, regrow_step,
+                           seed_spread_weights, run_regrowth,
+                           SEED_WIND_EFFECT)
+
+
+class ConstantRng(object):
+    """Stands in for a random generator, every draw is the same value"""
+    def __init__(self, value):
+        self.value = value
+
+    def random(self, size=None):
+        if size is None:
+            return self.value
+        return np.full(size, self.value)
+
+
+def burnt_terrain(shape=(14, 14)):
+    rng = np.random.RandomState(11)
+    grid = TerrainGrid(shape)
+    for x in range(shape[0]):
+        for y in range(shape[1]):
+            terrain = list(TerrainType)[rng.randint(len(TerrainType))]
+            grid[x, y] = TerrainCell(terrain,
+                                     elevation=rng.choice([0, 0, 20, -40, 70]),
+                                     burnt=rng.rand() < 0.7)
+    return grid
+
+
+class TestRegrowStep(unittest.TestCase):
+    def scalar_step(self, grid, time_step, draw):
+        config = CAConfig('test/testdescriptions/2dbasic.py')
+        config.states = list(range(len(TerrainType) * 4))
+        config.nhood_arr = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+        config.grid_dims = grid.shape
+        config.wrap = False
+        config.dtype = TerrainGrid
+        config.initial_grid = grid
+        g = Grid2D(config, partial(regrow_transition_func,
+                                   rng=ConstantRng(draw)))
+        g.time_step = time_step
+        g.step()
+        return g.grid
+
+    def test_matches_scalar_rule(self):
+        for time_step in (1, 5):
+            for draw in (0.0, 0.004, 0.011, 0.019, 0.9):
+                grid = burnt_terrain()
+                expected = self.scalar_step(grid, time_step, draw)
+
+                types = grid.type.copy()
+                burnt = grid.burnt.copy()
+                regrow_step(types, burnt, time_step,
+                            seed_spread_weights(grid.elevation),
+                            ConstantRng(draw))
+                msg = "time step {}, draw {}".format(time_step, draw)
+                self.assertTrue(np.array_equal(types, expected.type), msg)
+                self.assertTrue(np.array_equal(burnt, expected.burnt), msg)
+
+    def test_wind_effect(self):
+        # seed from the north west and west is carried by the south wind
+        self.assertTrue(np.allclose(SEED_WIND_EFFECT,
+                                    [1.3, 1, 1, 1.3, 1, 1, 1, 1]))
+
+    def test_run_regrowth(self):
+        types = np.full((20, 20), TerrainType.CHAPARRAL.value, dtype=np.uint8)
+        types[5:8, 5:8] = TerrainType.LAKE.value
+        burnt = np.ones((20, 20), dtype=bool)
+        burnt[:, 0] = False
+        burnt[5:8, 5:8] = False
+        types, burnt = run_regrowth(types, burnt, np.zeros((20, 20)), 3000,
+                                    np.random.RandomState(0))
+        # everything but the unreachable grid edge has regrown
+        self.assertFalse(burnt[1:-1, 1:-1].any())
+        self.assertTrue(np.all(types[5:8, 5:8] == TerrainType.LAKE.value))
+
+
+if __name__ == '__main__':
+    unittest.main()
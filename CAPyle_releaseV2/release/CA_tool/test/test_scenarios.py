@@ -0,0 +1,179 @@
+import sys, inspect, unittest
+from unittest import mock
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+# the scenarios are run by the real valued fire CA, imported from the root
+# of the repository
+release_dir_loc = main_dir_loc[:main_dir_loc.rindex('CA_tool')]
+sys.path.append(release_dir_loc)
+sys.path.append(release_dir_loc[:release_dir_loc.rindex('CAPyle_releaseV2')])
+
+from CAPyle_releaseV2.release.CA_tool.capyle.scenarios import (
+    ScenarioPool, SerialScenarios, simulate_scenario, run_scenario,
+    run_plans, coarse_plan)
+from CAPyle_releaseV2.release.CA_tool.capyle.shared import SharedArrays
+from CAPyle_releaseV2.release.CA_tool.capyle.ca.grid2d import Grid2D
+from CAPyle_releaseV2.release.CA_tool.capyle.terrain_cell import TerrainType
+
+# Long enough for the fire to reach the town
+NUM_ITERATIONS = 300
+
+# Plans sharing drops, so forked runs branch more than once
+PLANS = [
+    None,
+    {"20": [[20, 20], [20, 21]]},
+    {"20": [[20, 20], [20, 21]], "60": [[50, 30]]},
+    {"20": [[20, 20], [20, 21]], "60": [[50, 31]]},
+    {"60": [[50, 30]], "61": []},
+    {"500": [[50, 30]]},
+]
+
+
+def burn_counts(grids):
+    """The number of grids each cell was burning or burnt in"""
+    return sum((grid.grid.burning | grid.grid.burnt).astype(np.int64)
+               for grid in grids)
+
+
+class TestCoarsePlan(unittest.TestCase):
+    def test_steps_round_up(self):
+        plan = {"1": [[0, 0], [3, 3]], "4": [[5, 9]], "5": [[8, 8]],
+                "9": []}
+        # coarse step 1 stands for steps 1 to 4, the grid's first step
+        self.assertEqual(coarse_plan(plan, 4), {"1": [[0, 0], [1, 2]],
+                                                "2": [[2, 2]], "3": []})
+        self.assertIs(coarse_plan(plan, 1), plan)
+
+    def test_first_step_drop_survives(self):
+        template = {"seed": 2, "num_iterations": NUM_ITERATIONS,
+                    "fidelity": 4}
+        plan = {"1": [[x, y] for x in range(12) for y in range(12, 28)]}
+        grid, _ = simulate_scenario(water_dropping_plan=plan, **template)
+        dry, _ = simulate_scenario(**template)
+        self.assertFalse(np.array_equal(grid.grid.moisture,
+                                        dry.grid.moisture))
+
+
+class TestSimulateScenario(unittest.TestCase):
+    def test_no_timeline(self):
+        # runs are stepped without Grid.run's frame buffer, numbered as it
+        # numbers them
+        with mock.patch.object(Grid2D, "run", side_effect=AssertionError):
+            grid, time_step = simulate_scenario(seed=0, num_iterations=30)
+            self.assertEqual(time_step, 31)
+            grid, time_step = simulate_scenario(
+                seed=0, num_iterations=NUM_ITERATIONS)
+        self.assertLess(time_step, NUM_ITERATIONS + 1)
+        self.assertEqual(grid.time_step + 1, time_step)
+        # stopped on lighting the town
+        town = grid.grid.type == TerrainType.TOWN.value
+        self.assertTrue((grid.grid.burning | grid.grid.burnt)[town].any())
+
+
+class TestScenarioPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ScenarioPool(processes=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_run_many_matches_serial(self):
+        tasks = [{"seed": seed, "num_iterations": NUM_ITERATIONS,
+                  "water_dropping_plan": PLANS[seed % len(PLANS)]}
+                 for seed in range(5)]
+        finished = {}
+        time_steps, burnt = self.pool.run_many(
+            tasks, on_result=lambda i, t: finished.setdefault(i, t))
+        runs = [simulate_scenario(**task) for task in tasks]
+        self.assertEqual(list(time_steps), [t for _, t in runs])
+        self.assertEqual(finished, dict(enumerate(time_steps)))
+        self.assertTrue(np.array_equal(burnt,
+                                       burn_counts(g for g, _ in runs)))
+        # the seeds give different runs
+        self.assertGreater(len(set(time_steps)), 1)
+        serial_steps, serial_burnt = SerialScenarios().run_many(tasks)
+        self.assertTrue(np.array_equal(serial_steps, time_steps))
+        self.assertTrue(np.array_equal(serial_burnt, burnt))
+
+    def test_forked_plans_match_solo_runs(self):
+        solo = [simulate_scenario(water_dropping_plan=plan, seed=3,
+                                  num_iterations=NUM_ITERATIONS)
+                for plan in PLANS]
+        solo_steps = [t for _, t in solo]
+        self.assertEqual(run_plans(PLANS, seed=3,
+                                   num_iterations=NUM_ITERATIONS),
+                         solo_steps)
+        for scenarios in (self.pool, SerialScenarios()):
+            time_steps, burnt = scenarios.run_plans(
+                PLANS, seed=3, num_iterations=NUM_ITERATIONS)
+            self.assertEqual(list(time_steps), solo_steps)
+            self.assertTrue(np.array_equal(burnt,
+                                           burn_counts(g for g, _ in solo)))
+
+    def test_coarse_runs(self):
+        task = {"seed": 1, "num_iterations": NUM_ITERATIONS, "fidelity": 4,
+                "water_dropping_plan": PLANS[2]}
+        time_steps, burnt = self.pool.run_many([task])
+        self.assertEqual(time_steps[0], run_scenario(**task))
+        self.assertEqual(time_steps[0] % 4, 0)
+        self.assertEqual(burnt.shape, (200, 200))
+
+    def test_as_completed(self):
+        tasks = [{"seed": seed, "num_iterations": 40 + 20 * seed}
+                 for seed in range(7)]
+        outstanding = []
+        yielded = []
+
+        def taken():
+            for task in tasks:
+                # the tasks taken but not yet yielded back
+                outstanding.append(len(outstanding) - len(yielded) + 1)
+                yield task
+
+        for task, time_step in self.pool.as_completed(taken(), in_flight=3):
+            yielded.append((task["seed"], time_step))
+        # every task once, with the time step of its run
+        self.assertEqual(sorted(yielded),
+                         [(task["seed"], run_scenario(**task))
+                          for task in tasks])
+        self.assertEqual(max(outstanding), 3)
+
+    def test_as_completed_failure(self):
+        tasks = [{"seed": 0, "num_iterations": 200},
+                 {"seed": 1, "num_iterations": 10,
+                  "config_path": "no/such/config.pkl"},
+                 {"seed": 2, "num_iterations": 200}]
+        with self.assertRaises(FileNotFoundError):
+            for _ in self.pool.as_completed(tasks, in_flight=3):
+                pass
+        # the runs still going were waited for, and the pool goes on
+        self.assertEqual(len(self.pool.pool._cache), 0)
+        time_steps, _ = self.pool.run_many([tasks[0]])
+        self.assertEqual(time_steps[0], run_scenario(**tasks[0]))
+
+
+class TestClose(unittest.TestCase):
+    def test_releases_shared_memory(self):
+        pool = ScenarioPool(processes=1)
+        pool.run_many([{"seed": 0, "num_iterations": 10}])
+        handles = [block.handle for block in pool.blocks]
+        handles.append(pool.results.handle)
+        pool.close()
+        self.assertEqual(pool.blocks, [])
+        self.assertIsNone(pool.results)
+        for handle in handles:
+            with self.assertRaises(FileNotFoundError):
+                SharedArrays.attach(handle)
+        # runs in this process no longer read the released blocks
+        self.assertEqual(run_scenario(seed=0, num_iterations=10), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
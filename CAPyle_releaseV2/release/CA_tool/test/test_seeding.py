@@ -0,0 +1,58 @@
+import sys, inspect, unittest
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.seeding import (child_seed, spawn_seeds, run_streams, seed_key,
+                             STREAMS)
+import capyle.terrain_cell as terrain_cell
+
+
+class TestSeeding(unittest.TestCase):
+    def test_child_seed_matches_spawn(self):
+        spawned = np.random.SeedSequence(11).spawn(4)
+        for index, seed in enumerate(spawn_seeds(11, 4)):
+            self.assertTrue(np.array_equal(seed.generate_state(4),
+                                           spawned[index].generate_state(4)))
+        # children of children can be found again too
+        self.assertTrue(np.array_equal(
+            child_seed(child_seed(11, 2), 1).generate_state(4),
+            spawned[2].spawn(2)[1].generate_state(4)))
+
+    def test_run_streams(self):
+        a, b, c = run_streams(3), run_streams(3), run_streams(4)
+        self.assertEqual(tuple(a), STREAMS)
+        draws = {name: a[name].random(5) for name in STREAMS}
+        for name in STREAMS:
+            self.assertTrue(np.array_equal(draws[name], b[name].random(5)))
+            self.assertFalse(np.array_equal(draws[name], c[name].random(5)))
+        # the streams of one run are independent of each other
+        self.assertFalse(np.array_equal(draws["wind"], draws["spread"]))
+
+    def test_seed_key(self):
+        self.assertEqual(seed_key(5), seed_key(np.random.SeedSequence(5)))
+        self.assertEqual(seed_key(child_seed(5, 1)),
+                         seed_key(spawn_seeds(5, 2)[1]))
+        self.assertNotEqual(seed_key(child_seed(5, 1)),
+                            seed_key(child_seed(5, 0)))
+        self.assertNotEqual(seed_key(child_seed(5, 0)), seed_key(5))
+
+    def test_rate_tables(self):
+        regen = dict(terrain_cell.REGEN_RATE_TABLE)
+        burn = dict(terrain_cell.BURN_RATE_TABLE)
+        try:
+            terrain_cell.draw_rate_tables(1)
+            self.assertNotEqual(dict(terrain_cell.BURN_RATE_TABLE), burn)
+            terrain_cell.draw_rate_tables(terrain_cell.RATE_TABLE_SEED)
+            self.assertEqual(dict(terrain_cell.REGEN_RATE_TABLE), regen)
+            self.assertEqual(dict(terrain_cell.BURN_RATE_TABLE), burn)
+        finally:
+            terrain_cell.draw_rate_tables(terrain_cell.RATE_TABLE_SEED)
+
+
+if __name__ == '__main__':
+    unittest.main()
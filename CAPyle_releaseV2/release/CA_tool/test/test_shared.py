@@ -0,0 +1,60 @@
+import sys, inspect, unittest
+import numpy as np
+from multiprocessing import Pool
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.shared import SharedArrays
+
+
+def _fill_row(task):
+    # a worker writing into a shared results buffer
+    index, handle = task
+    shared = SharedArrays.attach(handle)
+    shared["out"][index] = shared["source"].sum() + index
+    shared.close()
+
+
+class TestSharedArrays(unittest.TestCase):
+    def test_publish(self):
+        elevation = np.linspace(0, 1, 12, dtype=np.float32).reshape(3, 4)
+        kinds = np.arange(5, dtype=np.uint8)
+        with SharedArrays.publish({"elevation": elevation,
+                                   "kind": kinds}) as shared:
+            self.assertTrue(np.array_equal(shared["elevation"], elevation))
+            self.assertEqual(shared["kind"].dtype, np.uint8)
+            # the arrays are copies, laid out on separate cache lines
+            self.assertFalse(np.shares_memory(shared["elevation"], elevation))
+            self.assertEqual(shared.layout[1][3] % 64, 0)
+
+            reader = SharedArrays.attach(shared.handle, readonly=True)
+            self.assertTrue(np.array_equal(reader["elevation"], elevation))
+            with self.assertRaises(ValueError):
+                reader["kind"][0] = 1
+            # writes by the owner are seen by the reader
+            shared["kind"][0] = 9
+            self.assertEqual(reader["kind"][0], 9)
+            reader.close()
+
+    def test_allocate(self):
+        with SharedArrays.allocate({"steps": (4, np.int32),
+                                    "bits": ((4, 3), np.uint8)}) as shared:
+            self.assertEqual(shared["steps"].shape, (4,))
+            self.assertEqual(shared["bits"].shape, (4, 3))
+            self.assertFalse(shared["bits"].any())
+
+    def test_workers(self):
+        specs = {"source": (6, np.int64), "out": (3, np.int64)}
+        with SharedArrays.allocate(specs) as shared:
+            shared["source"][:] = np.arange(6)
+            with Pool(2) as pool:
+                pool.map(_fill_row, [(i, shared.handle) for i in range(3)])
+            self.assertEqual(list(shared["out"]), [15, 16, 17])
+
+
+if __name__ == '__main__':
+    unittest.main()
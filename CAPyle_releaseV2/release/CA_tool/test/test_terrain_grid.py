@@ -0,0 +1,221 @@
+import sys, inspect, unittest
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.ca import Grid2D, CAConfig
+from capyle.ca.grid2d import DEAD_STATE
+from capyle.terrain_cell import (TerrainCell, TerrainType, cell_to_state_index,
+                                 IGNITION_PROB_TABLE, IGNITION_PROB_BY_CODE,
+                                 BURN_RATE_TABLE, BURN_RATE_BY_CODE)
+from capyle.terrain_grid import TerrainGrid, FIELDS
+
+#----------------------------------------------------------------------
+
+class TestTerrainGrid(unittest.TestCase):
+    def setUp(self):
+        self.grid = TerrainGrid((10, 12))
+        self.grid[:, :] = TerrainCell(TerrainType.CHAPARRAL)
+        self.grid[2:5, 3:8] = TerrainCell(TerrainType.DENSE_FOREST,
+                                          elevation=-20)
+        self.grid[0, 0] = TerrainCell(TerrainType.SOURCE, burning=True)
+
+    def test_field_dtypes(self):
+        for name, dtype in FIELDS:
+            arr = getattr(self.grid, name)
+            self.assertEqual(arr.dtype, dtype)
+            self.assertEqual(arr.shape, (10, 12))
+
+    def test_broadcast_cell(self):
+        forest = self.grid.type == TerrainType.DENSE_FOREST.value
+        self.assertEqual(forest.sum(), 15)
+        self.assertTrue(np.all(self.grid.elevation[forest] == -20))
+
+    def test_cell_view_roundtrip(self):
+        cell = self.grid[3, 4]
+        self.assertIsInstance(cell, TerrainCell)
+        self.assertEqual(cell.type, TerrainType.DENSE_FOREST)
+        self.assertEqual(cell.elevation, -20)
+        # writes go straight through to the arrays
+        cell.ignite()
+        self.assertTrue(self.grid.burning[3, 4])
+        self.assertLess(self.grid.fuel[3, 4], 1.0)
+        # copies are detached
+        detached = cell.copy()
+        detached.burning = False
+        self.assertTrue(self.grid.burning[3, 4])
+
+    def test_region_view_shares_memory(self):
+        region = self.grid[2:5, 3:8]
+        self.assertIsInstance(region, TerrainGrid)
+        region.moisture[:] = 0.7
+        self.assertTrue(np.all(self.grid.moisture[2:5, 3:8] == np.float32(0.7)))
+
+    def test_empty_cells(self):
+        self.grid[9, :] = -100
+        self.assertIsNone(self.grid[9, 0].type)
+        self.assertFalse(self.grid[9, 0].burning)
+        self.assertTrue(np.all(self.grid.state_indices()[9] == -1))
+
+    def test_state_indices_match_cells(self):
+        self.grid[6, 6].drop_water()
+        self.grid[7, 7].burnt = True
+        expected = np.array([[cell_to_state_index(self.grid[x, y])
+                              for y in range(12)] for x in range(10)])
+        self.assertTrue(np.array_equal(self.grid.state_indices(), expected))
+
+    def test_from_cells(self):
+        cells = np.empty((3, 3), dtype=object)
+        for x in range(3):
+            for y in range(3):
+                cells[x, y] = TerrainCell(TerrainType.LAKE)
+        grid = TerrainGrid.from_cells(cells)
+        self.assertTrue(np.all(grid.type == TerrainType.LAKE.value))
+        self.assertIsNone(grid[1, 1].burn_rate)
+
+    def test_memory_per_cell(self):
+        cell = TerrainCell(TerrainType.CHAPARRAL)
+        # object plus attribute dict, ignoring the attribute values and the
+        # pointer held by the object array
+        object_bytes = sys.getsizeof(cell) + sys.getsizeof(cell.__dict__)
+        columnar_bytes = self.grid.nbytes / self.grid.size
+        self.assertEqual(columnar_bytes, 20)
+        self.assertGreater(object_bytes, 10 * columnar_bytes)
+
+    def test_rates_follow_type(self):
+        forest = TerrainCell(TerrainType.DENSE_FOREST)
+        self.assertEqual(self.grid[3, 4].burn_rate, forest.burn_rate)
+        self.assertEqual(self.grid[3, 4].regen_rate, forest.regen_rate)
+        self.grid.type[3, 4] = TerrainType.CHAPARRAL.value
+        self.assertEqual(self.grid.burn_rate[3, 4],
+                         TerrainCell(TerrainType.CHAPARRAL).burn_rate)
+        self.grid[9, 11] = TerrainCell(TerrainType.LAKE, burn_rate=0.5)
+        self.assertIsNone(self.grid[9, 11].burn_rate)
+        self.grid[9, 11] = None
+        self.assertTrue(np.isnan(self.grid.burn_rate[9, 11]))
+
+    def test_coarsened(self):
+        self.grid[8, 10] = TerrainCell(TerrainType.TOWN)
+        self.grid[5:7, 4:8] = TerrainCell(TerrainType.DENSE_FOREST,
+                                          elevation=-20)
+        coarse = self.grid.coarsened(4)
+        self.assertEqual(coarse.shape, (3, 3))
+        # the source and the single town cell survive
+        self.assertEqual(coarse[0, 0].type, TerrainType.SOURCE)
+        self.assertTrue(coarse.burning[0, 0])
+        self.assertEqual(coarse[2, 2].type, TerrainType.TOWN)
+        self.assertFalse(coarse.burning[2, 2])
+        # most of the block is forest, and its rates are the forest's
+        self.assertEqual(coarse[1, 1].type, TerrainType.DENSE_FOREST)
+        self.assertEqual(coarse.burn_rate[1, 1], self.grid.burn_rate[3, 4])
+        self.assertEqual(coarse[0, 2].type, TerrainType.CHAPARRAL)
+        self.assertAlmostEqual(float(coarse.elevation[1, 1]), -20 * 12 / 16)
+        # the padded edge repeats the last row and column
+        self.assertEqual(coarse[2, 0].type, TerrainType.CHAPARRAL)
+        self.assertTrue(np.array_equal(self.grid.coarsened(1).type,
+                                       self.grid.type))
+
+#----------------------------------------------------------------------
+
+class TestCompiledTables(unittest.TestCase):
+    def test_matches_tables(self):
+        for source, targets in IGNITION_PROB_TABLE.items():
+            for target, prob in targets.items():
+                self.assertEqual(
+                    IGNITION_PROB_BY_CODE[source.value, target.value], prob)
+        self.assertFalse(IGNITION_PROB_BY_CODE[0].any())
+        for terrain in TerrainType:
+            rate = BURN_RATE_BY_CODE[terrain.value]
+            if terrain in BURN_RATE_TABLE:
+                self.assertEqual(rate, BURN_RATE_TABLE[terrain])
+            else:
+                self.assertTrue(np.isnan(rate))
+                self.assertIsNone(TerrainCell(terrain).burn_rate)
+
+    def test_sweep(self):
+        # changing the compiled table changes cells and grids alike
+        grid = TerrainGrid((2, 2))
+        grid[:, :] = TerrainCell(TerrainType.DENSE_FOREST)
+        source = np.full((2, 2), TerrainType.TOWN.value)
+        index = TerrainType.TOWN.value, TerrainType.DENSE_FOREST.value
+        original = IGNITION_PROB_BY_CODE[index]
+        try:
+            IGNITION_PROB_BY_CODE[index] = 0.9
+            self.assertEqual(grid[0, 0].get_ignition_prob(TerrainType.TOWN),
+                             0.9)
+            self.assertTrue(np.all(grid.get_ignition_prob(source) == 0.9))
+        finally:
+            IGNITION_PROB_BY_CODE[index] = original
+
+#----------------------------------------------------------------------
+
+class TestGrid2DTerrain(unittest.TestCase):
+    def setUp(self):
+        self.config = CAConfig('test/testdescriptions/2dbasic.py')
+        self.config.states = list(range(len(TerrainType) * 4))
+        self.config.nhood_arr = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+        self.config.grid_dims = (8, 8)
+        self.config.wrap = False
+        self.config.dtype = TerrainGrid
+        initial = TerrainGrid((8, 8))
+        initial[:, :] = TerrainCell(TerrainType.CHAPARRAL)
+        initial[4, 4] = TerrainCell(TerrainType.CHAPARRAL, burning=True)
+        self.config.initial_grid = initial
+
+    def test_step(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            new_grid = grid.copy()
+            # light every cell next to a burning cell
+            for ns in neighbour_states:
+                new_grid.burning |= ns.burning
+            return new_grid, False
+
+        g = Grid2D(self.config, transfunc)
+        self.assertIsInstance(g.grid, TerrainGrid)
+        # the dead border is made of empty cells
+        self.assertTrue(np.all(g.wrapping_grid.type[0] == 0))
+        g.step()
+        self.assertEqual(g.grid.burning.sum(), 9)
+        self.assertEqual(g.get_state_grid()[3, 3], 1)
+
+    def test_state_grid(self):
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            new_grid = grid.copy()
+            burning_neighbours = neighbour_counts[1]
+            new_grid.burnt |= grid.burning
+            new_grid.burning = (burning_neighbours > 0) & ~new_grid.burnt
+            return new_grid, False
+
+        g = Grid2D(self.config, transfunc)
+        self.assertEqual(g.state_grid.dtype, np.uint8)
+        for _ in range(3):
+            g.step()
+            self.assertTrue(np.array_equal(g.state_grid,
+                                           g.grid.state_indices()))
+            self.assertTrue(np.array_equal(g.get_state_grid(), g.state_grid))
+        # the dead border has no state
+        self.assertTrue(np.all(g.wrapping_state_grid[0] == DEAD_STATE))
+        # the fire front is the ring three cells out from the centre
+        self.assertEqual(g.grid.burning.sum(), 24)
+
+    def test_state_changes(self):
+        other = self.config.initial_grid.copy()
+        other[1, 1].ignite()
+        other.moisture[:] = 0.5
+        changed = self.config.initial_grid.state_changes(other)
+        self.assertEqual(list(zip(*np.nonzero(changed))), [(1, 1)])
+
+    def test_resized_initial_grid(self):
+        self.config.grid_dims = (10, 6)
+        g = Grid2D(self.config, lambda *args: (args[0], False))
+        self.assertEqual(g.grid.shape, (10, 6))
+        self.assertTrue(g.grid.burning[4, 4])
+        self.assertIsNone(g.grid[9, 0].type)
+
+
+if __name__ == '__main__':
+    unittest.main()
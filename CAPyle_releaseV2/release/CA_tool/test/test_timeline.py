@@ -0,0 +1,178 @@
+import sys, inspect, unittest, os, tempfile, types
+from unittest import mock
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.ca import Grid2D, CAConfig
+from capyle.timeline import TimelineWriter, MappedTimeline, count_path
+import capyle.utils as utils
+# the module Grid.run writes timelines with
+import CA_tool.capyle.timeline as run_timeline
+
+
+class TestStreamedTimeline(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'timeline')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_follow_run(self):
+        writer = TimelineWriter(self.path, 10, (4, 5), np.uint8)
+        reader = MappedTimeline(self.path)
+        self.assertEqual(len(reader), 0)
+        for t in range(6):
+            writer[t] = np.full((4, 5), t)
+            # frames can be read as soon as they are written
+            self.assertEqual(len(reader), t + 1)
+            self.assertTrue(np.all(reader[t] == t))
+        frames = writer.close()
+        self.assertEqual(frames.shape, (6, 4, 5))
+        self.assertEqual(reader.shape, (6, 4, 5))
+        self.assertTrue(np.array_equal(reader[-1], frames[-1]))
+
+    def test_grid_run(self):
+        config = CAConfig('test/testdescriptions/2dbasic.py')
+        config.states = tuple(range(20))
+        config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        config.grid_dims = (6, 6)
+        config.num_generations = 30
+        config.initial_grid = np.zeros((6, 6))
+
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            return grid + 1, time_step == 12
+        expected, _ = Grid2D(config, transfunc).run(False)
+        timeline, time_step = Grid2D(config, transfunc).run(
+            False, timeline_path=self.path)
+        self.assertIsInstance(timeline, np.memmap)
+        self.assertTrue(np.array_equal(timeline, expected))
+
+        loaded = utils.load_timeline(self.path)
+        self.assertIsInstance(loaded, utils.MappedTimeline)
+        self.assertEqual(len(loaded), time_step)
+        self.assertEqual(loaded.dtype, np.uint8)
+        self.assertTrue(np.array_equal(np.asarray(loaded), expected))
+        self.assertTrue(np.array_equal(utils.extract_states(loaded),
+                                       np.arange(13)))
+
+    def test_without_count(self):
+        np.save(self.path + '.npy', np.arange(12).reshape(3, 2, 2))
+        loaded = utils.load_timeline(self.path + '.npy')
+        self.assertFalse(os.path.exists(count_path(self.path + '.npy')))
+        self.assertEqual(len(loaded), 3)
+
+
+    def test_closed_on_failure(self):
+        config = CAConfig('test/testdescriptions/2dbasic.py')
+        config.states = tuple(range(20))
+        config.nhood_arr = [[1,1,1],[1,1,1],[1,1,1]]
+        config.grid_dims = (6, 6)
+        config.num_generations = 30
+        config.initial_grid = np.zeros((6, 6))
+
+        def transfunc(grid, neighbour_states, neighbour_counts, time_step):
+            if time_step == 5:
+                raise RuntimeError("failed")
+            return grid + 1, False
+        writer = run_timeline.TimelineWriter
+        with mock.patch.object(writer, 'close', autospec=True,
+                               side_effect=writer.close) as close:
+            with self.assertRaises(RuntimeError):
+                Grid2D(config, transfunc).run(False, timeline_path=self.path)
+        close.assert_called_once()
+        # the frames from before the failure are kept
+        loaded = utils.load_timeline(self.path)
+        self.assertEqual(len(loaded), 5)
+        self.assertTrue(np.array_equal(loaded[:, 0, 0], np.arange(5)))
+
+
+# Stands in for a CA description streaming its timeline, a frame at a time
+DESCRIPTION = """import sys, pickle, time, types
+sys.path.insert(0, {capyle!r})
+import numpy as np
+from timeline import TimelineWriter
+writer = TimelineWriter({path!r}, 6, (2, 2), np.uint8)
+for t in range(6):
+    writer[t] = np.full((2, 2), t)
+    time.sleep(0.2)
+writer.close()
+with open(sys.argv[1], 'wb') as config:
+    pickle.dump(types.SimpleNamespace(timeline_path={path!r}), config)
+"""
+
+
+class TestRunCA(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, 'timeline')
+        filepath = os.path.join(self.dir.name, 'description.py')
+        with open(filepath, 'w') as f:
+            f.write(DESCRIPTION.format(capyle=main_dir_loc + 'capyle',
+                                       path=path))
+        self.config = types.SimpleNamespace(
+            filepath=filepath, path=os.path.join(self.dir.name, 'config'),
+            timeline_path=path, save=lambda: None)
+        # the timeline of an earlier run
+        writer = TimelineWriter(path, 6, (2, 2), np.uint8)
+        for t in range(6):
+            writer[t] = np.full((2, 2), 9)
+        writer.close()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_follows_run(self):
+        seen = []
+
+        def on_frames(timeline):
+            seen.append((len(timeline), int(timeline[-1][0, 0])))
+        _, timeline = utils.run_ca(self.config, on_frames=on_frames,
+                                   poll_interval=0.05)
+        self.assertTrue(np.array_equal(timeline[:, 0, 0], np.arange(6)))
+        # frames were shown as they were written, never the earlier run's
+        self.assertGreater(len(seen), 2)
+        self.assertEqual([n for n, _ in seen], sorted(set(n for n, _ in seen)))
+        for frames, last in seen:
+            self.assertEqual(last, frames - 1)
+
+
+class TestSavedTimeline(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'timeline')
+        rng = np.random.RandomState(2)
+        # a fire front moving across a grid of 24 states
+        self.timeline = np.zeros((30, 40, 40), dtype=np.uint8)
+        for t in range(1, 30):
+            self.timeline[t] = self.timeline[t-1]
+            self.timeline[t, :, t] = rng.randint(24, size=40)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_dtype(self):
+        self.assertEqual(utils.timeline_dtype(range(24)), np.uint8)
+        self.assertEqual(utils.timeline_dtype(range(300)), np.uint16)
+        self.assertEqual(utils.timeline_dtype([-1, 0, 1]), np.int8)
+        self.assertEqual(utils.timeline_dtype([0, 0.5, 1]), np.float64)
+        self.assertEqual(utils.timeline_dtype(['a', 'b']), object)
+
+    def test_compressed(self):
+        utils.save_timeline(self.timeline, self.path, compress=True)
+        self.assertLess(os.path.getsize(self.path), self.timeline.nbytes / 8)
+        for timeline in (self.timeline, self.timeline.astype(np.int8) - 12,
+                         self.timeline / 2.0):
+            utils.save_timeline(timeline, self.path, compress=True)
+            loaded = utils.load_timeline(self.path)
+            self.assertEqual(loaded.dtype, timeline.dtype)
+            self.assertTrue(np.array_equal(loaded, timeline))
+
+
+if __name__ == '__main__':
+    unittest.main()
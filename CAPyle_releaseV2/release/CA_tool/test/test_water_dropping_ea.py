@@ -0,0 +1,419 @@
+import sys, inspect, unittest, json, os, random, tempfile, queue, time
+import multiprocessing
+from unittest import mock
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+# the EA is a script at the root of the repository
+release_dir_loc = main_dir_loc[:main_dir_loc.rindex('CA_tool')]
+sys.path.append(release_dir_loc)
+sys.path.append(release_dir_loc[:release_dir_loc.rindex('CAPyle_releaseV2')])
+
+import water_dropping_ea
+from water_dropping_ea import (race_population, evaluate_population,
+                               FitnessCache, FidelityLadder, save_population,
+                               tourny_insertion, next_generation,
+                               generate_many_plans, island_ea, _island,
+                               steady_state_ea, plan_key)
+from CAPyle_releaseV2.release.CA_tool.capyle.seeding import (spawn_seeds,
+                                                             seed_key,
+                                                             seed_sequence)
+
+
+def plan(n):
+    """A plan told apart from the others by n"""
+    return {"10": [[n, 0]]}
+
+
+# How much later fire reaches the town on the FakePool's coarse terrain
+COARSE_BIAS = 20
+
+
+class FakePool(object):
+    """Stands in for a ScenarioPool, scoring plan(n) 10 * n plus a little
+    noise from the seed (and COARSE_BIAS at a fidelity above 1), and
+    recording the plans run on each seed"""
+
+    def __init__(self):
+        self.calls = []
+
+    def run_plans(self, plans, num_iterations=500, seed=None, fidelity=1):
+        self.calls.append((seed_key(seed), [p["10"][0][0] for p in plans],
+                           fidelity))
+        noise = int(seed.generate_state(1)[0] % 5)
+        if fidelity != 1:
+            noise += COARSE_BIAS
+        return np.array([10 * p["10"][0][0] + noise for p in plans]), None
+
+    def seeds_of(self, n, fidelity=1):
+        """The seeds plan(n) was run on at fidelity, in order"""
+        return [key for key, ns, f in self.calls if n in ns and f == fidelity]
+
+    def as_completed(self, tasks, in_flight=None):
+        # any plan (not only plan(n)) is scored by when it drops water
+        for task in tasks:
+            fitness = drops(task["water_dropping_plan"])
+            self.calls.append((seed_key(task["seed"]), fitness))
+            yield task, fitness
+
+
+def drops(plan):
+    """The sum of the time steps a plan drops water at"""
+    return sum(int(t) for t, coords in plan.items() if coords)
+
+
+class TestPlanKey(unittest.TestCase):
+    scenario = {"num_iterations": 500, "terrain": "digest"}
+
+    def test_order_free(self):
+        key = plan_key({"10": [[1, 2], [3, 4]], "5": [[0, 0]]}, 7,
+                       self.scenario)
+        self.assertEqual(plan_key({"5": [[0, 0]], "10": [[3, 4], [1, 2]]},
+                                  7, self.scenario), key)
+        # the same cell twice is the same drop
+        self.assertEqual(plan_key({"5": [[0, 0], [0, 0]],
+                                   "10": [[3, 4], [1, 2]]}, 7, self.scenario),
+                         key)
+
+    def test_empty_steps(self):
+        key = plan_key({"5": [[0, 0]]}, 7, self.scenario)
+        for empty in ([], None):
+            self.assertEqual(plan_key({"5": [[0, 0]], "7": empty}, 7,
+                                      self.scenario), key)
+
+    def test_differences(self):
+        key = plan_key(plan(1), 7, self.scenario)
+        self.assertNotEqual(plan_key(plan(2), 7, self.scenario), key)
+        self.assertNotEqual(plan_key(plan(1), 8, self.scenario), key)
+        self.assertNotEqual(plan_key(plan(1), spawn_seeds(7, 1)[0],
+                                     self.scenario), key)
+        self.assertNotEqual(plan_key(plan(1), 7, dict(self.scenario,
+                                                      fidelity=4)), key)
+        self.assertNotEqual(plan_key({"11": [[1, 0]]}, 7, self.scenario),
+                            key)
+
+
+class TestFitnessCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "fitness_cache.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_persists(self):
+        cache = FitnessCache(self.path)
+        self.assertNotIn("a", cache)
+        cache["a"] = 240
+        cache.save()
+        reloaded = FitnessCache(self.path)
+        self.assertIn("a", reloaded)
+        self.assertEqual(reloaded["a"], 240)
+        self.assertEqual(os.listdir(self.dir.name), ["fitness_cache.json"])
+        # without a path nothing is written
+        FitnessCache().save()
+        self.assertEqual(os.listdir(self.dir.name), ["fitness_cache.json"])
+
+    def test_interrupted_save(self):
+        cache = FitnessCache(self.path)
+        cache["a"] = 240
+        cache.save()
+        cache["b"] = 250
+        with mock.patch.object(water_dropping_ea.json, "dump",
+                               side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                cache.save()
+        # the saved cache is left whole
+        self.assertEqual(FitnessCache(self.path).scores, {"a": 240})
+
+
+class TestEvaluatePopulation(unittest.TestCase):
+    def test_duplicates_run_once(self):
+        pool = FakePool()
+        cache = FitnessCache()
+        population = [plan(1), plan(2), plan(1), {"11": [], "10": [[1, 0]]}]
+        seed = seed_sequence(7)
+        scores = evaluate_population(population, seed, pool, cache=cache)
+        self.assertEqual(len(pool.calls), 1)
+        self.assertEqual(pool.calls[0][1], [1, 2])
+        self.assertEqual(scores[0], scores[2])
+        self.assertEqual(scores[0], scores[3])
+        # and a plan already in the cache is not run again
+        self.assertEqual(evaluate_population([plan(2), plan(3)], seed, pool,
+                                             cache=cache)[0], scores[1])
+        self.assertEqual(pool.calls[1][1], [3])
+
+
+class TestRacePopulation(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        self.population = [plan(n) for n in range(10)]
+
+    def race(self, **kwargs):
+        return race_population(self.population, 7, self.pool,
+                               cache=FitnessCache(), **kwargs)
+
+    def test_halving_schedule(self):
+        scores, runs = self.race(initial_seeds=2, max_seeds=8, eta=2)
+        # ceil(10 / 2) = 5 plans go on from 2 seeds to 4, ceil(5 / 2) = 3
+        # from 4 to 8
+        self.assertEqual([len(ns) for _, ns, _ in self.pool.calls],
+                         [10, 10, 5, 5, 3, 3, 3, 3])
+        self.assertEqual(sorted(runs), [2] * 5 + [4] * 2 + [8] * 3)
+        # the best plans are the ones raced furthest
+        self.assertEqual([runs[n] for n in (9, 8, 7, 6, 5)], [8, 8, 8, 4, 4])
+        for n in range(10):
+            self.assertEqual(len(self.pool.seeds_of(n)), runs[n])
+
+    def test_odd_survivors(self):
+        self.population = [plan(n) for n in range(7)]
+        _, runs = self.race(initial_seeds=1, max_seeds=9, eta=3)
+        # ceil(7 / 3) = 3 plans go on to 3 seeds, ceil(3 / 3) = 1 to 9
+        self.assertEqual(sorted(runs), [1] * 4 + [3] * 2 + [9])
+
+    def test_common_random_numbers(self):
+        _, runs = self.race(initial_seeds=2, max_seeds=8, eta=2)
+        seeds = [seed_key(seed) for seed in spawn_seeds(7, 8)]
+        for n in range(10):
+            self.assertEqual(self.pool.seeds_of(n), seeds[:runs[n]])
+
+    def test_mean_scores(self):
+        scores, runs = self.race(initial_seeds=2, max_seeds=8, eta=2)
+        for n in range(10):
+            noise = [int(seed.generate_state(1)[0] % 5)
+                     for seed in spawn_seeds(7, runs[n])]
+            self.assertAlmostEqual(scores[n], 10 * n + np.mean(noise))
+
+    def test_single_seed(self):
+        scores, runs = self.race(max_seeds=1)
+        expected = evaluate_population(self.population, spawn_seeds(7, 1)[0],
+                                       FakePool(), cache=FitnessCache())
+        self.assertEqual(scores, expected)
+        self.assertEqual(runs, [1] * 10)
+        self.assertEqual(len(self.pool.calls), 1)
+
+
+class TestFidelityLadder(unittest.TestCase):
+    def setUp(self):
+        random.seed(3)
+        self.pool = FakePool()
+        self.population = [plan(n) for n in range(10)]
+
+    def test_full_resolution_by_default(self):
+        scores, levels, runs = FidelityLadder().evaluate(
+            self.population, 7, self.pool, cache=FitnessCache())
+        self.assertEqual(levels, [1] * 10)
+        self.assertEqual(runs, [1] * 10)
+        self.assertEqual(scores, race_population(
+            self.population, 7, FakePool(), cache=FitnessCache(),
+            max_seeds=1)[0])
+
+    def test_bias_corrected(self):
+        ladder = FidelityLadder((4, 1), promote=0.5, calibrate=3)
+        scores, levels, runs = ladder.evaluate(
+            self.population, 7, self.pool, cache=FitnessCache(),
+            max_seeds=4)
+        self.assertEqual(ladder.bias(4), -COARSE_BIAS)
+        self.assertEqual(ladder.counts[4], 3)
+        self.assertEqual(levels, [4] * 5 + [1] * 5)
+        # the coarse scores are corrected to the first seed's full
+        # resolution score
+        first_seed = spawn_seeds(7, 1)[0]
+        noise = int(first_seed.generate_state(1)[0] % 5)
+        for n in range(5):
+            self.assertEqual(scores[n], 10 * n + noise)
+        # the promoted plans are raced on seeds starting with the coarse
+        # runs' seed
+        for n in range(5, 10):
+            self.assertEqual(self.pool.seeds_of(n, 4), [seed_key(first_seed)])
+            self.assertEqual(self.pool.seeds_of(n)[0], seed_key(first_seed))
+
+    def test_calibrated_on_a_sample(self):
+        ladder = FidelityLadder((4, 1), promote=0.2, calibrate=2)
+        for gen in range(3):
+            ladder.evaluate(self.population, gen, self.pool,
+                            cache=FitnessCache())
+        # two plans a generation, whichever are promoted
+        self.assertEqual(ladder.counts[4], 6)
+        # plans other than the promoted 8 and 9 were run at full resolution
+        full = {n for _, ns, f in self.pool.calls if f == 1 for n in ns}
+        self.assertTrue(full - {8, 9})
+
+
+class TestSavePopulation(unittest.TestCase):
+    def test_scores_saved_with_fidelity(self):
+        population = [plan(n) for n in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "population_1.json")
+            save_population(population, [1.5, 2, 3], [4, 1, 1], path)
+            self.assertEqual(water_dropping_ea.load_population(path),
+                             population)
+            with open(os.path.join(directory,
+                                   "population_1_scores.json")) as f:
+                scores = json.load(f)
+        self.assertEqual(scores, [{"fitness": 1.5, "fidelity": 4},
+                                  {"fitness": 2, "fidelity": 1},
+                                  {"fitness": 3, "fidelity": 1}])
+
+
+class TestTournyInsertion(unittest.TestCase):
+    def test_replaces_only_a_worse_member(self):
+        random.seed(5)
+        for _ in range(200):
+            evaluated = [(plan(n), fitness) for n, fitness
+                         in enumerate(random.sample(range(100), 8))]
+            before = list(evaluated)
+            fitness = random.randrange(100)
+            tourny_insertion(evaluated, plan(99), fitness)
+            replaced = [n for n in range(8) if evaluated[n] != before[n]]
+            self.assertLessEqual(len(replaced), 1)
+            for n in replaced:
+                self.assertLess(before[n][1], fitness)
+                self.assertEqual(evaluated[n], (plan(99), fitness))
+
+    def test_worst_of_all(self):
+        evaluated = [(plan(n), 10 * n) for n in range(5)]
+        tourny_insertion(evaluated, plan(99), -1, k=5)
+        self.assertEqual(evaluated, [(plan(n), 10 * n) for n in range(5)])
+        tourny_insertion(evaluated, plan(99), 15, k=5)
+        self.assertEqual([fitness for _, fitness in evaluated],
+                         [15, 10, 20, 30, 40])
+
+
+class TestSteadyState(unittest.TestCase):
+    def test_short_run(self):
+        random.seed(2)
+        population = generate_many_plans(6)
+        pool = FakePool()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "population_1.json")
+            evaluated = steady_state_ea(np.random.SeedSequence(4), pool,
+                                        population, evaluations=30,
+                                        num_iterations=10, path=path)
+            self.assertEqual(len(water_dropping_ea.load_population(path)), 6)
+        self.assertEqual(len(pool.calls), 30)
+        self.assertEqual(len(evaluated), 6)
+        # the population starts as the plans given, scored as they come
+        # back, and children only ever replace worse members
+        initial = [drops(individual) for individual in population]
+        self.assertEqual([fitness for _, fitness in pool.calls[:6]],
+                         initial)
+        final = [fitness for _, fitness in evaluated]
+        self.assertTrue(any(individual not in population
+                            for individual, _ in evaluated))
+        self.assertGreaterEqual(max(final), max(initial))
+        self.assertGreaterEqual(min(final), min(initial))
+        self.assertGreater(sum(final), sum(initial))
+        for individual, fitness in evaluated:
+            self.assertEqual(fitness, drops(individual))
+
+    def test_seed_sequence(self):
+        # a SeedSequence seeds the search as its int would
+        for seed in (5, np.random.SeedSequence(5)):
+            random.seed(0)
+            with tempfile.TemporaryDirectory() as directory:
+                evaluated = steady_state_ea(
+                    seed, FakePool(), generate_many_plans(4),
+                    evaluations=12, num_iterations=10,
+                    path=os.path.join(directory, "population_1.json"))
+            if isinstance(seed, int):
+                expected = evaluated
+        self.assertEqual(evaluated, expected)
+
+
+class TestNextGeneration(unittest.TestCase):
+    def test_immigrants(self):
+        random.seed(1)
+        population = generate_many_plans(6)
+        fitness_scores = [0, 5, 1, 4, 2, 3]
+        immigrant = {"1": [[199, 0]]}
+        new = next_generation(population, fitness_scores, None,
+                              elite_count=2, immigrants=[immigrant])
+        self.assertEqual(len(new), 6)
+        # the elites, then the immigrants, then the children
+        self.assertEqual(new[:3], [population[1], population[3], immigrant])
+        self.assertEqual(next_generation(population, fitness_scores, None,
+                                         elite_count=2,
+                                         immigrants=[immigrant] * 4),
+                         [population[1], population[3]] + [immigrant] * 4)
+
+
+def failing_island(index, *args):
+    """An island that fails at once, while the others run on"""
+    if index == 1:
+        raise ValueError("island 1 fails")
+    time.sleep(60)
+
+
+# A tiny island model: a few small plans, run for a few steps
+ISLAND_RUN = {"num_generations": 2, "migration_interval": 1, "migrants": 1,
+              "num_iterations": 10, "population_size": 4}
+
+
+class TestIslands(unittest.TestCase):
+    def test_island(self):
+        # migrants from island 0 are waiting, island 1 sends its own on
+        inbox = queue.Queue()
+        inbox.put((0, [{"1": [[199, 0]]}]))
+        outbox = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        _island(1, 3, inbox, outbox, results, ISLAND_RUN["num_generations"],
+                ISLAND_RUN["migration_interval"], ISLAND_RUN["migrants"], 1,
+                2, 1, (1,), 0.5, ISLAND_RUN["num_iterations"],
+                ISLAND_RUN["population_size"])
+        index, population, fitness_scores, levels, sources = results.get()
+        self.assertEqual(index, 1)
+        self.assertEqual(len(population), 4)
+        self.assertEqual(len(fitness_scores), 4)
+        self.assertEqual(levels, [1] * 4)
+        self.assertEqual(sources, [0])
+        # a migrant a generation, tagged with the island it came from
+        for _ in range(ISLAND_RUN["num_generations"]):
+            source, migrants = outbox.get(timeout=10)
+            self.assertEqual(source, 1)
+            self.assertEqual(len(migrants), 1)
+        self.assertRaises(queue.Empty, outbox.get, timeout=0.1)
+
+    def test_island_ea(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "population_1.json")
+            finished = island_ea(3, islands=3, path=path, **ISLAND_RUN)
+            self.assertEqual(len(water_dropping_ea.load_population(path)),
+                             3 * ISLAND_RUN["population_size"])
+        # every island's results, and every process joined
+        self.assertEqual([result[0] for result in finished], [0, 1, 2])
+        self.assertEqual(multiprocessing.active_children(), [])
+        for index, population, fitness_scores, levels, sources in finished:
+            self.assertEqual(len(population), ISLAND_RUN["population_size"])
+            self.assertEqual(len(fitness_scores), len(population))
+            # migrants only ever come from the last island round the ring
+            self.assertEqual(set(sources) - {(index - 1) % 3}, set())
+
+    def test_failed_island(self):
+        island = water_dropping_ea._island
+        water_dropping_ea._island = failing_island
+        try:
+            start = time.time()
+            with self.assertRaises(RuntimeError):
+                island_ea(3, islands=3, **ISLAND_RUN)
+        finally:
+            water_dropping_ea._island = island
+        # the islands still running were stopped rather than waited for
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+class TestDefaults(unittest.TestCase):
+    def test_racing_is_opt_in(self):
+        for func in (water_dropping_ea.ea, water_dropping_ea.island_ea):
+            parameters = inspect.signature(func).parameters
+            self.assertEqual(parameters["max_seeds"].default, 1)
+            self.assertEqual(parameters["fidelities"].default, (1,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import sys, inspect, unittest
+from unittest import mock
+import numpy as np
+this_file_loc = (inspect.stack()[0][1])
+main_dir_loc = this_file_loc[:this_file_loc.index('test')]
+sys.path.append(main_dir_loc)
+sys.path.append(main_dir_loc + 'capyle')
+sys.path.append(main_dir_loc + 'capyle/ca')
+sys.path.append(main_dir_loc + 'capyle/guicomponents')
+
+from capyle.wind import Wind
+
+#----------------------------------------------------------------------
+
+class TestWindArrays(unittest.TestCase):
+    def setUp(self):
+        self.wind = Wind(13.9, 30, 37.284, 14.778,
+                         rng=np.random.default_rng(4))
+
+    def test_generator_speeds(self):
+        speeds = self.wind.sample_wind_speeds((8, 5, 5))
+        again = Wind(13.9, 30, 37.284, 14.778, rng=np.random.default_rng(4))
+        self.assertEqual(speeds.shape, (8, 5, 5))
+        self.assertTrue(np.array_equal(speeds,
+                                       again.sample_wind_speeds((8, 5, 5))))
+
+    def test_matches_scalar(self):
+        directions = np.arange(0, 360, 45)
+        self.wind.rng = mock.Mock(**{'random.return_value': 0.3})
+        expected = [self.wind.fire_spread_contribution(d) for d in directions]
+        speed = self.wind.sample_wind_speed()
+        angles = self.wind.direction_angles(directions)
+        self.assertTrue(np.allclose(
+            self.wind.angle_contributions(angles, speed), expected))
+        self.assertTrue(np.allclose(
+            self.wind.fire_spread_contributions(directions, speed), expected))
+
+    def test_angles_follow_direction(self):
+        directions = np.array([0, 90, 180, 270])
+        self.assertTrue(np.allclose(self.wind.direction_angles(directions),
+                                    np.radians([30, 60, 150, 120])))
+        self.wind.direction = 90
+        self.assertTrue(np.allclose(self.wind.direction_angles(directions),
+                                    np.radians([90, 0, 90, 180])))
+
+    def test_step_schedule(self):
+        self.assertIsNone(self.wind.scheduled_speeds(1))
+        self.wind.set_schedule(3)
+        speeds = [self.wind.scheduled_speeds(t) for t in range(1, 5)]
+        self.assertEqual(np.ndim(speeds[0]), 0)
+        self.assertEqual(speeds[3], speeds[0])
+        self.wind.clear_schedule()
+        self.assertIsNone(self.wind.scheduled_speeds(1))
+
+    def test_tile_schedule(self):
+        self.wind.set_schedule(2, shape=(5, 7), tile_size=3)
+        speeds = self.wind.scheduled_speeds(2)
+        self.assertEqual(speeds.shape, (5, 7))
+        # one speed per 3x3 tile, the last tiles cut short by the grid edge
+        self.assertEqual(len(np.unique(speeds)), 6)
+        self.assertTrue(np.all(speeds[:3, :3] == speeds[0, 0]))
+        self.assertTrue(np.all(speeds[3:, 6:] == speeds[4, 6]))
+
+
+if __name__ == '__main__':
+    unittest.main()
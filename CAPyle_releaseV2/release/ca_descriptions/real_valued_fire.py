@@ -3,9 +3,7 @@
 
 # --- Set up executable path, do not edit ---
 import copy
-import math
 import numbers
-import random
 import sys
 import inspect
 from functools import partial
@@ -24,10 +22,12 @@ import CA_tool.capyle as capyle_module
 from matplotlib import colors
 from CA_tool.capyle.ca import Grid2D
 import CA_tool.capyle.utils as utils
-import numpy as np
 from CAPyle_releaseV2.release.CA_tool.capyle.terrain_cell import TerrainCell, TerrainType, cell_to_state_index
+from CAPyle_releaseV2.release.CA_tool.capyle.terrain_grid import TerrainGrid
 from CAPyle_releaseV2.release.CA_tool.capyle.wind import Wind
-from CAPyle_releaseV2.release.CA_tool.capyle.regrow import regrow_transition_func, REGROWTH_RATE
+from CAPyle_releaseV2.release.CA_tool.capyle.regrow import regrow_transition_func, vectorised_regrow_transition_func, seed_spread_weights, REGROWTH_RATE
+from CAPyle_releaseV2.release.CA_tool.capyle.fire_spread import FIRE_DIRECTIONS, spread_probability, slope_kernels, fire_transition_func, frontier_transition_func
+from CAPyle_releaseV2.release.CA_tool.capyle.seeding import new_seed, run_streams
 
 EDGE_W = 0.785398
 CORNER_W = 0.214601
@@ -41,16 +41,17 @@ def transition_func(
     time_step,
     wind_distribution: Wind, 
     water_dropping_plan=None,
-    config=None
+    config=None,
+    out=None,
+    rng=None
 ):
-    new_grid = np.empty_like(grid)    
+    # draws come from rng, a freshly seeded "spread" stream if not given
+    rng = run_streams(new_seed())["spread"] if rng is None else rng
+    new_grid = utils.copy_into(grid, out)
     rows, cols = grid.shape
-
-    neighbour_offsets = [
-        (-1,-1), (0,-1), (1,-1),
-        (-1,0),           (1,0),
-        (-1,1),  (0,1),   (1,1)
-    ]
+    # cells of a column-store grid are changed in place through views,
+    # rather than copied and put back
+    columnar = getattr(new_grid, "columnar", False)
 
     _plan = water_dropping_plan if isinstance(water_dropping_plan, dict) else {}
     drops = set(tuple(coord) for coord in _plan.get(str(time_step), []))
@@ -59,7 +60,7 @@ def transition_func(
     for x in range(rows):
         for y in range(cols):
             old_cell = grid[x, y]
-            new_cell = old_cell.copy()
+            new_cell = new_grid[x, y] if columnar else old_cell.copy()
 
             if (x, y) in drops:
                 new_cell.drop_water()
@@ -70,25 +71,14 @@ def transition_func(
                 for idx, ns_array in enumerate(neighbour_states):
                     neighbour = ns_array[x, y]
                     if neighbour is not None and not isinstance(neighbour, numbers.Integral) and neighbour.burning:
-                        dx, dy = neighbour_offsets[idx]
-
-                        ignition_source = neighbour.type
-                        ignition_prob = old_cell.get_ignition_prob(ignition_source)
-
-                        moisture = old_cell.moisture
-                        moisture_effect = 1 - 2.59*moisture + 5.11*moisture**2 - 3.52*moisture**3
-                        moisture_effect = max(0.0, min(1.0, moisture_effect))
-
-                        fire_dir = (math.degrees(math.atan2(dy, dx)) - 270 + 360) % 360
-
-                        wind_prob = wind_distribution.fire_spread_contribution(fire_dir)
-
-                        slope_effect = old_cell.get_slope_effect(neighbour.elevation)
-
-                        prob = (1 - (1 - ignition_prob) ** wind_prob) * moisture_effect * slope_effect
-                        prob = max(0.0, min(prob, 1.0))
-
-                        if random.random() < prob:
+                        prob = spread_probability(
+                            old_cell,
+                            neighbour,
+                            FIRE_DIRECTIONS[idx],
+                            wind_distribution
+                        )
+
+                        if rng.random() < prob:
                             new_cell.ignite()
                             if new_cell.type == TerrainType.TOWN:
                                 town_ignited = True
@@ -97,14 +87,46 @@ def transition_func(
                             break 
             
             if old_cell.burning:
-                new_cell.burn()
+                new_cell.burn(rng)
 
             new_cell._strip_moisture()
 
-            new_grid[x, y] = new_cell
+            if not columnar:
+                new_grid[x, y] = new_cell
 
     return new_grid, town_ignited
 
+transition_func.writes_output = True
+
+def get_transition_func(config, slope=None):
+    # Array version of the fire rule unless config.vectorised is turned off,
+    # working on the fire front only unless config.frontier is turned off.
+    # The slope effects are worked out once for the terrain, unless given
+    # (eg. kept with a terrain that is run many times). Draws come from the
+    # run's spread stream
+    rng = run_streams(config.run_seed)["spread"]
+    if getattr(config, "vectorised", True):
+        func = frontier_transition_func
+        if not getattr(config, "frontier", True):
+            func = fire_transition_func
+        if slope is None:
+            slope = slope_kernels(config.initial_grid.elevation)
+        return partial(func, slope=slope, rng=rng)
+    return partial(transition_func, rng=rng)
+
+def get_regrow_transition_func(config):
+    # Array version of the regrowth rule unless config.vectorised is turned off
+    rng = run_streams(config.run_seed)["regrow"]
+    if getattr(config, "vectorised", True):
+        return partial(vectorised_regrow_transition_func,
+                       spread_weights=seed_spread_weights(config.initial_grid.elevation),
+                       rng=rng)
+    return partial(regrow_transition_func, rng=rng)
+
+def get_wind(config, wind_speed, direction, k, c):
+    # The wind, drawing from the run's wind stream
+    return Wind(wind_speed, direction, k, c, rng=run_streams(config.run_seed)["wind"])
+
 def setup(args, wind_direction, num_generations = None, start = None):
     config_path = args[0]
     config = utils.load(config_path)
@@ -126,37 +148,29 @@ def setup(args, wind_direction, num_generations = None, start = None):
     else:
         cells_burnt = False
 
-    grid = np.empty((200,200), TerrainCell)
-    for x in range(0,200):
-        for y in range(0,200):
-            grid[x,y] = TerrainCell(
-                TerrainType.CHAPARRAL,
-                burnt = cells_burnt
-            )
+    grid = TerrainGrid((200,200))
+    grid[:, :] = TerrainCell(
+        TerrainType.CHAPARRAL,
+        burnt = cells_burnt
+    )
 
     # small flick at the top(north) of forest
-    for x in range(20,30):
-        for y in range(20,80):
-            grid[x,y] = TerrainCell(
-                TerrainType.DENSE_FOREST,
-                burnt = cells_burnt
-            )
+    grid[20:30, 20:80] = TerrainCell(
+        TerrainType.DENSE_FOREST,
+        burnt = cells_burnt
+    )
     
     # tall trunk of forest
-    for x in range(30,100):
-        for y in range(20,50):
-            grid[x,y] = TerrainCell(
-                TerrainType.DENSE_FOREST,
-                burnt = cells_burnt
-            )
+    grid[30:100, 20:50] = TerrainCell(
+        TerrainType.DENSE_FOREST,
+        burnt = cells_burnt
+    )
 
     # large south block of forest
-    for x in range(100,140):
-        for y in range(20,100):
-            grid[x,y] = TerrainCell(
-                TerrainType.DENSE_FOREST,
-                burnt = cells_burnt
-            )
+    grid[100:140, 20:100] = TerrainCell(
+        TerrainType.DENSE_FOREST,
+        burnt = cells_burnt
+    )
 
     # CANYON
     canyon_x_start = 40
@@ -186,30 +200,23 @@ def setup(args, wind_direction, num_generations = None, start = None):
             t2 = (t - (desc_pct + flat_pct)) / asc_pct
             elev = canyon_depth + t2 * (0 - canyon_depth)
 
-        for y in range(140,150):
-            grid[x,y] = TerrainCell(
-                TerrainType.CANYON_SCRUBLAND,
-                burnt = cells_burnt,
-                elevation=elev
-            )
+        grid[x, 140:150] = TerrainCell(
+            TerrainType.CANYON_SCRUBLAND,
+            burnt = cells_burnt,
+            elevation=elev
+        )
 
-    for x in range(40,80):
-        for y in range(70,80):
-            grid[x,y] = TerrainCell(
-                TerrainType.LAKE
-            )
+    grid[40:80, 70:80] = TerrainCell(
+        TerrainType.LAKE
+    )
 
-    for x in range(160,170):
-        for y in range(100,160):
-            grid[x,y] = TerrainCell(
-                TerrainType.LAKE
-            )
+    grid[160:170, 100:160] = TerrainCell(
+        TerrainType.LAKE
+    )
 
-    for x in range(176,186):
-        for y in range(56,66):
-            grid[x,y] = TerrainCell(
-                TerrainType.TOWN
-            )
+    grid[176:186, 56:66] = TerrainCell(
+        TerrainType.TOWN
+    )
     
     # add ignition sources if enabled
     if (getattr(config, "power_plant_enabled", False) or start == "POWER_PLANT") and not cells_burnt:
@@ -219,41 +226,33 @@ def setup(args, wind_direction, num_generations = None, start = None):
 
     # add intervention 1 - extended forest left (if enabled)
     if getattr(config, "intervention_1_enabled", False):
-        for x in range(100, 140):
-            for y in range(0, 20):
-                grid[x,y] = TerrainCell(
-                    TerrainType.DENSE_FOREST,
-                    burnt = cells_burnt
-                )
+        grid[100:140, 0:20] = TerrainCell(
+            TerrainType.DENSE_FOREST,
+            burnt = cells_burnt
+        )
 
     # add intervention 2 - extended forest down (if enabled)
     if getattr(config, "intervention_2_enabled", False):
-        for x in range(140, 160):
-            for y in range(20, 100):
-                grid[x,y] = TerrainCell(
-                    TerrainType.DENSE_FOREST,
-                    burnt = cells_burnt
-                )
+        grid[140:160, 20:100] = TerrainCell(
+            TerrainType.DENSE_FOREST,
+            burnt = cells_burnt
+        )
 
     # if both forest interventions are enabled - make square
     if getattr(config, "intervention_1_enabled", False) and getattr(config, "intervention_2_enabled", False):
-        for x in range(140, 160):
-            for y in range(0, 20):
-                grid[x,y] = TerrainCell(
-                    TerrainType.DENSE_FOREST,
-                    burnt = cells_burnt
-                )
+        grid[140:160, 0:20] = TerrainCell(
+            TerrainType.DENSE_FOREST,
+            burnt = cells_burnt
+        )
 
     # add intervention 3 - flood the canyon (if enabled)
     if getattr(config, "intervention_3_enabled", False):
-        for x in range(40,130):
-            for y in range(140,150):
-                grid[x,y] = TerrainCell(
-                    TerrainType.LAKE
-                )
+        grid[40:130, 140:150] = TerrainCell(
+            TerrainType.LAKE
+        )
 
     config.initial_grid = grid
-    config.dtype = TerrainCell
+    config.dtype = TerrainGrid
     config.town_ignition_step = None
     
     config.state_index_function = cell_to_state_index
@@ -286,8 +285,19 @@ def setup(args, wind_direction, num_generations = None, start = None):
     config.state_colors = state_colors
 
     config.wrap = False
+    # run the array version of the transition function unless turned off
+    config.vectorised = getattr(config, "vectorised", True)
+    config.frontier = getattr(config, "frontier", True)
+    # stream the timeline to disk as it runs, see run_and_save, otherwise
+    # save it delta coded and zlib compressed, see utils.save_timeline
+    config.stream_timeline = getattr(config, "stream_timeline", True)
+    config.compress_timeline = getattr(config, "compress_timeline", True)
     if num_generations:
         config.num_generations = num_generations
+    # the seed of this run's random streams, fresh unless config.seed fixes
+    # it. Setting config.seed to a run's run_seed repeats that run exactly
+    seed = getattr(config, "seed", None)
+    config.run_seed = new_seed() if seed is None else seed
     config.timeline_path = f"wd_{wind_direction}_timeline"
 
     if len(args) == 2:
@@ -308,7 +318,7 @@ def main(
     # Open the config object
     config = setup(sys.argv[1:], direction)
 
-    wind = Wind(wind_speed, direction, k, c)
+    wind = get_wind(config, wind_speed, direction, k, c)
     
     if water_plan_path is not None and water_dropping_plan is None:
         with open(water_plan_path, "r") as f:
@@ -325,14 +335,14 @@ def main(
         grid = Grid2D(
             config, 
             partial(
-                regrow_transition_func 
+                get_regrow_transition_func(config) 
             )
         )
     else:
         grid = Grid2D(
             config, 
             partial(
-                transition_func, 
+                get_transition_func(config), 
                 wind_distribution=wind, 
                 water_dropping_plan=water_dropping_plan,
                 config=config
@@ -340,13 +350,29 @@ def main(
         )
 
     # Run the CA, save grid state every generation to timeline
-    timeline, time_step = grid.run()
+    timeline, time_step = run_and_save(grid, config)
     print(f"Stopping Condition met at time {time_step}")
 
     # save updated config to file
     config.save()
-    # save timeline to file
-    utils.save(timeline, config.timeline_path)
+
+
+def run_and_save(grid, config, progress=None):
+    """Run the CA and save its timeline to config.timeline_path
+
+    With config.stream_timeline set the frames are written to the file as
+    they are produced, so the run is not limited by memory and the GUI can
+    map the file (see utils.load_timeline) rather than unpickling it.
+
+    Returns:
+        (numpy.ndarray, int): the timeline and time step from Grid.run
+    """
+    if config.stream_timeline:
+        return grid.run(progress, timeline_path=config.timeline_path)
+    timeline, time_step = grid.run(progress)
+    utils.save_timeline(timeline, config.timeline_path,
+                        compress=config.compress_timeline)
+    return timeline, time_step
 
 
 def expand_water_plan(raw_plan, rows, cols):
@@ -442,4 +468,4 @@ if __name__ == "__main__":
     if water_json_path is not None:
         main(water_plan_path=water_json_path)
     else:
-        main()
\ No newline at end of file
+        main()
\ No newline at end of file
@@ -1,35 +1,35 @@
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from test_tool import get_results
+from CAPyle_releaseV2.release.CA_tool.capyle.scenarios import warm_pool
+from CAPyle_releaseV2.release.CA_tool.capyle.seeding import spawn_seeds
 import csv
 from pathlib import Path
 
-def _run_single_direction(direction, iterations_per_direction):
-    t = get_results(
-        direction=direction,
-        num_iterations=iterations_per_direction,
-        start="INCINERATOR"
-    )
-    return direction, t
+def run_wind_direction_possibilities(start_angle=-103, end_angle=77, iterations_per_direction=100, seed=None, pool=None):
+    # Runs on the given scenarios.warm_pool (eg. one the EA is also using),
+    # otherwise on a new one
+    if pool is None:
+        with warm_pool(starts=("INCINERATOR",)) as pool:
+            return run_wind_direction_possibilities(start_angle, end_angle, iterations_per_direction, seed, pool)
 
-def run_wind_direction_possibilities(start_angle=-103, end_angle=77, iterations_per_direction=100):
     results = {}
 
     directions = list(range(start_angle, end_angle + 1))
+    # each direction's run gets its own stream from the sweep's seed, so the
+    # whole sweep (or any one direction of it) can be repeated
+    seeds = spawn_seeds(seed, len(directions)) if seed is not None else [None] * len(directions)
 
     print(f"Running wind directions from {start_angle}° to {end_angle}°")
     print(f"Each direction will run for {iterations_per_direction} CA iterations.")
     print(f"Using {len(directions)} parallel tasks.\n")
 
-    with ProcessPoolExecutor() as executor:
-        futures = {
-            executor.submit(_run_single_direction, d, iterations_per_direction): d
-            for d in directions
-        }
+    def completed(index, t):
+        print(f"→ Completed {directions[index]}°: time = {t}")
+        results[directions[index]] = t
 
-        for future in as_completed(futures):
-            direction, t = future.result()
-            print(f"→ Completed {direction}°: time = {t}")
-            results[direction] = t
+    pool.run_many(
+        ({"direction": d, "num_iterations": iterations_per_direction, "start": "INCINERATOR", "seed": s}
+         for d, s in zip(directions, seeds)),
+        on_result=completed
+    )
 
     print("\nAll directions complete.\nSummary:")
     for d in sorted(results.keys()):
@@ -9,10 +9,12 @@ sys.path.append("/src/CAPyle_releaseV2/release/CA_tool/capyle")
 sys.path.append("/src/CAPyle_releaseV2/release/CA_tool/capyle/guicomponents")
 sys.path.append("/src/CAPyle_releaseV2/release/CA_tool/capyle/ca")
 
-from CAPyle_releaseV2.release.ca_descriptions.real_valued_fire import setup, transition_func
-from CAPyle_releaseV2.release.CA_tool.capyle import utils
+from CAPyle_releaseV2.release.ca_descriptions.real_valued_fire import setup, get_transition_func, get_wind, run_and_save
 from CAPyle_releaseV2.release.CA_tool.capyle.ca.grid2d import Grid2D
-from CAPyle_releaseV2.release.CA_tool.capyle.wind import Wind
+from CAPyle_releaseV2.release.CA_tool.capyle.ensemble import FireEnsemble
+# Running many simulations (on a ScenarioPool, forking plans, at a lower
+# fidelity) is done by capyle.scenarios, these are single runs
+from CAPyle_releaseV2.release.CA_tool.capyle.scenarios import DEFAULT_CONFIG
 
 def get_results(
     wind_speed = 13.892, 
@@ -23,18 +25,49 @@ def get_results(
     timeline_path="timeline",
     num_iterations = 100,
     start = "POWER_PLANT",
-    config_path="CAPyle_releaseV2/release/CA_tool/temp/config.pkl"
+    config_path=DEFAULT_CONFIG,
+    progress=None,
+    seed=None
 ):
     args = [config_path]
     config = setup(args, direction, num_iterations, start)
-    wind = Wind(wind_speed, direction, k, c)
-    grid = Grid2D(config, partial(transition_func, wind_distribution=wind, water_dropping_plan=water_dropping_plan))
+    config.timeline_path = timeline_path
+    # a given seed (eg. one of seeding.spawn_seeds for each worker) fixes the
+    # run's random streams
+    if seed is not None:
+        config.run_seed = seed
+    wind = get_wind(config, wind_speed, direction, k, c)
+    grid = Grid2D(config, partial(get_transition_func(config), wind_distribution=wind, water_dropping_plan=water_dropping_plan))
 
-    timeline, time_step = grid.run()
-    utils.save(timeline, config.timeline_path)
+    timeline, time_step = run_and_save(grid, config, progress)
 
     return time_step
 
+def get_ensemble_results(
+    replicas = 64,
+    wind_speed = 13.892, 
+    direction = 0, 
+    k = 37.284, 
+    c = 14.778, 
+    water_dropping_plan = None, 
+    num_iterations = 100,
+    start = "POWER_PLANT",
+    config_path=DEFAULT_CONFIG,
+    seed=None
+):
+    """get_results for many replicas at once, run together by a FireEnsemble.
+    Returns the time step each replica stopped at on lighting a town,
+    numbered as get_results numbers it (-1 if it never did), and the cells
+    each had burning or burnt when it stopped"""
+    args = [config_path]
+    config = setup(args, direction, num_iterations, start)
+    if seed is not None:
+        config.run_seed = seed
+    wind = get_wind(config, wind_speed, direction, k, c)
+    ensemble = FireEnsemble(config.initial_grid, replicas, wind, water_dropping_plan, seed=config.run_seed)
+
+    return ensemble.run(config.num_generations)
+
 if __name__ == "__main__":
     t = get_results(num_iterations=300)
     print(f"Time: {t}")
\ No newline at end of file
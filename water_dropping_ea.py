@@ -1,8 +1,12 @@
 
+import hashlib
 import json
+import os
+import queue
 import random
-from multiprocessing import Pool, cpu_count
-from test_tool import get_results
+from multiprocessing import Process, Queue, cpu_count
+from CAPyle_releaseV2.release.CA_tool.capyle.scenarios import run_scenario, warm_pool, scenario_digest, predicted_arrival, predicted_town_arrival, SerialScenarios
+from CAPyle_releaseV2.release.CA_tool.capyle.seeding import seed_sequence, child_seed, seed_key, spawn_seeds, new_seed
 
 """
 This is the code for the evolutionary algorithm. We tried running it a few times
@@ -19,16 +23,24 @@ def predict_fire_position(
     t,
     total_steps=250,
     start_x=0,
-    end_x=180
+    end_x=180,
+    arrival=None,
+    max_y=80
 ):
     # Used to restrict population to more useful individuals
+    # With an arrival map (see scenarios.predicted_arrival) this is the
+    # furthest row the fire is expected to have reached by t, among the
+    # columns strips are dropped in
+    if arrival is not None:
+        reached = (arrival[:, :max_y + 1] <= t).any(axis=1).nonzero()[0]
+        return reached.max() if len(reached) else start_x
     progression = t / total_steps
     x_prediction = start_x + progression * (end_x - start_x)
 
     return x_prediction
 
-def make_strip_near_fire(t, max_x=200, max_y=80):
-    x_predicted = predict_fire_position(t)
+def make_strip_near_fire(t, max_x=200, max_y=80, arrival=None):
+    x_predicted = predict_fire_position(t, arrival=arrival, max_y=max_y)
 
     # More random offset
     offset_x = random.randint(-8, 20)
@@ -44,13 +56,13 @@ def make_strip_near_fire(t, max_x=200, max_y=80):
 
     return [ [x1, y1], [x2, y2] ]
 
-def generate_plan():
+def generate_plan(arrival=None):
     # Sample 20 ts, because 20 * 10 = 12,500,000 / (250 * 250)
     # i.e., 20 strips of 10 equals the total area of water we can drop
     chosen = sorted(random.sample(range(250), k=20))
     plan = {}
     for t in chosen:
-        plan[str(t)] = make_strip_near_fire(t)
+        plan[str(t)] = make_strip_near_fire(t, arrival=arrival)
     return plan
 
 def generate_and_save_one_plan(path="one_plan.json"):
@@ -59,11 +71,11 @@ def generate_and_save_one_plan(path="one_plan.json"):
         json.dump(plan, f, indent=2)
     return plan
 
-def generate_many_plans(n=30):
+def generate_many_plans(n=30, arrival=None):
     # Population
-    return [generate_plan() for _ in range(n)]
+    return [generate_plan(arrival) for _ in range(n)]
 
-def mutate_plan(plan, mutation_rate=1.0):
+def mutate_plan(plan, mutation_rate=1.0, arrival=None):
     # Remove random strip of water, add another
     new_plan = dict(plan)
 
@@ -81,11 +93,11 @@ def mutate_plan(plan, mutation_rate=1.0):
             continue
 
         new_timestep = random.choice(free_steps)
-        new_plan[str(new_timestep)] = make_strip_near_fire(new_timestep)
+        new_plan[str(new_timestep)] = make_strip_near_fire(new_timestep, arrival=arrival)
 
     return new_plan
 
-def sp_crossover(parent1, parent2):
+def sp_crossover(parent1, parent2, arrival=None):
     p1 = sorted(parent1.items(), key=lambda x: int(x[0]))
     p2 = sorted(parent2.items(), key=lambda x: int(x[0]))
 
@@ -107,29 +119,214 @@ def sp_crossover(parent1, parent2):
         all_steps = set(range(250))
         free_steps = list(all_steps - used_steps)
         t_new = random.choice(free_steps)
-        child[str(t_new)] = make_strip_near_fire(t_new)
+        child[str(t_new)] = make_strip_near_fire(t_new, arrival=arrival)
         used_steps.add(t_new)
 
     return child
 
-def eval_fitness(individual, num_iterations=500):
-    time = get_results(
+def eval_fitness(individual, num_iterations=500, seed=None):
+    time = run_scenario(
         num_iterations=num_iterations,
-        water_dropping_plan=individual
+        water_dropping_plan=individual,
+        seed=seed
     )
 
     return time
 
-def evaluate_population(population):
-    # It takes a long time to run, so we use parallelisation
-    with Pool(cpu_count()) as pool:
-        fitness_scores = pool.map(eval_fitness, population)
-    return fitness_scores
-
-def tourny_selection(population, fitness_scores, k=3):
+def plan_key(plan, seed, scenario):
+    # Hash of everything a seeded run's fitness depends on. A plan is the
+    # set of cells dropped on at each time step, so the order of its time
+    # steps and of the cells in a strip do not matter
+    canonical = {
+        "plan": [
+            [t, sorted(set(tuple(coord) for coord in coords))]
+            for t, coords in sorted(plan.items(), key=lambda x: int(x[0]))
+            if coords
+        ],
+        "seed": seed_key(seed),
+        "scenario": scenario,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+class FitnessCache():
+    # Fitness of the plans already simulated, keyed by plan_key and kept in
+    # a JSON file, so a restarted (or resumed, see load_population) run
+    # does not simulate them again
+    def __init__(self, path=None):
+        self.path = path
+        self.scores = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                self.scores = json.load(f)
+
+    def __contains__(self, key):
+        return key in self.scores
+
+    def __getitem__(self, key):
+        return self.scores[key]
+
+    def __setitem__(self, key, fitness):
+        self.scores[key] = fitness
+
+    def save(self):
+        if self.path is None:
+            return
+        # write then rename, so a run stopped part way never leaves half a file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.scores, f)
+        os.replace(temp_path, self.path)
+
+def evaluate_population(population, seed=None, pool=None, num_iterations=500, cache=None, fidelity=1):
+    # It takes a long time to run, so we use parallelisation, on the given
+    # warm_pool (kept between generations) or a new one. Only the plans are
+    # sent to the workers, the times come back through shared memory
+    # With a seed every plan faces the same random streams (common random
+    # numbers), so differences in fitness come from the plans
+    # A fidelity above 1 runs the plans on the terrain coarsened that many
+    # times (see scenarios.scenario_template), much quicker but biased
+    if pool is None:
+        with warm_pool() as pool:
+            return evaluate_population(population, seed, pool, num_iterations, cache, fidelity)
+    if seed is None:
+        # unseeded runs differ every time, so each plan has to be run
+        time_steps, _ = pool.run_many(
+            {"water_dropping_plan": individual, "num_iterations": num_iterations, "fidelity": fidelity}
+            for individual in population
+        )
+        return time_steps.tolist()
+
+    # A seeded run is repeatable, so each distinct plan is run only once
+    # (elites and unchanged copies of parents come up again and again), and
+    # plans sharing their first drops (eg. children and their parents) share
+    # the simulation of the steps before they differ
+    if cache is None:
+        cache = FitnessCache()
+    scenario = {"num_iterations": num_iterations, "terrain": scenario_digest()}
+    if fidelity != 1:
+        scenario["fidelity"] = fidelity
+    keys = [plan_key(individual, seed, scenario) for individual in population]
+    to_run = {}
+    for key, individual in zip(keys, population):
+        if key not in cache and key not in to_run:
+            to_run[key] = individual
+    if to_run:
+        time_steps, _ = pool.run_plans(list(to_run.values()), num_iterations=num_iterations, seed=seed, fidelity=fidelity)
+        for key, time_step in zip(to_run, time_steps.tolist()):
+            cache[key] = time_step
+        cache.save()
+    return [cache[key] for key in keys]
+
+def race_population(population, seed=None, pool=None, num_iterations=500, cache=None, initial_seeds=2, max_seeds=8, eta=2, fidelity=1):
+    # Successive halving: every plan is run on initial_seeds seeds, then
+    # only the best 1/eta of them on eta times as many, and so on up to
+    # max_seeds, so the runs go on telling the good plans apart rather than
+    # on confirming the bad ones are bad. Every plan faces the same seeds
+    # (common random numbers). Returns the mean fitness of each plan and the
+    # number of seeds it was run on
+    if pool is None:
+        with warm_pool() as pool:
+            return race_population(population, seed, pool, num_iterations, cache, initial_seeds, max_seeds, eta, fidelity)
+    seeds = spawn_seeds(new_seed() if seed is None else seed, max_seeds)
+    totals = [0] * len(population)
+    runs = [0] * len(population)
+    racing = list(range(len(population)))
+    num_seeds = min(initial_seeds, max_seeds)
+    while True:
+        # the racers left have all been run on the same first seeds (the
+        # rest were dropped), so they go on to the next ones together
+        done = runs[racing[0]]
+        assert all(runs[i] == done for i in racing)
+        for run_seed in seeds[done:num_seeds]:
+            scores = evaluate_population([population[i] for i in racing], run_seed, pool, num_iterations, cache, fidelity)
+            for i, score in zip(racing, scores):
+                totals[i] += score
+                runs[i] += 1
+        if num_seeds >= max_seeds or len(racing) <= 1:
+            break
+        racing = sorted(racing, key=lambda i: totals[i] / runs[i], reverse=True)
+        racing = racing[:-(-len(racing) // eta)]
+        num_seeds = min(num_seeds * eta, max_seeds)
+    return [total / n for total, n in zip(totals, runs)], runs
+
+class FidelityLadder():
+    # Multi-fidelity evaluation: every plan is run on the coarsest terrain
+    # (see evaluate_population's fidelity), the most promising promote
+    # fraction of them on the next finer one, and so on, with only the
+    # last few raced (see race_population) on the finest. The default,
+    # fidelities=(1,), runs every plan at full resolution.
+    # Coarse runs are biased (on the default scenario fire reaches the town
+    # about 20 to 30 steps later on average on the 4x coarser terrain, and
+    # the gap varies a lot from plan to plan), so a coarse score is
+    # corrected by the running mean difference between the finest and that
+    # level's scores of the same plans. Those plans are a random sample of
+    # calibrate of the plans run at each level, not the promoted ones (the
+    # best coarse scores are the ones most flattered by chance), and both
+    # scores are single runs on the same seed, the first seed the finest
+    # level races on, so the plans that are promoted share the run
+    def __init__(self, fidelities=(1,), promote=0.5, calibrate=2):
+        self.fidelities = tuple(fidelities)
+        self.promote = promote
+        self.calibrate = calibrate
+        # sum and count of the finest minus coarse scores, by level
+        self.totals = {fidelity: 0 for fidelity in self.fidelities[:-1]}
+        self.counts = {fidelity: 0 for fidelity in self.fidelities[:-1]}
+
+    def bias(self, fidelity):
+        # what to add to a score at this fidelity to estimate the finest
+        if not self.counts.get(fidelity):
+            return 0
+        return self.totals[fidelity] / self.counts[fidelity]
+
+    def evaluate(self, population, seed=None, pool=None, num_iterations=500, cache=None, initial_seeds=2, max_seeds=1):
+        # Returns the (bias corrected) fitness of each plan, the fidelity
+        # that produced it, and the seeds it was raced on at the finest
+        finest = self.fidelities[-1]
+        if len(self.fidelities) > 1:
+            # the coarse levels and the calibration runs share the race's
+            # seeds, so they need one even for an unseeded search
+            seed = new_seed() if seed is None else seed
+            first_seed = spawn_seeds(seed, 1)[0]
+        levels = [None] * len(population)
+        runs = [0] * len(population)
+        raw = {}
+        candidates = list(range(len(population)))
+        for fidelity in self.fidelities:
+            plans = [population[i] for i in candidates]
+            if fidelity == finest:
+                level_scores, level_runs = race_population(plans, seed, pool, num_iterations, cache, initial_seeds, max_seeds, fidelity=fidelity)
+                for i, n in zip(candidates, level_runs):
+                    runs[i] = n
+            else:
+                level_scores = evaluate_population(plans, first_seed, pool, num_iterations, cache, fidelity)
+                # learn the level's bias before correcting its scores
+                sample = random.sample(range(len(plans)), min(self.calibrate, len(plans)))
+                finest_scores = evaluate_population([plans[n] for n in sample], first_seed, pool, num_iterations, cache, finest)
+                for n, score in zip(sample, finest_scores):
+                    self.totals[fidelity] += score - level_scores[n]
+                    self.counts[fidelity] += 1
+            raw[fidelity] = dict(zip(candidates, level_scores))
+            for i in candidates:
+                levels[i] = fidelity
+            # plans are only compared with others run at the same level here
+            candidates = sorted(candidates, key=lambda i: raw[fidelity][i], reverse=True)
+            candidates = candidates[:max(1, int(len(candidates) * self.promote + 0.5))]
+        scores = [raw[fidelity][i] + self.bias(fidelity) for i, fidelity in enumerate(levels)]
+        return scores, levels, runs
+
+def variation_seed(seed):
+    # The int to seed the variation operators (the random module) with,
+    # from a seed in any form seeding takes (eg. a SeedSequence)
+    return int(seed_sequence(seed).generate_state(1)[0])
+
+def generation_seed(seed, gen):
+    # The seed of a generation's fitness runs, None (fresh) without a seed
+    return None if seed is None else child_seed(seed, gen)
+
+def tourny_selection(population, fitness_scores, k=3, n=None):
     k = min(k, len(population))
     selected = []
-    for _ in range(len(population)):
+    for _ in range(len(population) if n is None else n):
         competitors = random.sample(list(zip(population, fitness_scores)), k)
     
         winner = max(competitors, key=lambda x: x[1])[0]
@@ -153,71 +350,323 @@ def load_population(path):
 
     return cleaned
 
-def ea():
-    population = generate_many_plans()
+def save_population(population, fitness_scores, levels, path="/src/output/population_1.json"):
+    # The population (for load_population) and, alongside it, the fitness
+    # of each plan with the fidelity it was scored at (see FidelityLadder),
+    # as a bias corrected coarse score is not a full resolution one
+    with open(path, "w") as f:
+        json.dump(population, f, indent=2)
+    scores = [{"fitness": fitness, "fidelity": level} for fitness, level in zip(fitness_scores, levels)]
+    with open(os.path.splitext(path)[0] + "_scores.json", "w") as f:
+        json.dump(scores, f, indent=2)
+
+def breed(selected, n, cx_prob=0.9, mut_prob=0.2, arrival=None):
+    # n children of pairs of the selected parents, by probabilistic
+    # crossover and mutation
+    children = []
+    while len(children) < n:
+        p1, p2 = random.sample(selected, 2)
+
+        # 2 children to maintain pop size
+        for parent, other in ((p1, p2), (p2, p1)):
+            if random.random() < cx_prob:
+                child = sp_crossover(parent, other, arrival)
+            else:
+                child = parent.copy()
+
+            if random.random() < mut_prob:
+                child = mutate_plan(child, arrival=arrival)
+
+            children.append(child)
+
+    return children[:n]
+
+def best_of(population, fitness_scores, n):
+    # The n fittest individuals
+    return [
+        ind for ind, _ in sorted(
+            zip(population, fitness_scores),
+            key=lambda x: x[1],
+            reverse=True
+        )[:n]
+    ]
+
+def next_generation(population, fitness_scores, pool, arrival=None, screen_factor=1, elite_count=2, cx_prob=0.9, mut_prob=0.2, immigrants=()):
+    # Make sure we carry over the best
+    elites = best_of(population, fitness_scores, elite_count)
+
+    selected = tourny_selection(population, fitness_scores)
+
+    # Immigrants (see island_ea) take the places of some of the children
+    num_children = len(population) - elite_count - len(immigrants)
+    children = breed(selected, screen_factor * num_children, cx_prob, mut_prob, arrival)
+    if screen_factor > 1:
+        # Only simulate the children the surrogate expects to hold the
+        # fire back longest
+        predicted = pool.map(predicted_town_arrival, children)
+        children = [
+            child for child, _ in sorted(
+                zip(children, predicted),
+                key=lambda x: x[1],
+                reverse=True
+            )[:num_children]
+        ]
+
+    return elites + list(immigrants) + children[:num_children]
+
+def ea(seed=None, pool=None, population=None, cache_path="/src/output/fitness_cache.json", screen_factor=1, initial_seeds=2, max_seeds=1, fidelities=(1,), promote=0.5):
+    """Evolve a population of water dropping plans for 50 generations and
+    save the last one (see save_population)
+
+    Fitness is only cached (in cache_path, kept between runs) when seed is
+    given. An unseeded run, the default, draws fresh random streams for
+    its fitness runs that never come up again, so it neither saves nor
+    reuses any fitness: pass a seed (eg. ea(seed=1)) to resume a search
+    without simulating its plans again.
+    """
+    # One pool of workers for the whole run, each building the terrain once
+    if pool is None:
+        with warm_pool() as pool:
+            return ea(seed, pool, population, cache_path, screen_factor, initial_seeds, max_seeds, fidelities, promote)
+    # A seed makes the whole search repeatable: it seeds the variation
+    # operators and each generation's fitness runs, whose results are kept
+    # in the fitness cache. A population (eg. from load_population) carries
+    # on an earlier run
+    if seed is not None:
+        random.seed(variation_seed(seed))
+    # fresh seeds never come up again, so only seeded runs are worth keeping
+    cache = FitnessCache(cache_path) if seed is not None else None
+    # Where the fire is expected to be when, to place strips near its front
+    # and, if asked (screen_factor > 1), to breed that many times the
+    # children needed and only simulate the most promising
+    arrival = predicted_arrival()
+    if population is None:
+        population = generate_many_plans(arrival=arrival)
     num_generations = 50
-    pop_size = len(population)
 
     # Use elitism, probabilistic crossover and mutation
     elite_count = 2
     cx_prob = 0.9
     mut_prob = 0.2   
 
+    # Every plan is run at full resolution; fidelities=(4, 1) would screen
+    # them on coarsened terrain and only promote the best to full
+    # resolution (see FidelityLadder)
+    ladder = FidelityLadder(fidelities, promote)
+
     for gen in range(num_generations):
-        fitness_scores = evaluate_population(population)
+        # Each plan is run once; fitness is noisy, so max_seeds above 1
+        # races them over up to that many seeds (see race_population)
+        fitness_scores, levels, runs = ladder.evaluate(population, generation_seed(seed, gen), pool, cache=cache, initial_seeds=initial_seeds, max_seeds=max_seeds)
 
         # Check progress
         avg_fit = sum(fitness_scores) / len(fitness_scores)
-        print(f"Generation {gen}, Avg Fitness: {avg_fit:.3f}")
+        scored_at = ", ".join(f"{levels.count(f)} at {f}x" for f in fidelities)
+        print(f"Generation {gen}, Avg Fitness: {avg_fit:.3f}, Runs: {sum(runs)}, Scored: {scored_at}")
 
-        # Make sure we carry over the best
-        elites = [
-            ind for ind, _ in sorted(
-                zip(population, fitness_scores),
-                key=lambda x: x[1],
-                reverse=True
-            )[:elite_count]
-        ]
+        population = next_generation(population, fitness_scores, pool, arrival, screen_factor, elite_count, cx_prob, mut_prob)
 
-        selected = tourny_selection(population, fitness_scores)
+    fitness_scores, levels, _ = ladder.evaluate(population, generation_seed(seed, num_generations), pool, cache=cache, initial_seeds=initial_seeds, max_seeds=max_seeds)
+    # the best of the plans scored at full resolution
+    best_idx = max((i for i in range(len(population)) if levels[i] == fidelities[-1]), key=lambda i: fitness_scores[i])
+    best_plan = population[best_idx]
 
-        new_population = elites.copy()
-        while len(new_population) < pop_size:
-            p1, p2 = random.sample(selected, 2)
-            
-            # 2 children to maintain pop size
-            if random.random() < cx_prob:
-                child1 = sp_crossover(p1, p2)
-            else:
-                child1 = p1.copy()
+    print(f"Best plan: {best_plan}")
 
-            if random.random() < mut_prob:
-                child1 = mutate_plan(child1)
+    save_population(population, fitness_scores, levels)
+
+def tourny_insertion(evaluated, individual, fitness, k=3):
+    # Steady state replacement: the new individual takes the place of the
+    # worst of k random members of the population, if it is fitter
+    contestants = random.sample(range(len(evaluated)), min(k, len(evaluated)))
+    worst = min(contestants, key=lambda i: evaluated[i][1])
+    if fitness > evaluated[worst][1]:
+        evaluated[worst] = (individual, fitness)
+
+def steady_state_ea(seed=None, pool=None, population=None, evaluations=1500, num_iterations=500, in_flight=None, path="/src/output/population_1.json"):
+    # Asynchronous steady state version of ea. A generation waits for its
+    # slowest run (runs lighting the town stop early, the rest go on to
+    # num_iterations), so here there are no generations: as soon as a
+    # worker finishes a run it is handed a child bred from the population
+    # as it is then, and each result is folded into the population by
+    # tournament insertion as it comes back (see ScenarioPool.as_completed).
+    # evaluations=1500 is as many runs as 50 generations of 30.
+    # Each plan is run once, on the seed of its place in the run order
+    # (child_seed of seed), but results come back in whatever order the
+    # runs end, so even a seeded search is not exactly repeatable.
+    # Returns the final (plan, fitness) of each member of the population
+    if pool is None:
+        with warm_pool() as pool:
+            return steady_state_ea(seed, pool, population, evaluations, num_iterations, in_flight, path)
+    if seed is not None:
+        random.seed(variation_seed(seed))
+    arrival = predicted_arrival()
+    if population is None:
+        population = generate_many_plans(arrival=arrival)
+    pop_size = len(population)
 
-            if len(new_population) >= pop_size:
-                break
+    cx_prob = 0.9
+    mut_prob = 0.2
 
-            if random.random() < cx_prob:
-                child2 = sp_crossover(p2, p1)
+    # (plan, fitness) of the population, filled by the first results
+    evaluated = []
+
+    def tasks():
+        for n in range(evaluations):
+            if n < pop_size:
+                individual = population[n]
             else:
-                child2 = p2.copy()
+                if len(evaluated) >= 2:
+                    plans, scores = zip(*evaluated)
+                    selected = tourny_selection(plans, scores, n=2)
+                else:
+                    # too few results back yet to select from
+                    selected = population
+                individual = breed(selected, 1, cx_prob, mut_prob, arrival)[0]
+            yield {
+                "water_dropping_plan": individual,
+                "num_iterations": num_iterations,
+                "seed": None if seed is None else child_seed(seed, n),
+            }
+
+    for n, (task, fitness) in enumerate(pool.as_completed(tasks(), in_flight)):
+        individual = task["water_dropping_plan"]
+        if len(evaluated) < pop_size:
+            evaluated.append((individual, fitness))
+        else:
+            tourny_insertion(evaluated, individual, fitness)
 
-            if random.random() < mut_prob:
-                child2 = mutate_plan(child2)
+        # Check progress
+        if (n + 1) % pop_size == 0:
+            avg_fit = sum(fitness for _, fitness in evaluated) / len(evaluated)
+            print(f"Evaluations {n + 1}, Avg Fitness: {avg_fit:.3f}")
 
-            new_population.append(child1)
-            new_population.append(child2)
+    best_plan = max(evaluated, key=lambda x: x[1])[0]
 
-        population = new_population
+    print(f"Best plan: {best_plan}")
 
-    fitness_scores = evaluate_population(population)
-    best_idx = max(range(len(population)), key=lambda i: fitness_scores[i])
-    best_plan = population[best_idx]
+    plans, scores = zip(*evaluated)
+    save_population(list(plans), list(scores), [1] * len(plans), path)
+
+    return evaluated
+
+def _island(index, seed, inbox, outbox, results, num_generations, migration_interval, migrants, screen_factor, initial_seeds, max_seeds, fidelities, promote, num_iterations=500, population_size=30):
+    # One island of island_ea, evolving its own population in its own
+    # process. Its fitness runs are simulated here, one after another (see
+    # SerialScenarios), on the same seeds as the other islands' so their
+    # scores compare; its variation operators have a seed of their own
+    pool = SerialScenarios()
+    # a forked process starts with its parent's random state, so it is
+    # always seeded again
+    random.seed(None if seed is None else int(child_seed(seed, index).generate_state(1)[0]))
+    cache = FitnessCache() if seed is not None else None
+    arrival = predicted_arrival()
+    population = generate_many_plans(population_size, arrival)
+
+    # As ea
+    elite_count = 2
+    cx_prob = 0.9
+    mut_prob = 0.2
+    ladder = FidelityLadder(fidelities, promote)
+    # the island each batch of immigrants came from
+    sources = []
+
+    for gen in range(num_generations):
+        fitness_scores, levels, runs = ladder.evaluate(population, generation_seed(seed, gen), pool, num_iterations, cache, initial_seeds, max_seeds)
+
+        # Check progress
+        avg_fit = sum(fitness_scores) / len(fitness_scores)
+        print(f"Island {index}, Generation {gen}, Avg Fitness: {avg_fit:.3f}, Runs: {sum(runs)}")
+
+        # Every migration_interval generations send copies of the best to
+        # the next island. Migrants that have arrived from the last are
+        # taken in without waiting for any, so no island waits for another.
+        # Migrants are sent with the island they came from
+        if (gen + 1) % migration_interval == 0:
+            outbox.put((index, best_of(population, fitness_scores, migrants)))
+        immigrants = []
+        while True:
+            try:
+                source, plans = inbox.get_nowait()
+            except queue.Empty:
+                break
+            sources.append(source)
+            immigrants += plans
+
+        population = next_generation(population, fitness_scores, pool, arrival, screen_factor, elite_count, cx_prob, mut_prob, immigrants[-migrants:] if migrants else [])
+
+    fitness_scores, levels, _ = ladder.evaluate(population, generation_seed(seed, num_generations), pool, num_iterations, cache, initial_seeds, max_seeds)
+    results.put((index, population, fitness_scores, levels, sources))
+    # migrants sent after the next island has finished are never read, so
+    # exiting does not wait for them to be
+    outbox.cancel_join_thread()
+
+def island_ea(seed=None, islands=None, migration_interval=5, migrants=2, num_generations=50, screen_factor=1, initial_seeds=2, max_seeds=1, fidelities=(1,), promote=0.5, num_iterations=500, population_size=30, path="/src/output/population_1.json"):
+    # Island model version of ea: islands (one per CPU by default) evolve
+    # populations of their own in separate processes, each running its own
+    # simulations, and every migration_interval generations each sends
+    # copies of its best few (migrants) plans round a ring to the next island,
+    # where they take the place of some of the children. Nothing waits on
+    # a central process between generations, and the islands searching
+    # apart keeps the plans more varied than one population. Returns each
+    # island's (index, population, fitness_scores, levels, sources), sources
+    # being the islands its immigrants came from
+    islands = islands or cpu_count()
+    inboxes = [Queue() for _ in range(islands)]
+    results = Queue()
+    processes = [
+        Process(
+            target=_island,
+            args=(index, seed, inboxes[index], inboxes[(index + 1) % islands], results, num_generations, migration_interval, migrants, screen_factor, initial_seeds, max_seeds, fidelities, promote, num_iterations, population_size)
+        )
+        for index in range(islands)
+    ]
+    for process in processes:
+        process.start()
+    # read the results before joining, a process with queued results does
+    # not exit until they are read. An island that fails never sends its
+    # results, so rather than waiting on them forever the others are
+    # stopped and its failure raised
+    finished = []
+    while len(finished) < islands:
+        try:
+            finished.append(results.get(timeout=1))
+        except queue.Empty:
+            pass
+        failed = [
+            index for index, process in enumerate(processes)
+            if process.exitcode not in (None, 0)
+        ]
+        if failed:
+            for process in processes:
+                process.terminate()
+                process.join()
+            raise RuntimeError(f"Island {failed[0]} exited with code {processes[failed[0]].exitcode}")
+    finished.sort()
+    for process in processes:
+        process.join()
+
+    # the best of the plans scored at full resolution, on any island
+    best_plan = max(
+        (
+            (individual, fitness)
+            for _, population, fitness_scores, levels, _ in finished
+            for individual, fitness, level in zip(population, fitness_scores, levels)
+            if level == fidelities[-1]
+        ),
+        key=lambda x: x[1]
+    )[0]
 
     print(f"Best plan: {best_plan}")
 
-    with open("/src/output/population_1.json", "w") as f:
-        json.dump(population, f, indent=2)
+    save_population(
+        [individual for _, population, _, _, _ in finished for individual in population],
+        [fitness for _, _, fitness_scores, _, _ in finished for fitness in fitness_scores],
+        [level for _, _, _, levels, _ in finished for level in levels],
+        path
+    )
+
+    return finished
 
 if __name__ == "__main__":
     ea()